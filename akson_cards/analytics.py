@@ -0,0 +1,265 @@
+"""
+Review analytics for Akson Cards
+
+Review-log statistics (calendar heatmap, daily totals, true retention by
+interval) are read from the daily rollups the store maintains as reviews
+are saved, so they never scan reviews.json. Card-based statistics (due
+forecast, retention curve) are computed with NumPy on demand and cached.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .store import AksonCardsStore
+
+
+# Labels for the store's interval buckets (AksonCardsStore.INTERVAL_BUCKET_BOUNDS)
+INTERVAL_LABELS = ["0-1d", "2d", "3-6d", "1-2w", "2-4w", "1-3mo", "3mo+"]
+
+
+class ReviewAnalytics:
+    """Statistics over a store's review history"""
+
+    # Card-based statistics (forecast, retention curve) count days from now,
+    # so they are recomputed this often even while the cards are unchanged
+    CARD_STATS_MAX_AGE = 300
+    # Cached results kept (least recently used first out); keys include the
+    # date, day count and deck selection, so old combinations age out
+    MAX_CACHE_ENTRIES = 128
+
+    def __init__(self, store: AksonCardsStore):
+        self.store = store
+        # key -> (file signature, result, computed at)
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Caching
+    def _signature(self, paths) -> tuple:
+        """Cheap fingerprint of the files a statistic depends on"""
+        return tuple(self.store._file_signature(path) for path in paths)
+
+    def _cached(self, key: tuple, paths, compute: Callable, max_age: Optional[float] = None):
+        """
+        Return a cached result while the files it was computed from are
+        unchanged (and, with max_age, while it is younger than max_age seconds)
+        """
+        signature = self._signature(paths)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit and hit[0] == signature and (max_age is None or now - hit[2] < max_age):
+                self._cache.move_to_end(key)
+                return hit[1]
+        result = compute()
+        with self._lock:
+            self._cache[key] = (signature, result, now)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.MAX_CACHE_ENTRIES:
+                self._cache.popitem(last=False)
+        return result
+
+    # Rollup-based statistics
+    def daily(
+        self,
+        days: int = 30,
+        deck_ids: Optional[Iterable[str]] = None,
+        today: Optional[date] = None,
+        rollups: Optional[dict] = None
+    ) -> List[dict]:
+        """
+        Per-day totals for the last N days (oldest first)
+
+        Returns:
+            List of dicts with count, per-rating counts, time spent,
+            new/learning/review counts and true retention for each day
+        """
+        today = today or date.today()
+        wanted = set(deck_ids) if deck_ids is not None else None
+        if rollups is None:
+            rollups = self.store.get_review_rollups()
+
+        result = []
+        for offset in range(days - 1, -1, -1):
+            day = (today - timedelta(days=offset)).isoformat()
+            totals: Dict[str, int] = {}
+            for deck_id, bucket in rollups.get(day, {}).items():
+                if wanted is not None and deck_id not in wanted:
+                    continue
+                for key, value in bucket.items():
+                    totals[key] = totals.get(key, 0) + value
+
+            mature = totals.get("review", 0)
+            result.append({
+                "date": day,
+                "count": totals.get("count", 0),
+                "again": totals.get("1", 0),
+                "hard": totals.get("2", 0),
+                "good": totals.get("3", 0),
+                "easy": totals.get("4", 0),
+                "time_ms": totals.get("time_ms", 0),
+                "new": totals.get("new", 0),
+                "learning": totals.get("learning", 0),
+                "review": mature,
+                "true_retention": (
+                    1 - totals.get("review_again", 0) / mature if mature else None
+                )
+            })
+        return result
+
+    def heatmap(
+        self,
+        days: int = 365,
+        deck_ids: Optional[Iterable[str]] = None,
+        today: Optional[date] = None,
+        rollups: Optional[dict] = None
+    ) -> Dict[str, int]:
+        """Reviews per calendar day for the last N days (days without reviews omitted)"""
+        return {
+            entry["date"]: entry["count"]
+            for entry in self.daily(days, deck_ids, today, rollups)
+            if entry["count"]
+        }
+
+    def by_deck(
+        self,
+        days: int = 30,
+        today: Optional[date] = None,
+        rollups: Optional[dict] = None
+    ) -> Dict[str, dict]:
+        """Review count and time spent per deck over the last N days"""
+        today = today or date.today()
+        start = (today - timedelta(days=days - 1)).isoformat()
+        end = today.isoformat()
+        if rollups is None:
+            rollups = self.store.get_review_rollups()
+
+        result: Dict[str, dict] = {}
+        for day, decks in rollups.items():
+            if not start <= day <= end:
+                continue
+            for deck_id, bucket in decks.items():
+                totals = result.setdefault(deck_id, {"count": 0, "time_ms": 0})
+                totals["count"] += bucket.get("count", 0)
+                totals["time_ms"] += bucket.get("time_ms", 0)
+        return result
+
+    def retention_by_interval(
+        self,
+        deck_ids: Optional[Iterable[str]] = None,
+        rollups: Optional[dict] = None
+    ) -> List[dict]:
+        """True retention of mature (review-state) cards grouped by days since last review"""
+        wanted = set(deck_ids) if deck_ids is not None else None
+        if rollups is None:
+            rollups = self.store.get_review_rollups()
+        totals: Dict[str, int] = {}
+        for decks in rollups.values():
+            for deck_id, bucket in decks.items():
+                if wanted is not None and deck_id not in wanted:
+                    continue
+                for key, value in bucket.items():
+                    if key.startswith("ivl_"):
+                        totals[key] = totals.get(key, 0) + value
+
+        result = []
+        for index, label in enumerate(INTERVAL_LABELS):
+            reviews = totals.get(f"ivl_{index}", 0)
+            lapses = totals.get(f"ivl_{index}_again", 0)
+            result.append({
+                "interval": label,
+                "reviews": reviews,
+                "retention": 1 - lapses / reviews if reviews else None
+            })
+        return result
+
+    # NumPy-based statistics
+    def _card_arrays(self, deck_ids: Optional[tuple]) -> Dict[str, np.ndarray]:
+        """Columns of due offset, days since review and stability for scheduled cards"""
+        if deck_ids is None:
+            cards = list(self.store.get_cards().values())
+        else:
+            cards = [
+                card
+                for deck_cards in self.store.get_cards_by_deck(deck_ids).values()
+                for card in deck_cards
+            ]
+
+        now = datetime.now()
+        due_days = []
+        since_review = []
+        stability = []
+        for card in cards:
+            if card.state == "new" or not card.due:
+                continue
+            due_days.append((card.due - now).total_seconds() / 86400)
+            since_review.append(
+                (now - card.last_review).total_seconds() / 86400 if card.last_review else 0.0
+            )
+            stability.append(card.stability)
+
+        return {
+            "due_days": np.asarray(due_days, dtype=float),
+            "since_review": np.asarray(since_review, dtype=float),
+            "stability": np.asarray(stability, dtype=float),
+        }
+
+    def forecast(self, days: int = 30, deck_ids: Optional[Iterable[str]] = None) -> List[int]:
+        """Cards due on each of the next N days (index 0 includes overdue cards)"""
+        key_decks = tuple(sorted(deck_ids)) if deck_ids is not None else None
+
+        def compute() -> List[int]:
+            due_days = self._card_arrays(key_decks)["due_days"]
+            offsets = np.clip(np.floor(due_days), 0, None).astype(np.int64)
+            offsets = offsets[offsets < days]
+            return np.bincount(offsets, minlength=days).tolist()
+
+        return self._cached(
+            ("forecast", days, key_decks, date.today().isoformat()),
+            [self.store.cards_file, self.store.notes_file],
+            compute,
+            max_age=self.CARD_STATS_MAX_AGE
+        )
+
+    def retention_curve(self, days: int = 30, deck_ids: Optional[Iterable[str]] = None) -> List[float]:
+        """
+        Predicted average recall probability of scheduled cards over the next N days,
+        using the FSRS forgetting curve R(t) = (1 + t / (9 * S)) ** -1
+        """
+        key_decks = tuple(sorted(deck_ids)) if deck_ids is not None else None
+
+        def compute() -> List[float]:
+            arrays = self._card_arrays(key_decks)
+            stability = arrays["stability"]
+            mask = stability > 0
+            if not mask.any():
+                return [None] * days
+            # Rows: days ahead, columns: cards
+            t = arrays["since_review"][mask][None, :] + np.arange(days, dtype=float)[:, None]
+            recall = 1.0 / (1.0 + t / (9.0 * stability[mask][None, :]))
+            return recall.mean(axis=1).round(4).tolist()
+
+        return self._cached(
+            ("retention_curve", days, key_decks, date.today().isoformat()),
+            [self.store.cards_file, self.store.notes_file],
+            compute,
+            max_age=self.CARD_STATS_MAX_AGE
+        )
+
+    def summary(self, days: int = 30, deck_ids: Optional[Iterable[str]] = None) -> dict:
+        """Everything a stats dashboard needs in one call"""
+        deck_ids = list(deck_ids) if deck_ids is not None else None
+        # One load of the rollups shared by every rollup-based statistic
+        rollups = self.store.get_review_rollups()
+        return {
+            "daily": self.daily(days, deck_ids, rollups=rollups),
+            "heatmap": self.heatmap(365, deck_ids, rollups=rollups),
+            "by_deck": self.by_deck(days, rollups=rollups),
+            "retention_by_interval": self.retention_by_interval(deck_ids, rollups=rollups),
+            "forecast": self.forecast(days, deck_ids),
+            "retention_curve": self.retention_curve(days, deck_ids),
+        }
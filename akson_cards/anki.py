@@ -0,0 +1,845 @@
+"""
+Anki package (.apkg) import and export for Akson Cards
+
+An .apkg is a zip holding a SQLite collection (collection.anki21 or
+collection.anki2), a "media" JSON map from numbered zip members to file
+names, and the media files themselves. The importer streams every part:
+rows are read with fetchmany() and written to the store in chunks, and media
+files are copied from the zip to the store's media directory one at a time.
+
+Anki scheduling is carried over as FSRS state: a review card's interval is
+the time at which its recall probability falls to 90%, which is exactly
+FSRS stability at request_retention=0.9, and the SM-2 ease factor maps onto
+FSRS difficulty (ease 130% -> 10, 250% -> ~5, 350%+ -> 1).
+
+Export goes the other way: a schema-11 collection is written row by row in
+executemany() chunks, FSRS memory state is kept in each card's data column
+({"s": stability, "d": difficulty}, as Anki 23.10+ stores it), and media
+referenced from note fields is added to the zip one file at a time.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .fsrs import FSRSConfig
+from .maintenance import CardMaintenance
+from .models import Card, Deck, Note, NoteModel, Review
+from .store import AksonCardsStore
+
+
+# Anki separates note fields with the ASCII unit separator
+FIELD_SEPARATOR = "\x1f"
+
+# Anki card type -> Akson card state
+CARD_STATES = {0: "new", 1: "learning", 2: "review", 3: "relearning"}
+# Anki revlog type -> Akson card state before the review (4 = manual reschedule)
+REVLOG_STATES = {0: "learning", 1: "review", 2: "relearning", 3: "review"}
+
+# Anki queue values of cards taken out of study (scheduler-buried, user-buried, suspended)
+QUEUE_SCHED_BURIED = -3
+QUEUE_USER_BURIED = -2
+QUEUE_SUSPENDED = -1
+
+# Learning due values above this are epoch seconds, not days since collection
+# creation (the test Anki itself uses); burying or suspending keeps the format
+EPOCH_DUE_MIN = 1_000_000_000
+
+# Cards in a filtered deck keep their home deck in odid (0 otherwise)
+HOME_DECK_SQL = "CASE WHEN odid != 0 THEN odid ELSE did END"
+
+# URL prefix the web app serves the store's media directory under
+MEDIA_URL_PREFIX = "/media/"
+
+# Media references in note fields: <img src="..."> and [sound:...]
+MEDIA_REF_RE = re.compile(r"""(<img[^>]*?\bsrc=["']?)([^"'>\s]+)|(\[sound:)([^\]]+)(\])""", re.IGNORECASE)
+
+# Progress callback: (stage, done, total)
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def ease_to_difficulty(factor: int) -> float:
+    """Map an SM-2 ease factor in permille (2500 = 250%) to FSRS difficulty (1-10)"""
+    ease = factor / 1000
+    return round(min(10.0, max(1.0, 10 - (ease - 1.3) * 9 / 2.2)), 4)
+
+
+def interval_to_stability(interval_days: int) -> float:
+    """FSRS stability for an interval scheduled at 90% retention (S == interval)"""
+    return float(max(interval_days, 0))
+
+
+class ApkgImporter:
+    """Streams an .apkg file into an AksonCardsStore"""
+
+    # Rows read from SQLite and written to the store per chunk
+    CHUNK_SIZE = 5000
+    # Collection files in order of preference (collection.anki21b is zstd-compressed)
+    COLLECTION_NAMES = ("collection.anki21", "collection.anki2")
+
+    def __init__(
+        self,
+        store: AksonCardsStore,
+        chunk_size: Optional[int] = None,
+        progress: Optional[ProgressCallback] = None
+    ):
+        self.store = store
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.progress = progress
+        # Anki ID -> Akson ID maps built while importing
+        self._deck_ids: Dict[int, str] = {}
+        self._note_models: Dict[int, Tuple[NoteModel, bool]] = {}
+        self._note_mids: Dict[int, int] = {}
+        self._card_decks: Dict[int, str] = {}
+        # Akson IDs of cards Anki had buried, and the number of suspended cards skipped
+        self._buried: List[str] = []
+        self._suspended = 0
+
+    @staticmethod
+    def deck_id(anki_id: int) -> str:
+        return f"anki-deck-{anki_id}"
+
+    @staticmethod
+    def model_id(anki_id: int) -> str:
+        return f"anki-model-{anki_id}"
+
+    @staticmethod
+    def note_id(anki_id: int) -> str:
+        return f"anki-note-{anki_id}"
+
+    @staticmethod
+    def card_id(anki_id: int) -> str:
+        return f"anki-card-{anki_id}"
+
+    def _report(self, stage: str, done: int, total: int) -> None:
+        if self.progress:
+            self.progress(stage, done, total)
+
+    def import_file(self, path, parent_deck_id: Optional[str] = None) -> dict:
+        """
+        Import an .apkg file
+
+        Args:
+            path: Path to the .apkg file
+            parent_deck_id: Existing deck to nest the imported top-level decks under
+
+        Suspended cards are skipped (Akson has no suspended state); cards Anki
+        had buried are buried for the rest of today.
+
+        Returns:
+            Counts of imported decks, notes, cards, reviews and media files,
+            and of suspended cards skipped
+
+        Raises:
+            ValueError: If the file is not a readable Anki package
+        """
+        try:
+            package = zipfile.ZipFile(path)
+        except zipfile.BadZipFile:
+            raise ValueError("Not an Anki package: the file is not a zip archive")
+
+        with package:
+            names = set(package.namelist())
+            collection_name = next((name for name in self.COLLECTION_NAMES if name in names), None)
+            if collection_name is None:
+                if "collection.anki21b" in names:
+                    raise ValueError(
+                        "This package uses Anki's newest compressed format; export it again "
+                        "with 'Support older Anki versions' enabled"
+                    )
+                raise ValueError("Not an Anki package: no collection file found")
+
+            # sqlite3 needs a real file, so stream the collection out of the zip
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                db_path = Path(tmp_dir) / "collection.anki2"
+                with package.open(collection_name) as src, open(db_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+
+                conn = sqlite3.connect(str(db_path))
+                try:
+                    result = self._import_collection(conn, parent_deck_id)
+                except sqlite3.DatabaseError as e:
+                    raise ValueError(f"Unreadable Anki collection: {e}")
+                finally:
+                    conn.close()
+
+            result["media"] = self._import_media(package, names)
+        return result
+
+    def _import_collection(self, conn: sqlite3.Connection, parent_deck_id: Optional[str]) -> dict:
+        crt, models_json, decks_json = conn.execute(
+            "SELECT crt, models, decks FROM col"
+        ).fetchone()
+        collection_created = datetime.fromtimestamp(crt)
+
+        self._import_models(json.loads(models_json or "{}"))
+        decks = self._import_decks(conn, json.loads(decks_json or "{}"), parent_deck_id)
+        notes = self._import_notes(conn)
+        cards = self._import_cards(conn, collection_created)
+        reviews = self._import_reviews(conn)
+        if self._buried:
+            CardMaintenance(self.store).bury(self._buried)
+        return {
+            "decks": decks, "notes": notes, "cards": cards, "reviews": reviews,
+            "suspended_skipped": self._suspended
+        }
+
+    def _import_models(self, anki_models: dict) -> None:
+        models = []
+        for mid, anki_model in anki_models.items():
+            fields = [field["name"] for field in sorted(anki_model.get("flds", []), key=lambda f: f["ord"])]
+            model = NoteModel(
+                id=self.model_id(int(mid)),
+                name=anki_model.get("name", "Anki"),
+                fields=fields,
+                templates=[
+                    {
+                        "id": f"{self.model_id(int(mid))}-{template['ord']}",
+                        "name": template.get("name", ""),
+                        "front": template.get("qfmt", ""),
+                        "back": template.get("afmt", "")
+                    }
+                    for template in sorted(anki_model.get("tmpls", []), key=lambda t: t["ord"])
+                ],
+                css=anki_model.get("css", "")
+            )
+            # Model type 1 is cloze: every card uses template 0, ord is the cloze number - 1
+            self._note_models[int(mid)] = (model, anki_model.get("type") == 1)
+            models.append(model)
+        if models:
+            self.store.save_models(models)
+
+    def _import_decks(self, conn: sqlite3.Connection, anki_decks: dict, parent_deck_id: Optional[str]) -> int:
+        # Only decks that hold cards (plus their ancestors) are created
+        used = {row[0] for row in conn.execute(f"SELECT DISTINCT {HOME_DECK_SQL} FROM cards")}
+        by_name = {deck["name"]: int(did) for did, deck in anki_decks.items()}
+
+        wanted: Dict[str, int] = {}
+        for did in used:
+            deck = anki_decks.get(str(did))
+            if not deck:
+                continue
+            parts = deck["name"].split("::")
+            for depth in range(1, len(parts) + 1):
+                name = "::".join(parts[:depth])
+                if name in by_name:
+                    wanted[name] = by_name[name]
+
+        decks = []
+        for name, did in sorted(wanted.items()):
+            parent_name = name.rsplit("::", 1)[0] if "::" in name else None
+            self._deck_ids[did] = self.deck_id(did)
+            decks.append(Deck(
+                id=self.deck_id(did),
+                name=name.rsplit("::", 1)[-1],
+                description=anki_decks[str(did)].get("desc", ""),
+                parent_deck_id=(
+                    self.deck_id(wanted[parent_name]) if parent_name in wanted else parent_deck_id
+                )
+            ))
+        if decks:
+            self.store.save_decks(decks)
+        self._report("decks", len(decks), len(decks))
+        return len(decks)
+
+    def _stream(self, conn: sqlite3.Connection, stage: str, count_sql: str, sql: str):
+        """Yield chunks of rows from a query, reporting progress as they are consumed"""
+        total = conn.execute(count_sql).fetchone()[0]
+        done = 0
+        cursor = conn.execute(sql)
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            yield rows
+            done += len(rows)
+            self._report(stage, done, total)
+
+    def _import_notes(self, conn: sqlite3.Connection) -> int:
+        # A note lives in the deck of its first card
+        note_decks = {
+            nid: did for nid, did in conn.execute(f"SELECT nid, MIN({HOME_DECK_SQL}) FROM cards GROUP BY nid")
+        }
+        imported = 0
+        for rows in self._stream(
+            conn, "notes", "SELECT COUNT(*) FROM notes",
+            "SELECT id, mid, mod, tags, flds FROM notes ORDER BY id"
+        ):
+            notes = []
+            for nid, mid, mod, tags, flds in rows:
+                model_entry = self._note_models.get(mid)
+                did = note_decks.get(nid)
+                if model_entry is None or did not in self._deck_ids:
+                    continue
+                model = model_entry[0]
+                values = [self._media_urls(value) for value in flds.split(FIELD_SEPARATOR)]
+                self._note_mids[nid] = mid
+                notes.append(Note(
+                    id=self.note_id(nid),
+                    deck_id=self._deck_ids[did],
+                    model_id=model.id,
+                    fields={name: values[i] if i < len(values) else "" for i, name in enumerate(model.fields)},
+                    tags=tags.split(),
+                    # Note IDs are creation times in milliseconds
+                    created_at=datetime.fromtimestamp(nid / 1000),
+                    updated_at=datetime.fromtimestamp(mod)
+                ))
+            if notes:
+                self.store.save_notes(notes)
+                imported += len(notes)
+        return imported
+
+    def _import_cards(self, conn: sqlite3.Connection, collection_created: datetime) -> int:
+        last_reviews = {
+            cid: revlog_id for cid, revlog_id in conn.execute("SELECT cid, MAX(id) FROM revlog GROUP BY cid")
+        }
+        # Learning cards have no interval yet; treat them as about to graduate
+        initial_stability = float(FSRSConfig().graduating_interval)
+
+        imported = 0
+        for rows in self._stream(
+            conn, "cards", "SELECT COUNT(*) FROM cards",
+            # Filtered-deck cards carry a temporary due; their own is in odue
+            f"SELECT id, nid, {HOME_DECK_SQL}, ord, mod, type, queue, "
+            "CASE WHEN odid != 0 AND odue != 0 THEN odue ELSE due END, "
+            "ivl, factor, reps, lapses, data FROM cards ORDER BY id"
+        ):
+            cards = []
+            for cid, nid, did, ord_, mod, card_type, queue, due, ivl, factor, reps, lapses, data in rows:
+                mid = self._note_mids.get(nid)
+                if mid is None:
+                    continue
+                if queue == QUEUE_SUSPENDED:
+                    self._suspended += 1
+                    continue
+                model, is_cloze = self._note_models[mid]
+                state = CARD_STATES.get(card_type, "new")
+
+                card = Card(
+                    id=self.card_id(cid),
+                    note_id=self.note_id(nid),
+                    template_id=f"{model.id}-{0 if is_cloze else ord_}",
+                    ordinal=ord_ + 1 if is_cloze else 1,
+                    reps=reps,
+                    lapses=lapses,
+                    state=state,
+                    created_at=datetime.fromtimestamp(cid / 1000),
+                    updated_at=datetime.fromtimestamp(mod)
+                )
+                if state != "new":
+                    card.due = self._card_due(state, due, collection_created)
+                    card.stability = interval_to_stability(ivl) if ivl > 0 else initial_stability
+                    card.difficulty = ease_to_difficulty(factor) if factor else card.difficulty
+                    card.elapsed_days = max(ivl, 0)
+                    # Collections scheduled with FSRS carry the memory state itself
+                    memory = self._memory_state(data)
+                    if memory:
+                        card.stability = float(memory.get("s", card.stability))
+                        card.difficulty = float(memory.get("d", card.difficulty))
+                    if cid in last_reviews:
+                        card.last_review = datetime.fromtimestamp(last_reviews[cid] / 1000)
+                cards.append(card)
+                if queue in (QUEUE_SCHED_BURIED, QUEUE_USER_BURIED):
+                    self._buried.append(card.id)
+                self._card_decks[cid] = self._deck_ids.get(did)
+            if cards:
+                self.store.save_cards(cards)
+                imported += len(cards)
+        return imported
+
+    @staticmethod
+    def _media_urls(value: str) -> str:
+        """Point bare <img src="name"> references (relative to Anki's media folder) at MEDIA_URL_PREFIX"""
+        def replace(match) -> str:
+            if match.group(2) is None:
+                # [sound:...] tags name the file, not a URL
+                return match.group(0)
+            reference = match.group(2)
+            if "/" in reference or ":" in reference:
+                return match.group(0)
+            return f"{match.group(1)}{MEDIA_URL_PREFIX}{reference}"
+        return MEDIA_REF_RE.sub(replace, value)
+
+    @staticmethod
+    def _memory_state(data: Optional[str]) -> Optional[dict]:
+        """FSRS stability/difficulty from a card's data column, if present"""
+        if not data or not data.startswith("{"):
+            return None
+        try:
+            memory = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        return memory if isinstance(memory, dict) and "s" in memory else None
+
+    @staticmethod
+    def _card_due(state: str, due: int, collection_created: datetime) -> datetime:
+        """
+        Convert Anki's due value: epoch seconds for intraday (re)learning
+        cards, otherwise days since the collection was created
+
+        The format is told from the card type and the value, not the queue:
+        a buried or suspended learning card keeps its epoch due. A value
+        outside the representable range makes the card due now.
+        """
+        try:
+            if state in ("learning", "relearning") and due >= EPOCH_DUE_MIN:
+                return datetime.fromtimestamp(due)
+            return datetime.combine(collection_created.date(), datetime.min.time()) + timedelta(days=due)
+        except (OverflowError, OSError, ValueError):
+            return datetime.now()
+
+    def _import_reviews(self, conn: sqlite3.Connection) -> int:
+        seen_cards = set()
+        imported = 0
+        for rows in self._stream(
+            conn, "reviews", "SELECT COUNT(*) FROM revlog",
+            "SELECT id, cid, ease, lastIvl, time, type FROM revlog ORDER BY id"
+        ):
+            reviews = []
+            for revlog_id, cid, ease, last_ivl, time_ms, review_type in rows:
+                # Manual reschedules and unknown cards carry no answer
+                if review_type not in REVLOG_STATES or not 1 <= ease <= 4 or cid not in self._card_decks:
+                    continue
+                first = cid not in seen_cards
+                seen_cards.add(cid)
+                reviews.append(Review(
+                    id=f"anki-rev-{revlog_id}",
+                    card_id=self.card_id(cid),
+                    timestamp=datetime.fromtimestamp(revlog_id / 1000),
+                    rating=ease,
+                    response_time_ms=time_ms,
+                    scheduler_version="anki",
+                    deck_id=self._card_decks[cid],
+                    card_state="new" if first and review_type == 0 else REVLOG_STATES[review_type],
+                    elapsed_days=max(last_ivl, 0)
+                ))
+            if reviews:
+                self.store.save_reviews(reviews)
+                imported += len(reviews)
+        return imported
+
+    def _import_media(self, package: zipfile.ZipFile, names: set) -> int:
+        if "media" not in names:
+            return 0
+        try:
+            media_map = json.loads(package.read("media").decode("utf-8") or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            # Newer packages store a compressed protobuf map instead
+            return 0
+
+        self.store.media_dir.mkdir(parents=True, exist_ok=True)
+        total = len(media_map)
+        copied = 0
+        for done, (member, filename) in enumerate(media_map.items(), 1):
+            filename = os.path.basename(filename)
+            if member in names and filename not in ("", ".", ".."):
+                with package.open(member) as src, open(self.store.media_dir / filename, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                copied += 1
+            if done % 100 == 0 or done == total:
+                self._report("media", done, total)
+        return copied
+
+
+def import_apkg(
+    store: AksonCardsStore,
+    path,
+    parent_deck_id: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None
+) -> dict:
+    """Import an .apkg file into a store (see ApkgImporter)"""
+    return ApkgImporter(store, progress=progress).import_file(path, parent_deck_id)
+
+
+# Anki collection schema 11 (the format every Anki version can import)
+ANKI_SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null,
+    conf text not null, models text not null, decks text not null, dconf text not null, tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null,
+    csum integer not null, flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null,
+    due integer not null, ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null, odid integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+    type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn ON notes (usn);
+CREATE INDEX ix_cards_usn ON cards (usn);
+CREATE INDEX ix_revlog_usn ON revlog (usn);
+CREATE INDEX ix_cards_nid ON cards (nid);
+CREATE INDEX ix_cards_sched ON cards (did, queue, due);
+CREATE INDEX ix_revlog_cid ON revlog (cid);
+CREATE INDEX ix_notes_csum ON notes (csum);
+"""
+
+# Akson card state -> (Anki card type, queue)
+ANKI_CARD_TYPES = {"new": (0, 0), "learning": (1, 1), "review": (2, 2), "relearning": (3, 1)}
+# Akson card state before a review -> Anki revlog type
+ANKI_REVLOG_TYPES = {"new": 0, "learning": 0, "review": 1, "relearning": 2}
+
+
+def difficulty_to_ease(difficulty: float) -> int:
+    """Inverse of ease_to_difficulty, as an Anki factor in permille"""
+    return int(round((1.3 + (10 - difficulty) * 2.2 / 9) * 1000))
+
+
+class ApkgExporter:
+    """Streams decks from an AksonCardsStore into an .apkg file"""
+
+    # Rows inserted into the SQLite collection per executemany()
+    CHUNK_SIZE = 5000
+
+    def __init__(
+        self,
+        store: AksonCardsStore,
+        media_roots: Optional[Dict[str, Path]] = None,
+        progress: Optional[ProgressCallback] = None
+    ):
+        """
+        Args:
+            store: Store to export from
+            media_roots: Extra URL prefix -> directory mappings for media
+                referenced by path (e.g. {"/mindmap_images/": library_dir});
+                bare file names are looked up in the store's media directory
+            progress: Optional (stage, done, total) callback
+        """
+        self.store = store
+        self.media_roots = {prefix: Path(root) for prefix, root in (media_roots or {}).items()}
+        self.progress = progress
+        self._used_ids: set = set()
+        # Field reference -> (file on disk, name inside the package)
+        self._media: Dict[str, Tuple[Path, str]] = {}
+        self._media_names: set = set()
+
+    def _report(self, stage: str, done: int, total: int) -> None:
+        if self.progress:
+            self.progress(stage, done, total)
+
+    def _anki_id(self, akson_id: str, prefix: str, when: datetime) -> int:
+        """Integer Anki ID: the original for imported items, else a unique millisecond timestamp"""
+        if akson_id.startswith(prefix) and akson_id[len(prefix):].isdigit():
+            anki_id = int(akson_id[len(prefix):])
+        else:
+            anki_id = int(when.timestamp() * 1000)
+        while anki_id in self._used_ids:
+            anki_id += 1
+        self._used_ids.add(anki_id)
+        return anki_id
+
+    def export_deck(self, deck_id: str, path, include_subdecks: bool = True) -> dict:
+        """
+        Write a deck (and by default its subdecks) to an .apkg file
+
+        Returns:
+            Counts of exported decks, notes, cards, reviews and media files
+
+        Raises:
+            ValueError: If the deck does not exist
+        """
+        decks = self.store.get_decks()
+        if deck_id not in decks:
+            raise ValueError("Deck not found")
+        deck_ids = self.store.get_deck_subtree(deck_id, decks) if include_subdecks else [deck_id]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = Path(tmp_dir) / "collection.anki2"
+            conn = sqlite3.connect(str(db_path))
+            try:
+                conn.executescript(ANKI_SCHEMA)
+                counts = self._write_collection(conn, decks, deck_id, deck_ids)
+                conn.commit()
+            finally:
+                conn.close()
+
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as package:
+                package.write(db_path, "collection.anki2")
+                counts["media"] = self._write_media(package)
+        return counts
+
+    def _write_collection(self, conn: sqlite3.Connection, decks: Dict[str, Deck], root_id: str, deck_ids: List[str]) -> dict:
+        cards_by_deck = self.store.get_cards_by_deck(deck_ids)
+        cards = [card for deck_cards in cards_by_deck.values() for card in deck_cards]
+        notes = self.store.get_notes_by_ids({card.note_id for card in cards})
+        models = self.store.get_models()
+
+        created = min((note.created_at for note in notes.values()), default=datetime.now())
+        collection_created = datetime.combine(created.date(), datetime.min.time())
+        now = datetime.now()
+
+        # Decks: names are paths from the exported root ("Root::Child")
+        anki_decks = {}
+        anki_deck_ids: Dict[str, int] = {}
+        for akson_deck_id in deck_ids:
+            deck = decks[akson_deck_id]
+            names = [deck.name]
+            parent = deck.parent_deck_id
+            while akson_deck_id != root_id and parent in decks:
+                names.insert(0, decks[parent].name)
+                if parent == root_id:
+                    break
+                parent = decks[parent].parent_deck_id
+            did = self._anki_id(akson_deck_id, "anki-deck-", deck.created_at)
+            anki_deck_ids[akson_deck_id] = did
+            anki_decks[str(did)] = self._deck_json(did, "::".join(names), deck.description, now)
+        anki_decks["1"] = self._deck_json(1, "Default", "", now)
+
+        # Models actually used by the exported notes
+        anki_models = {}
+        anki_model_ids: Dict[str, int] = {}
+        for model_id in {note.model_id for note in notes.values()}:
+            model = models.get(model_id)
+            if model is None:
+                continue
+            mid = self._anki_id(model.id, "anki-model-", collection_created)
+            anki_model_ids[model_id] = mid
+            anki_models[str(mid)] = self._model_json(mid, model, now)
+
+        conn.execute(
+            "INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, '{}')",
+            (
+                int(collection_created.timestamp()), int(now.timestamp() * 1000), int(now.timestamp() * 1000),
+                json.dumps({"nextPos": len(cards) + 1}), json.dumps(anki_models), json.dumps(anki_decks),
+                json.dumps({"1": {"id": 1, "name": "Default", "new": {"perDay": 20}, "rev": {"perDay": 200}}})
+            )
+        )
+
+        note_ids = self._write_notes(conn, notes, models, anki_model_ids)
+        card_ids = self._write_cards(conn, cards, notes, models, note_ids, anki_deck_ids, collection_created, now)
+        reviews = self._write_reviews(conn, card_ids)
+        return {"decks": len(deck_ids), "notes": len(note_ids), "cards": len(card_ids), "reviews": reviews}
+
+    @staticmethod
+    def _deck_json(did: int, name: str, description: str, now: datetime) -> dict:
+        return {
+            "id": did, "name": name, "desc": description, "mod": int(now.timestamp()), "usn": -1,
+            "dyn": 0, "conf": 1, "collapsed": False, "browserCollapsed": False,
+            "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0], "timeToday": [0, 0],
+            "extendNew": 0, "extendRev": 0
+        }
+
+    @staticmethod
+    def _is_cloze(model: NoteModel) -> bool:
+        return any("cloze:" in template.get("front", "") for template in model.templates)
+
+    def _model_json(self, mid: int, model: NoteModel, now: datetime) -> dict:
+        return {
+            "id": mid, "name": model.name, "type": 1 if self._is_cloze(model) else 0,
+            "mod": int(now.timestamp()), "usn": -1, "sortf": 0, "did": 1, "tags": [], "vers": [],
+            "css": model.css, "latexPre": "", "latexPost": "", "req": [],
+            "flds": [
+                {"name": name, "ord": index, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+                for index, name in enumerate(model.fields)
+            ],
+            "tmpls": [
+                {
+                    "name": template.get("name", f"Card {index + 1}"), "ord": index,
+                    "qfmt": template.get("front", ""), "afmt": template.get("back", ""),
+                    "did": None, "bqfmt": "", "bafmt": ""
+                }
+                for index, template in enumerate(model.templates)
+            ]
+        }
+
+    def _write_notes(
+        self,
+        conn: sqlite3.Connection,
+        notes: Dict[str, Note],
+        models: Dict[str, NoteModel],
+        model_ids: Dict[str, int]
+    ) -> Dict[str, int]:
+        note_ids: Dict[str, int] = {}
+        rows = []
+        for done, note in enumerate(notes.values(), 1):
+            mid = model_ids.get(note.model_id)
+            if mid is None:
+                continue
+            values = [self._rewrite_media(note.fields.get(name, "")) for name in models[note.model_id].fields]
+            nid = self._anki_id(note.id, "anki-note-", note.created_at)
+            note_ids[note.id] = nid
+            sort_field = re.sub(r"<[^>]+>", "", values[0]) if values else ""
+            rows.append((
+                nid, note.id, mid, int(note.updated_at.timestamp()), -1,
+                f" {' '.join(note.tags)} " if note.tags else "",
+                FIELD_SEPARATOR.join(values), sort_field,
+                int(hashlib.sha1(sort_field.encode("utf-8")).hexdigest()[:8], 16), 0, ""
+            ))
+            if len(rows) >= self.CHUNK_SIZE:
+                conn.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+                rows = []
+                self._report("notes", done, len(notes))
+        if rows:
+            conn.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+        self._report("notes", len(notes), len(notes))
+        return note_ids
+
+    def _write_cards(
+        self,
+        conn: sqlite3.Connection,
+        cards: List[Card],
+        notes: Dict[str, Note],
+        models: Dict[str, NoteModel],
+        note_ids: Dict[str, int],
+        deck_ids: Dict[str, int],
+        collection_created: datetime,
+        now: datetime
+    ) -> Dict[str, int]:
+        # model ID -> (is cloze, template ID -> ord)
+        layouts = {
+            model_id: (self._is_cloze(model), {t.get("id"): i for i, t in enumerate(model.templates)})
+            for model_id, model in models.items()
+        }
+        card_ids: Dict[str, int] = {}
+        rows = []
+        new_position = 0
+        for done, card in enumerate(cards, 1):
+            note = notes.get(card.note_id)
+            if note is None or note.id not in note_ids:
+                continue
+            is_cloze, template_ords = layouts[note.model_id]
+            ord_ = card.ordinal - 1 if is_cloze else template_ords.get(card.template_id, 0)
+
+            card_type, queue = ANKI_CARD_TYPES.get(card.state, (0, 0))
+            data = ""
+            if card_type == 0:
+                new_position += 1
+                due, ivl, factor = new_position, 0, 0
+            else:
+                card_due = card.due or now
+                if queue == 1:
+                    # Intraday learning: epoch seconds
+                    due = int(card_due.timestamp())
+                else:
+                    due = (card_due.date() - collection_created.date()).days
+                if card_type == 1:
+                    # Cards in their first learning steps have no interval yet
+                    ivl = 0
+                elif card.last_review and card.due:
+                    ivl = max(1, (card.due - card.last_review).days)
+                else:
+                    ivl = max(1, int(round(card.stability)))
+                factor = difficulty_to_ease(card.difficulty)
+                data = json.dumps({"s": round(card.stability, 4), "d": round(card.difficulty, 4)})
+
+            cid = self._anki_id(card.id, "anki-card-", card.created_at)
+            card_ids[card.id] = cid
+            rows.append((
+                cid, note_ids[note.id], deck_ids[note.deck_id], ord_, int(card.updated_at.timestamp()), -1,
+                card_type, queue, due, ivl, factor, card.reps, card.lapses, 0, 0, 0, 0, data
+            ))
+            if len(rows) >= self.CHUNK_SIZE:
+                conn.executemany("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+                rows = []
+                self._report("cards", done, len(cards))
+        if rows:
+            conn.executemany("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+        self._report("cards", len(cards), len(cards))
+        return card_ids
+
+    def _write_reviews(self, conn: sqlite3.Connection, card_ids: Dict[str, int]) -> int:
+        written = 0
+        rows = []
+        # Reviews arrive oldest first, so a revlog ID (the answer time in ms)
+        # only has to clear the previous one to stay unique
+        last_id = 0
+        for review in self.store.iter_card_reviews(card_ids.keys()):
+            revlog_id = max(int(review.timestamp.timestamp() * 1000), last_id + 1)
+            last_id = revlog_id
+            rows.append((
+                revlog_id, card_ids[review.card_id], -1, review.rating, 0, review.elapsed_days or 0, 0,
+                review.response_time_ms, ANKI_REVLOG_TYPES.get(review.card_state, 1)
+            ))
+            if len(rows) >= self.CHUNK_SIZE:
+                conn.executemany("INSERT INTO revlog VALUES (?,?,?,?,?,?,?,?,?)", rows)
+                written += len(rows)
+                rows = []
+                self._report("reviews", written, written)
+        if rows:
+            conn.executemany("INSERT INTO revlog VALUES (?,?,?,?,?,?,?,?,?)", rows)
+            written += len(rows)
+        self._report("reviews", written, written)
+        return written
+
+    def _resolve_media(self, reference: str) -> Optional[Path]:
+        """Find the file a field's media reference points at"""
+        for prefix, root in self.media_roots.items():
+            if reference.startswith(prefix):
+                path = (root / reference[len(prefix):]).resolve()
+                # Never follow references out of the media root
+                if root.resolve() in path.parents and path.is_file():
+                    return path
+                return None
+        name = os.path.basename(reference)
+        path = self.store.media_dir / name
+        return path if name and path.is_file() else None
+
+    def _rewrite_media(self, value: str) -> str:
+        """Point a field's media references at flat package names, registering the files"""
+        def replace(match) -> str:
+            if match.group(2) is not None:
+                before, reference, after = match.group(1), match.group(2), ""
+            else:
+                before, reference, after = match.group(3), match.group(4), match.group(5)
+
+            if reference not in self._media:
+                path = self._resolve_media(reference)
+                if path is None:
+                    return match.group(0)
+                # Anki media is flat; keep names unique inside the package
+                name = path.name
+                stem, suffix = os.path.splitext(name)
+                counter = 1
+                while name in self._media_names:
+                    name = f"{stem}_{counter}{suffix}"
+                    counter += 1
+                self._media_names.add(name)
+                self._media[reference] = (path, name)
+            return f"{before}{self._media[reference][1]}{after}"
+        return MEDIA_REF_RE.sub(replace, value)
+
+    def _write_media(self, package: zipfile.ZipFile) -> int:
+        """Add referenced media to the package one file at a time"""
+        media_map = {}
+        total = len(self._media)
+        for index, (path, name) in enumerate(self._media.values()):
+            # Images are already compressed; store them as-is
+            package.write(path, str(index), compress_type=zipfile.ZIP_STORED)
+            media_map[str(index)] = name
+            if (index + 1) % 100 == 0 or index + 1 == total:
+                self._report("media", index + 1, total)
+        package.writestr("media", json.dumps(media_map))
+        return len(media_map)
+
+
+def export_apkg(
+    store: AksonCardsStore,
+    deck_id: str,
+    path,
+    include_subdecks: bool = True,
+    media_roots: Optional[Dict[str, Path]] = None,
+    progress: Optional[ProgressCallback] = None
+) -> dict:
+    """Export a deck to an .apkg file (see ApkgExporter)"""
+    return ApkgExporter(store, media_roots=media_roots, progress=progress).export_deck(
+        deck_id, path, include_subdecks
+    )
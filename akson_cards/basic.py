@@ -0,0 +1,142 @@
+"""
+Basic (question/answer) note generation for Akson Cards
+
+Turns Q/A pairs, or the "Question: ... / Answer: ..." text the flashcard
+generator asks the AI for, into notes of the built-in Basic model. Pairs
+whose question is already in the deck are skipped, and the rest are written
+in one transaction.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .ids import new_id
+from .models import Card, Note, NoteModel
+from .store import AksonCardsStore
+from .templates import strip_html
+
+
+BASIC_MODEL_ID = "basic"
+
+# One "Question: ... Answer: ..." pair, up to the next "Question:" line
+QA_PAIR_RE = re.compile(
+    r'Question[:\s]+(.+?)\s+Answer[:\s]+(.+?)(?=\nQuestion[:\s]+|\Z)',
+    re.IGNORECASE | re.DOTALL
+)
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def parse_qa_text(raw: str) -> List[Tuple[str, str]]:
+    """
+    Split generated text into (question, answer) pairs
+
+    Text before the first "Question:" and anything that is not a complete
+    pair is ignored.
+    """
+    return [(question.strip(), answer.strip()) for question, answer in QA_PAIR_RE.findall(raw)]
+
+
+def question_key(question: str) -> str:
+    """Normalized form of a question used to detect duplicates"""
+    return WHITESPACE_RE.sub(" ", strip_html(question)).strip().casefold()
+
+
+def build_basic_note(
+    deck_id: str,
+    model: NoteModel,
+    front: str,
+    back: str,
+    tags: Optional[List[str]] = None
+) -> Tuple[Note, Card]:
+    """
+    Build a basic note and its card
+
+    Raises:
+        ValueError: If the question or the answer is empty
+    """
+    if not front:
+        raise ValueError("Question is empty")
+    if not back:
+        raise ValueError("Answer is empty")
+
+    note = Note(
+        id=new_id(),
+        deck_id=deck_id,
+        model_id=model.id,
+        fields={"Front": front, "Back": back},
+        tags=list(tags or [])
+    )
+    card = Card(
+        id=new_id(),
+        note_id=note.id,
+        template_id=model.templates[0]["id"] if model.templates else "basic-1",
+        state="new"
+    )
+    return note, card
+
+
+def add_basic_notes(
+    store: AksonCardsStore,
+    deck_id: str,
+    items: Iterable[Union[Tuple[str, str], Dict[str, str]]],
+    tags: Optional[List[str]] = None
+) -> dict:
+    """
+    Create many basic notes and their cards in one store transaction
+
+    Questions already in the deck (or repeated within `items`) are skipped.
+
+    Args:
+        store: Store to write to
+        deck_id: Deck the notes belong to
+        items: (question, answer) tuples, or dicts with "front"/"back"
+            (or "q"/"a") keys
+        tags: Tags applied to every note
+
+    Returns:
+        Dict with the number of notes added, plus per-item duplicates and errors
+    """
+    notes: List[Note] = []
+    cards: List[Card] = []
+    duplicates = []
+    errors = []
+
+    with store.transaction():
+        models = store.get_models()
+        model = models.get(BASIC_MODEL_ID)
+        if model is None:
+            # Any other model (e.g. cloze) has different fields and templates
+            raise ValueError(f"Basic note model '{BASIC_MODEL_ID}' not found")
+
+        seen = {
+            question_key(note.fields.get("Front", ""))
+            for note in store.get_notes(deck_id=deck_id).values()
+        }
+
+        for index, item in enumerate(items):
+            try:
+                if isinstance(item, dict):
+                    front = item.get("front", item.get("q")) or ""
+                    back = item.get("back", item.get("a")) or ""
+                elif isinstance(item, (list, tuple)) and len(item) == 2:
+                    front, back = item
+                else:
+                    raise ValueError("Expected a question/answer pair")
+                front, back = str(front).strip(), str(back).strip()
+                note, card = build_basic_note(deck_id, model, front, back, tags)
+            except (TypeError, ValueError) as e:
+                errors.append({"index": index, "error": str(e)})
+                continue
+
+            key = question_key(front)
+            if key in seen:
+                duplicates.append({"index": index, "front": front})
+                continue
+            seen.add(key)
+            notes.append(note)
+            cards.append(card)
+
+        if notes:
+            store.add_notes(notes, cards)
+
+    return {"notes": len(notes), "cards": len(cards), "duplicates": duplicates, "errors": errors}
@@ -0,0 +1,120 @@
+"""
+Cloze note generation for Akson Cards
+
+Turns cloze text ("{{c1::Aldosterone}} is made in the {{c2::zona
+glomerulosa}}") into notes of the built-in Cloze model, with one sibling
+card per cloze number. Large batches are built in memory and written to the
+store in one transaction.
+"""
+
+import re
+from typing import Iterable, List, Optional, Tuple, Union
+
+from .ids import new_id
+from .models import Card, Note
+from .store import AksonCardsStore
+from .templates import cloze_ordinals
+
+
+CLOZE_MODEL_ID = "cloze"
+CLOZE_TEMPLATE_ID = "cloze-1"
+
+# Optional "Extra:" line following a cloze line in AI output
+EXTRA_RE = re.compile(r"^\s*(?:Back Extra|Extra)\s*:\s*(.*)$", re.IGNORECASE)
+# Leading list markers AI output tends to add ("1.", "-", "•")
+BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+
+def parse_cloze_text(raw: str) -> List[Tuple[str, str]]:
+    """
+    Split free text into cloze notes
+
+    Every line containing a cloze deletion starts a note; an "Extra:" line
+    right after it becomes the note's Back Extra. Other lines are ignored.
+
+    Returns:
+        List of (text, back_extra) tuples
+    """
+    parsed: List[Tuple[str, str]] = []
+    for line in raw.splitlines():
+        extra = EXTRA_RE.match(line)
+        if extra and parsed and not parsed[-1][1]:
+            parsed[-1] = (parsed[-1][0], extra.group(1).strip())
+            continue
+        line = BULLET_RE.sub("", line).strip()
+        if cloze_ordinals(line):
+            parsed.append((line, ""))
+    return parsed
+
+
+def build_cloze_note(
+    deck_id: str,
+    text: str,
+    back_extra: str = "",
+    tags: Optional[List[str]] = None
+) -> Tuple[Note, List[Card]]:
+    """
+    Build a cloze note and its sibling cards (one per cloze number)
+
+    Raises:
+        ValueError: If the text has no cloze deletions
+    """
+    ordinals = cloze_ordinals(text)
+    if not ordinals:
+        raise ValueError("Text has no cloze deletions ({{c1::...}})")
+
+    note = Note(
+        id=new_id(),
+        deck_id=deck_id,
+        model_id=CLOZE_MODEL_ID,
+        fields={"Text": text, "Back Extra": back_extra},
+        tags=list(tags or [])
+    )
+    cards = [
+        Card(
+            id=new_id(),
+            note_id=note.id,
+            template_id=CLOZE_TEMPLATE_ID,
+            ordinal=ordinal,
+            state="new"
+        )
+        for ordinal in ordinals
+    ]
+    return note, cards
+
+
+def add_cloze_notes(
+    store: AksonCardsStore,
+    deck_id: str,
+    items: Iterable[Union[str, Tuple[str, str]]],
+    tags: Optional[List[str]] = None
+) -> dict:
+    """
+    Create many cloze notes and all their cards in one store transaction
+
+    Args:
+        store: Store to write to
+        deck_id: Deck the notes belong to
+        items: Cloze texts, or (text, back_extra) tuples
+        tags: Tags applied to every note
+
+    Returns:
+        Dict with the number of notes and cards added, plus per-item errors
+    """
+    notes: List[Note] = []
+    cards: List[Card] = []
+    errors = []
+    for index, item in enumerate(items):
+        text, back_extra = (item, "") if isinstance(item, str) else item
+        try:
+            note, note_cards = build_cloze_note(deck_id, text.strip(), (back_extra or "").strip(), tags)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        notes.append(note)
+        cards.extend(note_cards)
+
+    if notes:
+        store.add_notes(notes, cards)
+
+    return {"notes": len(notes), "cards": len(cards), "errors": errors}
@@ -0,0 +1,306 @@
+"""
+HTTP response compression for the Akson web services
+
+Both web apps use this module to:
+
+    - negotiate a content coding from Accept-Encoding: brotli when the
+      optional `brotli` package is installed, otherwise gzip
+    - compress JSON responses above MIN_COMPRESS_SIZE, either whole or as a
+      stream
+    - precompress static assets into .br/.gz siblings, so the servers can
+      send those files directly and never compress them per request
+
+Siblings are written at startup, and only for files that are new or changed
+since the last run. Large trees such as the PDF.js viewer can be done at
+build time instead:
+
+    python -m akson_cards.compression pdfjs web_app/static
+"""
+
+import argparse
+import gzip
+import os
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Union
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+# Bodies smaller than this are sent uncompressed (framing overhead wins)
+MIN_COMPRESS_SIZE = 1024
+# Per-request compression favours speed; precompressed assets use the maximum
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+# Content coding -> sibling file suffix, in server preference order
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# Text assets, plus the PDF.js binary CMaps and fonts, which still shrink well
+PRECOMPRESS_EXTENSIONS = frozenset({
+    ".html", ".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".ftl",
+    ".properties", ".bcmap", ".pfb", ".ttf", ".xml",
+})
+# A sibling that saves less than this fraction of the original is not kept;
+# an empty "<sibling>.skip" marker records that until the file changes
+MIN_SAVING = 0.1
+SKIP_SUFFIX = ".skip"
+
+JSON_MIMETYPES = ("application/json", "application/x-ndjson")
+
+
+def available_encodings() -> List[str]:
+    """Content codings this process can produce, most preferred first"""
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding != "br" or brotli is not None]
+
+
+def accepted_encodings(accept_encoding: Optional[str], encodings: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Codings acceptable to the client, best first
+
+    Args:
+        accept_encoding: Accept-Encoding header value
+        encodings: Codings to choose from (default: available_encodings())
+
+    Returns:
+        Codings with a non-zero q-value, by descending q (server order on ties)
+    """
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    offered = list(encodings) if encodings is not None else available_encodings()
+    ranked = [
+        (weights.get(encoding, weights.get("*", 0.0)), -index, encoding)
+        for index, encoding in enumerate(offered)
+    ]
+    return [encoding for weight, _, encoding in sorted(ranked, reverse=True) if weight > 0]
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best coding for a response, or None to send it as is"""
+    encodings = accepted_encodings(accept_encoding)
+    return encodings[0] if encodings else None
+
+
+def coded_etag(etag: str, encoding: str) -> str:
+    """Entity tag of a body sent with a content coding (each coding is a distinct representation)"""
+    return f"{etag}-{encoding}"
+
+
+def compress(data: bytes, encoding: str, static: bool = False) -> bytes:
+    """Compress a whole body (static=True for maximum compression)"""
+    if encoding == "br":
+        return brotli.compress(data, quality=STATIC_BROTLI_QUALITY if static else BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0 keeps the output reproducible
+        return gzip.compress(data, STATIC_GZIP_LEVEL if static else GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported content coding: {encoding}")
+
+
+def compress_stream(chunks: Iterable[Union[str, bytes]], encoding: str) -> Iterator[bytes]:
+    """
+    Compress a streamed body chunk by chunk
+
+    Each input chunk is flushed, so a client can decode every chunk
+    (e.g. NDJSON rows) as soon as it arrives.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            data += compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    else:
+        raise ValueError(f"Unsupported content coding: {encoding}")
+
+
+def is_json_mimetype(content_type: Optional[str]) -> bool:
+    return (content_type or "").split(";", 1)[0].strip().lower() in JSON_MIMETYPES
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing single-body JSON responses
+
+    Responses that are streamed, already encoded, not JSON or smaller than
+    minimum_size pass through unchanged.
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_COMPRESS_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = negotiate_encoding(accept_encoding)
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it is compressed
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+
+            headers = start["headers"]
+            names = {name.lower(): value for name, value in headers}
+            if start["status"] == 304 and b"vary" not in names:
+                # The body a 304 stands for may have been sent compressed
+                start = dict(start, headers=headers + [(b"vary", b"Accept-Encoding")])
+            body = message.get("body", b"")
+            if (
+                message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+                and b"content-encoding" not in names
+                and is_json_mimetype(names.get(b"content-type", b"").decode("latin-1"))
+                and len(body) >= self.minimum_size
+            ):
+                headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+                headers.append((b"vary", b"Accept-Encoding"))
+                if encoding is not None:
+                    body = compress(body, encoding)
+                    headers.append((b"content-encoding", encoding.encode("latin-1")))
+                    message = dict(message, body=body)
+                    headers = [
+                        (name, _coded_etag_header(value, encoding) if name.lower() == b"etag" else value)
+                        for name, value in headers
+                    ]
+                headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                start = dict(start, headers=headers)
+
+            await send(start)
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _coded_etag_header(value: bytes, encoding: str) -> bytes:
+    """ETag header value of an identity body, rewritten for its coded form"""
+    text = value.decode("latin-1")
+    if not text.endswith('"'):
+        return value
+    weak, _, tag = text[:-1].partition('"')
+    return f'{weak}"{coded_etag(tag, encoding)}"'.encode("latin-1")
+
+
+# Static assets
+def is_precompressible(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in PRECOMPRESS_EXTENSIONS
+
+
+def precompress_file(path: Path, encodings: Optional[Iterable[str]] = None) -> int:
+    """
+    Write (or refresh) the compressed siblings of one file
+
+    Returns:
+        Number of siblings written
+    """
+    path = Path(path)
+    source = path.stat()
+    data = None
+    written = 0
+    for encoding in encodings if encodings is not None else available_encodings():
+        sibling = path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+        marker = sibling.with_name(sibling.name + SKIP_SUFFIX)
+        if _is_newer(sibling, source) or _is_newer(marker, source):
+            continue
+
+        if data is None:
+            data = path.read_bytes()
+        compressed = compress(data, encoding, static=True)
+        if len(compressed) > len(data) * (1 - MIN_SAVING):
+            # Not worth a sibling; drop a stale one so it is not served, and
+            # leave a marker so the file is not compressed again next startup
+            sibling.unlink(missing_ok=True)
+            marker.touch()
+            continue
+        # Written under a per-process name: several workers may run this at once
+        tmp_path = sibling.with_name(f"{sibling.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(compressed)
+        os.replace(tmp_path, sibling)
+        marker.unlink(missing_ok=True)
+        written += 1
+    return written
+
+
+def _is_newer(path: Path, source: os.stat_result) -> bool:
+    try:
+        return path.stat().st_mtime >= source.st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def precompress_tree(directory: Path, min_size: int = MIN_COMPRESS_SIZE) -> int:
+    """
+    Precompress every compressible asset under a directory
+
+    Files that cannot be written (e.g. a read-only install) are skipped;
+    they are then served uncompressed.
+
+    Returns:
+        Number of siblings written
+    """
+    written = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if not is_precompressible(filename):
+                continue
+            path = Path(root) / filename
+            try:
+                if path.stat().st_size < min_size:
+                    continue
+                written += precompress_file(path)
+            except OSError:
+                continue
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write .br/.gz siblings for static assets")
+    parser.add_argument("directories", nargs="+", type=Path, help="asset directories")
+    args = parser.parse_args()
+    for directory in args.directories:
+        print(f"{directory}: {precompress_tree(directory)} files written")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ Core FSRS algorithm for computing next intervals and updating card parameters.
 
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 import math
 
 
@@ -178,7 +178,8 @@ class FSRS:
             reps=card.reps,
             lapses=card.lapses,
             elapsed_days=elapsed_days,
-            last_review=now
+            last_review=now,
+            state=card.state
         )
         
         if card.state == "new" or (card.state == "learning" and rating == 1):
@@ -272,6 +273,29 @@ class FSRS:
         updated.elapsed_days = 0  # Reset after review
         return updated, next_due
     
+    def preview_ratings(
+        self,
+        cards: List[CardParams],
+        now: Optional[datetime] = None
+    ) -> List[Dict[int, Tuple[CardParams, datetime]]]:
+        """
+        Compute the outcome of every rating for a batch of cards.
+        
+        Args:
+            cards: Current parameters of each card
+            now: Timestamp the reviews would happen at (defaults to now)
+        
+        Returns:
+            One dict per card mapping rating (1-4) to (updated_params, next_due)
+        """
+        if now is None:
+            now = datetime.now()
+        
+        return [
+            {rating: self.next_review(card, rating, now) for rating in (1, 2, 3, 4)}
+            for card in cards
+        ]
+    
     def preview_workload(
         self, 
         cards: list[CardParams], 
@@ -293,3 +317,21 @@ class FSRS:
         
         return workload
 
+
+def format_interval(delta: timedelta) -> str:
+    """Format an interval compactly for rating buttons (e.g. 10m, 3d, 1.5mo)"""
+    seconds = max(0.0, delta.total_seconds())
+    minutes = seconds / 60
+    if minutes < 1:
+        return "<1m"
+    if minutes < 60:
+        return f"{int(round(minutes))}m"
+    hours = minutes / 60
+    if hours < 24:
+        return f"{int(round(hours))}h"
+    days = hours / 24
+    if days < 30:
+        return f"{int(round(days))}d"
+    if days < 365:
+        return f"{days / 30:.1f}mo"
+    return f"{days / 365:.1f}y"
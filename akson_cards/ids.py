@@ -0,0 +1,48 @@
+"""
+ID allocation for Akson Cards
+
+IDs are time-ordered: a 48-bit millisecond timestamp followed by 80 random
+bits, written as 32 hex characters. Allocating one never reads the store.
+Sorting IDs as strings gives creation order. The random part makes
+collisions between processes (desktop app, web workers) practically
+impossible.
+Within a process the sequence is strictly increasing, even when several
+IDs are allocated in the same millisecond or the clock steps back.
+"""
+
+import os
+import threading
+import time
+
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+
+_lock = threading.Lock()
+# (timestamp_ms, random part) of the last ID allocated in this process
+_last = (0, 0)
+
+
+def new_id(prefix: str = "") -> str:
+    """
+    Allocate a new unique, time-ordered ID
+
+    Args:
+        prefix: Optional prefix such as "note_"
+
+    Returns:
+        prefix followed by 32 lowercase hex characters
+    """
+    global _last
+    timestamp = int(time.time() * 1000)
+    with _lock:
+        last_timestamp, last_random = _last
+        if timestamp <= last_timestamp:
+            # Same millisecond (or the clock went back): continue the last sequence
+            timestamp, random_part = last_timestamp, last_random + 1
+            if random_part > _RANDOM_MAX:
+                timestamp, random_part = last_timestamp + 1, 0
+        else:
+            random_part = int.from_bytes(os.urandom(_RANDOM_BITS // 8), "big")
+        _last = (timestamp, random_part)
+    return f"{prefix}{timestamp:012x}{random_part:020x}"
+
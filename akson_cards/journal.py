@@ -0,0 +1,241 @@
+"""
+Write-behind journal for study answers
+
+Answers are appended to an on-disk journal (one JSON line per answer,
+fsynced before returning) and kept in memory until a background writer
+applies them to the store in batches. On startup any journal left over
+from a crash is replayed, so an acknowledged answer is never lost.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+from . import metrics
+from .models import Card, Review
+from .store import AksonCardsStore
+
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerJournal:
+    """Buffers card updates and review records, flushing them in batches"""
+
+    def __init__(
+        self,
+        store: AksonCardsStore,
+        flush_interval: float = 1.0,
+        batch_size: int = 200,
+        autostart: bool = True
+    ):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.path = store.data_dir / "journal.jsonl"
+        # Journal segment being applied by a flush (kept until applied)
+        self.flushing_path = store.data_dir / "journal.flushing.jsonl"
+
+        self._pending: List[dict] = []
+        # Bumped by every appended entry; starts from the clock so it never
+        # repeats a value handed out before a restart
+        self._seq = time.time_ns() // 1000
+        self._cond = threading.Condition()
+        # Serializes flushes so batches reach the store in order
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        # Error of the background writer's latest flush (None once one succeeds)
+        self.last_error: Optional[Exception] = None
+
+        self.recover()
+        if autostart:
+            self.start()
+            # Apply whatever is still buffered on a clean interpreter exit
+            atexit.register(self.close)
+
+    def start(self) -> None:
+        """Start the background writer thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="akson-answer-journal", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop the background writer and flush everything still pending"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def record_answer(self, card: Card, review: Review) -> None:
+        """Durably append an answer; it reaches the store on the next flush"""
+        self._append({
+            "op": "answer",
+            "card": card.to_dict(),
+            "review": review.to_dict()
+        })
+
+    def record_undo(self, card: Card, review: Review) -> None:
+        """Durably append the retraction of an earlier answer"""
+        self._append({
+            "op": "undo",
+            "card": card.to_dict(),
+            "review": review.to_dict()
+        })
+
+    def pending_count(self) -> int:
+        """Number of journal entries not yet applied to the store"""
+        with self._cond:
+            return len(self._pending)
+
+    @property
+    def seq(self) -> int:
+        """
+        Sequence number of the latest appended entry
+
+        Together with the store's change sequence it identifies the state
+        readers see once the journal is applied (used for ETags), without
+        forcing a flush.
+        """
+        with self._cond:
+            return self._seq
+
+    def _append(self, entry: dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._cond:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending.append(entry)
+            self._seq += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                # Entries stay in the journal file and are retried next time
+                self.last_error = e
+                metrics.record_journal_flush_failure()
+                logger.exception("Answer journal flush failed (%d entries pending)", self.pending_count())
+            else:
+                self.last_error = None
+
+    def flush(self) -> int:
+        """
+        Apply all pending entries to the store
+
+        Returns:
+            Number of entries applied
+        """
+        with self._flush_lock:
+            with self._cond:
+                entries = self._pending
+                if not entries:
+                    return 0
+                self._pending = []
+                # Rotate the journal so new answers append to a fresh file
+                # while this batch is written to the store
+                os.replace(self.path, self.flushing_path)
+
+            try:
+                self._apply(entries)
+            except Exception:
+                # Put the batch back in front of anything recorded meanwhile
+                with self._cond:
+                    self._pending = entries + self._pending
+                    self._merge_back()
+                raise
+
+            os.remove(self.flushing_path)
+            return len(entries)
+
+    def _merge_back(self) -> None:
+        """Fold a failed flush segment back into the live journal file"""
+        with open(self.flushing_path, "r", encoding="utf-8") as f:
+            flushed = f.read()
+        current = ""
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                current = f.read()
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(flushed + current)
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(self.flushing_path)
+
+    def _apply(self, entries: List[dict]) -> None:
+        """Write a batch of entries with one rewrite per store file"""
+        cards = {}
+        reviews = {}
+        retracted = {}
+        for entry in entries:
+            op = entry.get("op")
+            if op not in ("answer", "undo"):
+                continue
+            # Later entries for the same card supersede earlier ones
+            cards[entry["card"]["id"]] = Card.from_dict(entry["card"])
+            review = Review.from_dict(entry["review"])
+            if op == "answer":
+                reviews[review.id] = review
+            elif review.id in reviews:
+                # Answered and undone within the same batch: never written
+                del reviews[review.id]
+            else:
+                retracted[review.id] = review
+
+        with self.store.transaction():
+            if cards:
+                self.store.save_cards(cards.values())
+            if reviews:
+                self.store.save_reviews(reviews.values())
+            if retracted:
+                self.store.delete_reviews(retracted.values())
+
+    def recover(self) -> int:
+        """
+        Replay journal files left behind by a crash
+
+        Returns:
+            Number of entries replayed
+        """
+        entries = []
+        for path in (self.flushing_path, self.path):
+            if not path.exists():
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-append
+                        continue
+
+        if entries:
+            self._apply(entries)
+        for path in (self.flushing_path, self.path):
+            if path.exists():
+                os.remove(path)
+        return len(entries)
@@ -0,0 +1,147 @@
+"""
+Batch maintenance jobs over the review log
+
+Flags leeches (cards that keep lapsing) and buries sibling cards (other
+cards of the same note) for the rest of the day once one of them has been
+reviewed. The job is incremental: it remembers the store change sequence
+it has processed up to and only looks at reviews and cards stored since,
+and its results live in a small file that StudySession.start can query
+cheaply.
+"""
+
+from datetime import date
+from typing import Dict, Iterable, Optional, Set
+
+from .store import AksonCardsStore
+
+
+class CardMaintenance:
+    """Incremental leech detection and sibling burying"""
+
+    # Lapses at which a card counts as a leech (Anki's default)
+    LEECH_THRESHOLD = 8
+
+    def __init__(self, store: AksonCardsStore, leech_threshold: Optional[int] = None):
+        self.store = store
+        self.leech_threshold = leech_threshold or self.LEECH_THRESHOLD
+
+    def _load_state(self) -> dict:
+        state = self.store.get_maintenance_state()
+        # Timestamp cursor of earlier versions; replaced by the change sequence
+        for key in ("cursor", "cursor_ids", "log_signature"):
+            state.pop(key, None)
+        state.setdefault("seq", 0)  # Store change sequence processed up to
+        state.setdefault("leeches", {})  # card_id -> lapses when flagged
+        state.setdefault("buried", {})  # "YYYY-MM-DD" -> [card_id, ...]
+        return state
+
+    def run(self, today: Optional[date] = None) -> dict:
+        """
+        Process changes made to the store since the last run
+
+        Returns:
+            Summary with the number of reviews processed, leeches and buried cards
+        """
+        today = today or date.today()
+        today_key = today.isoformat()
+
+        processed = 0
+        state = self._load_state()
+        stale_days = any(day < today_key for day in state["buried"])
+        if state["seq"] != self.store.get_change_seq() or stale_days:
+            with self.store.transaction():
+                state = self._load_state()
+                # Buried siblings only matter for the day they were buried on
+                state["buried"] = {
+                    day: card_ids for day, card_ids in state["buried"].items()
+                    if day >= today_key
+                }
+                seq = self.store.get_change_seq()
+                if seq != state["seq"]:
+                    processed = self._process_changes(state, today_key, seq)
+                    state["seq"] = seq
+                self.store.save_maintenance_state(state)
+
+        return {
+            "processed": processed,
+            "leeches": len(state["leeches"]),
+            "buried_today": len(state["buried"].get(today_key, []))
+        }
+
+    def _process_changes(self, state: dict, today_key: str, seq: int) -> int:
+        # The change log records every stored review and card, in the order
+        # they were stored, so reviews that arrive late (offline batches,
+        # imports, sync pulls) are seen even when their timestamps are old
+        review_ids = []
+        changed_cards = set()
+        for change_seq, kind, entity_id, deleted, _ in self.store.iter_changes(state["seq"]):
+            if change_seq > seq:
+                break
+            if kind == "review" and not deleted:
+                review_ids.append(entity_id)
+            elif kind == "card":
+                changed_cards.add(entity_id)
+
+        reviews = list(self.store.get_reviews_by_ids(review_ids).values())
+        touched = changed_cards | {review.card_id for review in reviews} | set(state["leeches"])
+        if not touched:
+            return 0
+        cards = self.store.get_cards_by_ids(touched)
+
+        # Leeches: flag cards at or over the lapse threshold, unflag cards
+        # that dropped back below it (e.g. after an undo) or were deleted
+        for card_id in touched:
+            card = cards.get(card_id)
+            if card and card.lapses >= self.leech_threshold:
+                state["leeches"][card_id] = card.lapses
+            else:
+                state["leeches"].pop(card_id, None)
+
+        # Siblings: cards reviewed today bury the other cards of their note
+        reviewed_today = [
+            review.card_id for review in reviews
+            if review.timestamp.date().isoformat() == today_key
+        ]
+        if reviewed_today:
+            note_cards = self.store.get_note_card_index()
+            buried = set(state["buried"].get(today_key, []))
+            for card_id in reviewed_today:
+                card = cards.get(card_id)
+                if not card:
+                    continue
+                buried.update(
+                    sibling_id for sibling_id in note_cards.get(card.note_id, [])
+                    if sibling_id != card_id
+                )
+            # A card studied today is not buried by its own sibling's review
+            buried.difference_update(reviewed_today)
+            state["buried"][today_key] = sorted(buried)
+
+        return len(reviews)
+
+    def bury(self, card_ids: Iterable[str], today: Optional[date] = None) -> None:
+        """Keep cards out of study sessions for the rest of the day"""
+        today_key = (today or date.today()).isoformat()
+        with self.store.transaction():
+            state = self._load_state()
+            buried = set(state["buried"].get(today_key, []))
+            buried.update(card_ids)
+            state["buried"][today_key] = sorted(buried)
+            self.store.save_maintenance_state(state)
+
+    def get_leeches(self) -> Dict[str, int]:
+        """Flagged leeches: card_id -> lapses"""
+        return dict(self._load_state()["leeches"])
+
+    def get_buried(self, today: Optional[date] = None) -> Set[str]:
+        """Card IDs buried for the rest of the day"""
+        today_key = (today or date.today()).isoformat()
+        return set(self._load_state()["buried"].get(today_key, []))
+
+    def get_excluded(self, today: Optional[date] = None, include_leeches: bool = True) -> Set[str]:
+        """Card IDs a study session should skip today, from one read of the results"""
+        state = self._load_state()
+        excluded = set(state["buried"].get((today or date.today()).isoformat(), []))
+        if include_leeches:
+            excluded.update(state["leeches"])
+        return excluded
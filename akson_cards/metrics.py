@@ -0,0 +1,245 @@
+"""
+Request and store metrics for the Akson web services
+
+A small in-process registry, rendered in the Prometheus text format. It
+needs no client library. It records:
+
+    - per-route request counts (by status) and latency histograms
+    - store document reads and writes, and the bytes parsed and written,
+      both in total (per document) and per request (per route)
+    - failed background flushes of the answer journal
+
+The web apps wrap each request in begin_request()/end_request(). The store
+calls record_read()/record_write(), and those calls are charged to the
+request running in the current context (thread or asyncio task). Store work
+outside a request, such as the answer journal's background writer or the
+body of a streamed response, is counted only in the per-document totals.
+
+Every process has its own registry. Under several gunicorn workers each
+scrape sees the worker that served it.
+"""
+
+import contextvars
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; the Prometheus client's defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+# Bytes of JSON parsed while serving one request
+BYTES_BUCKETS = (0, 1024, 16 * 1024, 128 * 1024, 1024 ** 2, 8 * 1024 ** 2, 64 * 1024 ** 2)
+
+Labels = Tuple[str, ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Labels, buckets: Iterable[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # Label values -> [per-bucket counts (non-cumulative), sum, count]
+        self.series: Dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names + ("le",), labels + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.label_names + ("le",), labels + ("+Inf",))
+            lines.append(f"{self.name}_bucket{le} {count}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Labels):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class RequestStats:
+    """Store activity of one in-flight request"""
+
+    __slots__ = ("started", "reads", "read_bytes", "writes", "written_bytes")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.reads = 0
+        self.read_bytes = 0
+        self.writes = 0
+        self.written_bytes = 0
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "akson_request_stats", default=None
+)
+
+
+class Metrics:
+    """Registry of the service's counters and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter(
+            "akson_http_requests_total", "HTTP requests served", ("method", "route", "status")
+        )
+        self.latency = Histogram(
+            "akson_http_request_duration_seconds", "Time to produce a response",
+            ("method", "route"), LATENCY_BUCKETS
+        )
+        self.request_reads = Counter(
+            "akson_http_store_reads_total", "Store document reads made by requests", ("route",)
+        )
+        self.request_writes = Counter(
+            "akson_http_store_writes_total", "Store document writes made by requests", ("route",)
+        )
+        self.request_read_bytes = Histogram(
+            "akson_http_store_read_bytes", "Bytes of stored JSON parsed per request",
+            ("route",), BYTES_BUCKETS
+        )
+        self.request_written_bytes = Counter(
+            "akson_http_store_written_bytes_total", "Bytes of JSON written by requests", ("route",)
+        )
+        self.store_reads = Counter(
+            "akson_store_reads_total", "Store document reads", ("document",)
+        )
+        self.store_read_bytes = Counter(
+            "akson_store_read_bytes_total", "Bytes of stored JSON parsed", ("document",)
+        )
+        self.store_writes = Counter(
+            "akson_store_writes_total", "Store document writes", ("document",)
+        )
+        self.store_written_bytes = Counter(
+            "akson_store_written_bytes_total", "Bytes of JSON written to the store", ("document",)
+        )
+        self.journal_flush_failures = Counter(
+            "akson_journal_flush_failures_total", "Background answer journal flushes that failed", ()
+        )
+
+    # Store hooks
+    def record_read(self, document: str, parsed_bytes: int = 0) -> None:
+        """Count one document read (parsed_bytes is 0 when served from a cache)"""
+        stats = _current.get()
+        if stats is not None:
+            stats.reads += 1
+            stats.read_bytes += parsed_bytes
+        with self._lock:
+            self.store_reads.inc((document,))
+            if parsed_bytes:
+                self.store_read_bytes.inc((document,), parsed_bytes)
+
+    def record_write(self, document: str, written_bytes: int) -> None:
+        """Count one document write"""
+        stats = _current.get()
+        if stats is not None:
+            stats.writes += 1
+            stats.written_bytes += written_bytes
+        with self._lock:
+            self.store_writes.inc((document,))
+            self.store_written_bytes.inc((document,), written_bytes)
+
+    def record_journal_flush_failure(self) -> None:
+        """Count one failed background flush of the answer journal"""
+        with self._lock:
+            self.journal_flush_failures.inc(())
+
+    # Requests
+    def begin_request(self) -> contextvars.Token:
+        """Start timing a request in the current context"""
+        return _current.set(RequestStats())
+
+    def end_request(self, token: contextvars.Token, method: str, route: str, status: int) -> None:
+        """
+        Record a finished request and detach it from the current context
+
+        Args:
+            token: Value returned by begin_request()
+            method: HTTP method
+            route: Route pattern (not the raw path, to keep label sets small)
+            status: Response status code
+        """
+        stats = _current.get()
+        _current.reset(token)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats.started
+        with self._lock:
+            self.requests.inc((method, route, str(status)))
+            self.latency.observe((method, route), elapsed)
+            self.request_reads.inc((route,), stats.reads)
+            self.request_writes.inc((route,), stats.writes)
+            self.request_read_bytes.observe((route,), stats.read_bytes)
+            self.request_written_bytes.inc((route,), stats.written_bytes)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for metric in (
+                self.requests, self.latency,
+                self.request_reads, self.request_writes,
+                self.request_read_bytes, self.request_written_bytes,
+                self.store_reads, self.store_read_bytes,
+                self.store_writes, self.store_written_bytes,
+                self.journal_flush_failures,
+            ):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+# Process-wide registry used by the store and both web apps
+METRICS = Metrics()
+record_read = METRICS.record_read
+record_write = METRICS.record_write
+record_journal_flush_failure = METRICS.record_journal_flush_failure
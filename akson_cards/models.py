@@ -39,8 +39,9 @@ class Note:
             id=data["id"],
             deck_id=data["deck_id"],
             model_id=data["model_id"],
-            fields=data.get("fields", {}),
-            tags=data.get("tags", []),
+            # Copied: stores may hand out cached (shared) dicts
+            fields=dict(data.get("fields", {})),
+            tags=list(data.get("tags", [])),
             created_at=datetime.fromisoformat(data.get("created_at", datetime.now().isoformat())),
             updated_at=datetime.fromisoformat(data.get("updated_at", datetime.now().isoformat()))
         )
@@ -52,6 +53,7 @@ class Card:
     id: str
     note_id: str
     template_id: str  # Which template to use for rendering
+    ordinal: int = 1  # Cloze number for cloze cards (c1 -> 1)
     
     # FSRS parameters
     stability: float = 0.0
@@ -74,6 +76,7 @@ class Card:
             "id": self.id,
             "note_id": self.note_id,
             "template_id": self.template_id,
+            "ordinal": self.ordinal,
             "stability": self.stability,
             "difficulty": self.difficulty,
             "reps": self.reps,
@@ -92,6 +95,7 @@ class Card:
             id=data["id"],
             note_id=data["note_id"],
             template_id=data.get("template_id", "default"),
+            ordinal=data.get("ordinal", 1),
             stability=data.get("stability", 0.0),
             difficulty=data.get("difficulty", 8.0),
             reps=data.get("reps", 0),
@@ -187,6 +191,9 @@ class Review:
     rating: int  # 1=Again, 2=Hard, 3=Good, 4=Easy
     response_time_ms: int = 0
     scheduler_version: str = "fsrs"
+    deck_id: Optional[str] = None
+    card_state: Optional[str] = None  # Card state before the review (new, learning, review, relearning)
+    elapsed_days: Optional[int] = None  # Days since the card's previous review
     
     def to_dict(self) -> dict:
         return {
@@ -195,7 +202,10 @@ class Review:
             "timestamp": self.timestamp.isoformat(),
             "rating": self.rating,
             "response_time_ms": self.response_time_ms,
-            "scheduler_version": self.scheduler_version
+            "scheduler_version": self.scheduler_version,
+            "deck_id": self.deck_id,
+            "card_state": self.card_state,
+            "elapsed_days": self.elapsed_days
         }
     
     @classmethod
@@ -206,7 +216,10 @@ class Review:
             timestamp=datetime.fromisoformat(data["timestamp"]),
             rating=data["rating"],
             response_time_ms=data.get("response_time_ms", 0),
-            scheduler_version=data.get("scheduler_version", "fsrs")
+            scheduler_version=data.get("scheduler_version", "fsrs"),
+            deck_id=data.get("deck_id"),
+            card_state=data.get("card_state"),
+            elapsed_days=data.get("elapsed_days")
         )
 
 
@@ -233,8 +246,8 @@ class NoteModel:
         return cls(
             id=data["id"],
             name=data["name"],
-            fields=data.get("fields", []),
-            templates=data.get("templates", []),
+            fields=list(data.get("fields", [])),
+            templates=[dict(template) for template in data.get("templates", [])],
             css=data.get("css", "")
         )
 
@@ -0,0 +1,202 @@
+"""
+Study session registry shared by the desktop and web apps
+
+Sessions are kept under an ID with LRU and TTL eviction. Only a bounded
+number stay live as StudySession objects; the rest are held as compact
+cursors (card IDs plus position) and rehydrated lazily on next access.
+
+With shared=True (several worker processes on one SQLiteStore) cursors are
+kept in the store instead: every change is saved through update(), and a
+worker rebuilds its live session whenever another worker saved a newer
+version. Undo history stays in the process that recorded it.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from .journal import AnswerJournal
+from .maintenance import CardMaintenance
+from .store import AksonCardsStore
+from .study import StudySession
+
+
+class SessionRegistry:
+    """Bounded, thread-safe map of session ID -> study session"""
+
+    def __init__(
+        self,
+        store: AksonCardsStore,
+        journal: Optional[AnswerJournal] = None,
+        maintenance: Optional[CardMaintenance] = None,
+        max_sessions: int = 1000,
+        max_live: int = 32,
+        ttl_seconds: float = 6 * 3600,
+        shared: bool = False
+    ):
+        self.store = store
+        self.journal = journal
+        self.maintenance = maintenance
+        self.max_sessions = max_sessions
+        self.max_live = max_live
+        self.ttl_seconds = ttl_seconds
+        # Cursors live in the store (SQLiteStore session table) for all processes
+        self.shared = shared
+
+        # session_id -> last access time, oldest first (LRU order)
+        self._access: "OrderedDict[str, float]" = OrderedDict()
+        # session_id -> cursor dict for sessions that are not live
+        self._cursors: dict = {}
+        # session_id -> StudySession, oldest first
+        self._live: "OrderedDict[str, StudySession]" = OrderedDict()
+        # session_id -> stored cursor version the live session matches (shared mode)
+        self._versions: dict = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def new_session_id() -> str:
+        """Generate an unguessable session ID"""
+        return uuid.uuid4().hex
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._access)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            self._evict_expired()
+            return session_id in self._access
+
+    def put(self, session_id: str, session: StudySession) -> None:
+        """Register (or replace) a live session"""
+        with self._lock:
+            self._cursors.pop(session_id, None)
+            self._live[session_id] = session
+            self._live.move_to_end(session_id)
+            self._touch(session_id)
+            self._evict()
+            if self.shared:
+                self.store.expire_session_cursors(self.ttl_seconds)
+                self._versions[session_id] = self.store.save_session_cursor(session_id, session.to_cursor())
+
+    def update(self, session_id: str) -> None:
+        """Save a session after it changed (answer, undo) so other workers see it"""
+        if not self.shared:
+            return
+        with self._lock:
+            session = self._live.get(session_id)
+            if session is not None:
+                self._versions[session_id] = self.store.save_session_cursor(session_id, session.to_cursor())
+
+    def get(self, session_id: str) -> Optional[StudySession]:
+        """Get a session, rehydrating it from its cursor if needed"""
+        if self.shared:
+            return self._get_shared(session_id)
+        with self._lock:
+            self._evict_expired()
+            if session_id not in self._access:
+                return None
+
+            session = self._live.get(session_id)
+            if session is None:
+                cursor = self._cursors.pop(session_id)
+                session = StudySession.from_cursor(
+                    self.store, cursor, journal=self.journal, maintenance=self.maintenance
+                )
+                self._live[session_id] = session
+            self._live.move_to_end(session_id)
+            self._touch(session_id)
+            self._evict()
+            return session
+
+    def _get_shared(self, session_id: str) -> Optional[StudySession]:
+        """Get a session from the store, reusing the live one while it is current"""
+        stored = self.store.load_session_cursor(session_id)
+        with self._lock:
+            if stored is None:
+                self._forget(session_id)
+                return None
+            version, cursor = stored
+            session = self._live.get(session_id)
+            if session is None or self._versions.get(session_id) != version:
+                # Another worker moved the session on (or it was never live here)
+                session = StudySession.from_cursor(
+                    self.store, cursor, journal=self.journal, maintenance=self.maintenance
+                )
+                self._live[session_id] = session
+                self._versions[session_id] = version
+            self._live.move_to_end(session_id)
+            self._touch(session_id)
+            self._evict()
+        self.store.touch_session_cursor(session_id)
+        return session
+
+    def refresh_cards(self, card_ids) -> None:
+        """
+        Bring sessions holding these cards up to date after they changed
+        outside a session (see study.apply_answer_batch)
+
+        Sessions kept as cursors reload their cards when rehydrated. In shared
+        mode the stored cursors are re-versioned instead, so every worker
+        rebuilds its live copy on next access.
+        """
+        card_ids = set(card_ids)
+        if not card_ids:
+            return
+        if self.shared:
+            self.store.invalidate_session_cursors(card_ids)
+            return
+        with self._lock:
+            sessions = [
+                session for session in self._live.values()
+                if any(card.id in card_ids for card in session.session_cards)
+            ]
+            if not sessions:
+                return
+            cards = self.store.get_cards_by_ids(card_ids)
+            for session in sessions:
+                session.refresh_cards(cards)
+
+    def pop(self, session_id: str) -> None:
+        """Forget a session"""
+        with self._lock:
+            self._forget(session_id)
+            if self.shared:
+                self.store.delete_session_cursor(session_id)
+
+    def _forget(self, session_id: str) -> None:
+        self._access.pop(session_id, None)
+        self._cursors.pop(session_id, None)
+        self._live.pop(session_id, None)
+        self._versions.pop(session_id, None)
+
+    def _touch(self, session_id: str) -> None:
+        self._access[session_id] = time.monotonic()
+        self._access.move_to_end(session_id)
+
+    def _evict_expired(self) -> None:
+        """Drop sessions idle for longer than the TTL (oldest are at the front)"""
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._access:
+            session_id, last_access = next(iter(self._access.items()))
+            if last_access > deadline:
+                break
+            # Local copy only: in shared mode the store expires cursors by its own access time
+            self._forget(session_id)
+
+    def _evict(self) -> None:
+        """Enforce the TTL, the total session bound and the live-object bound"""
+        self._evict_expired()
+        while len(self._access) > self.max_sessions:
+            session_id = next(iter(self._access))
+            self.pop(session_id)
+        while len(self._live) > self.max_live:
+            session_id, session = self._live.popitem(last=False)
+            if self.shared:
+                # The stored cursor is already current; rebuild from it next time
+                self._access.pop(session_id, None)
+                self._versions.pop(session_id, None)
+            else:
+                self._cursors[session_id] = session.to_cursor()
@@ -0,0 +1,678 @@
+"""
+SQLite storage backend for Akson Cards
+
+AksonCardsStore keeps every collection in a JSON file and serializes writes
+with an in-process lock, so only one process may use a data directory.
+SQLiteStore keeps the same documents as rows of one SQLite database in WAL
+mode, so several processes (web workers, the desktop app) can share it:
+
+    - transaction() is BEGIN IMMEDIATE, so writers in different processes
+      are serialized by the database; readers never block
+    - every write bumps a generation number; each process caches parsed
+      documents and revalidates them with one indexed read, so repeated
+      reads of an unchanged store never re-parse JSON
+    - cards and reviews, the collections that grow with use, are stored one
+      row per entity: a write touches only the rows it changes, and a cached
+      collection is refreshed by reading just the rows written since
+    - the change log is a table, so sequence numbers (and the ETags built
+      from them) are shared by all processes
+    - study session cursors and journaled answers are stored too, so any
+      worker can continue a session or flush another worker's answers
+
+JSON files already in the data directory are imported on first open.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import metrics
+from .journal import AnswerJournal
+from .models import Card, Review
+from .store import AksonCardsStore
+
+
+DB_NAME = "akson.sqlite3"
+
+# Collections kept one row per entity in the entities table; their
+# documents row only records the generation of the last write
+ENTITY_DOCUMENTS = frozenset({"cards.json", "reviews.json"})
+# Deleted entities stay as NULL rows (so caches see the deletion) until this many pile up
+TOMBSTONE_LIMIT = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entities (
+    document TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT,
+    generation INTEGER NOT NULL,
+    PRIMARY KEY (document, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entities_generation ON entities (document, generation);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    origin TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS changes_entity ON changes (kind, entity_id, seq);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    cursor TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY,
+    entry TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+"""
+
+
+def _encode(data) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str, separators=(',', ':'))
+
+
+class SQLiteStore(AksonCardsStore):
+    """
+    Process-safe AksonCardsStore backed by SQLite
+
+    Documents returned outside a transaction() are shared through the read
+    cache and must be treated as read-only; inside a transaction each load
+    returns a private copy that may be modified and saved. For cards and
+    reviews the copy is shallow: entries may be replaced or removed, but not
+    modified in place.
+    """
+
+    def __init__(self, data_dir: Path, timeout: float = 30.0):
+        super().__init__(data_dir)
+        self.db_path = self.data_dir / DB_NAME
+        self.timeout = timeout
+
+        # Per-thread connection and transaction state
+        self._local = threading.local()
+        # Document name -> (generation checked at, document generation, parsed data)
+        self._cache: Dict[str, tuple] = {}
+        self._cache_lock = threading.Lock()
+
+        self._connection().executescript(SCHEMA)
+        self._migrate_entity_documents()
+        self._import_json_files()
+
+    # Connections and transactions
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection (reopened after a fork)"""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(
+                self.db_path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Commits are fsynced: an acknowledged answer must survive a crash
+            conn.execute("PRAGMA synchronous=FULL")
+            local.conn = conn
+            local.pid = os.getpid()
+            local.depth = 0
+            local.writing = False
+            local.wrote = False
+            local.bases = {}
+        return local.conn
+
+    @contextmanager
+    def _begin(self, statement: str, writing: bool):
+        conn = self._connection()
+        local = self._local
+        if local.depth:
+            # Nested: join the open transaction
+            previous = local.writing
+            local.writing = previous or writing
+            local.depth += 1
+            try:
+                yield self
+            finally:
+                local.depth -= 1
+                local.writing = previous
+            return
+
+        conn.execute(statement)
+        local.depth = 1
+        local.writing = writing
+        # Whether this transaction bumped the generation (its reads must not be cached)
+        local.wrote = False
+        # Collection name -> entries its last private copy was taken from
+        local.bases = {}
+        try:
+            yield self
+        except BaseException:
+            local.depth = 0
+            local.writing = False
+            conn.execute("ROLLBACK")
+            raise
+        local.depth = 0
+        local.writing = False
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def transaction(self):
+        """Read-modify-write cycle holding the database write lock (all processes)"""
+        with self._lock:
+            with self._begin("BEGIN IMMEDIATE", writing=True):
+                yield self
+
+    @contextmanager
+    def snapshot(self):
+        """Consistent read of several documents without taking the write lock"""
+        with self._begin("BEGIN", writing=False):
+            yield self
+
+    # Documents
+    @staticmethod
+    def _document_name(filepath: Path) -> str:
+        return Path(filepath).name
+
+    def _current_generation(self) -> int:
+        return self._meta_value("generation")
+
+    def _meta_value(self, key: str) -> int:
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_meta_value(self, key: str, amount: int) -> int:
+        return self._connection().execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (key, amount)
+        ).fetchall()[0][0]
+
+    def _bump_generation(self) -> int:
+        """Allocate the generation of a write (call inside transaction())"""
+        self._local.wrote = True
+        return self._add_meta_value("generation", 1)
+
+    def _load_json(self, filepath: Path, default: dict = None) -> dict:
+        """Load a document (a private copy inside transaction(), else the cached one)"""
+        name = self._document_name(filepath)
+        if name in ENTITY_DOCUMENTS:
+            return self._load_entity_document(name, default)
+        conn = self._connection()
+
+        if self._local.writing:
+            row = conn.execute("SELECT data FROM documents WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return default or {}
+            metrics.record_read(name, len(row[0]))
+            return json.loads(row[0])
+
+        generation = self._current_generation()
+        with self._cache_lock:
+            hit = self._cache.get(name)
+        if hit and hit[0] == generation:
+            metrics.record_read(name)
+            return hit[2]
+
+        row = conn.execute("SELECT generation FROM documents WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return default or {}
+        parsed_bytes = 0
+        if hit and hit[1] == row[0]:
+            data = hit[2]
+            document_generation = row[0]
+        else:
+            row = conn.execute(
+                "SELECT data, generation FROM documents WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return default or {}
+            data = json.loads(row[0])
+            document_generation = row[1]
+            parsed_bytes = len(row[0])
+
+        with self._cache_lock:
+            self._cache[name] = (generation, document_generation, data)
+        metrics.record_read(name, parsed_bytes)
+        return data
+
+    def _save_json(self, filepath: Path, data: dict) -> None:
+        """Save a document and bump the store generation"""
+        name = self._document_name(filepath)
+        if name in ENTITY_DOCUMENTS:
+            self._save_entity_document(name, data)
+            return
+        text = _encode(data)
+        with self.transaction():
+            conn = self._connection()
+            generation = self._bump_generation()
+            conn.execute(
+                "INSERT INTO documents (name, data, generation) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, generation = excluded.generation",
+                (self._document_name(filepath), text, generation)
+            )
+        metrics.record_write(self._document_name(filepath), len(text))
+
+    def _file_signature(self, filepath: Path) -> Optional[tuple]:
+        """Generation of a document's last write (None if it was never written)"""
+        row = self._connection().execute(
+            "SELECT generation FROM documents WHERE name = ?", (self._document_name(filepath),)
+        ).fetchone()
+        return (row[0],) if row else None
+
+    # Per-entity collections
+    def _entity_snapshot(self, name: str) -> Optional[dict]:
+        """
+        Current {id: data} of a cards/reviews collection, shared through the read cache
+
+        A cached collection is brought up to date by parsing only the rows
+        written since it was built (a full read is needed only after deletion
+        markers it has not seen were purged). Returns None if the collection
+        was never written.
+        """
+        parsed_bytes = 0
+        with self.snapshot():
+            conn = self._connection()
+            generation = self._current_generation()
+            with self._cache_lock:
+                hit = self._cache.get(name)
+            if hit and hit[0] == generation:
+                metrics.record_read(name)
+                return hit[2]
+
+            row = conn.execute("SELECT generation FROM documents WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            document_generation = row[0]
+            if hit and hit[1] == document_generation:
+                data = hit[2]
+            elif hit and hit[1] >= self._meta_value(f"purged:{name}"):
+                # Copied: other threads may be reading the cached dict
+                data = dict(hit[2])
+                rows = conn.execute(
+                    "SELECT id, data FROM entities WHERE document = ? AND generation > ?", (name, hit[1])
+                )
+                for entity_id, text in rows:
+                    if text is None:
+                        data.pop(entity_id, None)
+                    else:
+                        data[entity_id] = json.loads(text)
+                        parsed_bytes += len(text)
+            else:
+                data = {}
+                rows = conn.execute(
+                    "SELECT id, data FROM entities WHERE document = ? AND data IS NOT NULL", (name,)
+                )
+                for entity_id, text in rows:
+                    data[entity_id] = json.loads(text)
+                    parsed_bytes += len(text)
+
+            # Rows written by this (uncommitted) transaction must not reach other readers
+            if not self._local.wrote:
+                with self._cache_lock:
+                    self._cache[name] = (generation, document_generation, data)
+        metrics.record_read(name, parsed_bytes)
+        return data
+
+    def _load_entity_document(self, name: str, default: Optional[dict]) -> dict:
+        data = self._entity_snapshot(name)
+        if data is None:
+            return default or {}
+        if not self._local.writing:
+            return data
+        # Saving the copy writes only the entries replaced or removed since
+        self._local.bases[name] = data
+        return dict(data)
+
+    def _save_entity_document(self, name: str, data: dict) -> None:
+        """Write the entries of a collection that differ from the last loaded copy"""
+        with self.transaction():
+            base = self._local.bases.get(name)
+            if base is None:
+                base = self._entity_snapshot(name) or {}
+            puts = [(entity_id, value) for entity_id, value in data.items() if base.get(entity_id) is not value]
+            deletes = [entity_id for entity_id in base if entity_id not in data]
+            self._write_entities(name, puts, deletes)
+            self._local.bases[name] = dict(data)
+
+    def _get_entities(self, name: str, entity_ids) -> Dict[str, dict]:
+        """Stored data of the given entities of a collection (missing IDs are left out)"""
+        wanted = set(entity_ids)
+        if not wanted:
+            return {}
+        if not self._local.writing:
+            data = self._entity_snapshot(name) or {}
+            return {entity_id: data[entity_id] for entity_id in wanted if entity_id in data}
+
+        rows = self._connection().execute(
+            "SELECT id, data FROM entities WHERE document = ? AND data IS NOT NULL "
+            "AND id IN (SELECT value FROM json_each(?))",
+            (name, json.dumps(list(wanted)))
+        ).fetchall()
+        metrics.record_read(name, sum(len(text) for _, text in rows))
+        return {entity_id: json.loads(text) for entity_id, text in rows}
+
+    def _write_entities(self, name: str, puts: List[Tuple[str, dict]], deletes: List[str]) -> None:
+        """Upsert and delete rows of a collection under one new generation"""
+        if not puts and not deletes:
+            return
+        with self.transaction():
+            conn = self._connection()
+            generation = self._bump_generation()
+            rows = [(name, entity_id, _encode(value), generation) for entity_id, value in puts]
+            conn.executemany(
+                "INSERT INTO entities (document, id, data, generation) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(document, id) DO UPDATE SET data = excluded.data, generation = excluded.generation",
+                rows
+            )
+            if deletes:
+                conn.executemany(
+                    "UPDATE entities SET data = NULL, generation = ? WHERE document = ? AND id = ?",
+                    ((generation, name, entity_id) for entity_id in deletes)
+                )
+                if self._add_meta_value(f"tombstones:{name}", len(deletes)) >= TOMBSTONE_LIMIT:
+                    # Caches built before this generation can no longer see
+                    # every deletion; they reload the collection in full
+                    conn.execute("DELETE FROM entities WHERE document = ? AND data IS NULL", (name,))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"purged:{name}", generation)
+                    )
+                    conn.execute("UPDATE meta SET value = 0 WHERE key = ?", (f"tombstones:{name}",))
+            conn.execute(
+                "INSERT INTO documents (name, data, generation) VALUES (?, '', ?) "
+                "ON CONFLICT(name) DO UPDATE SET generation = excluded.generation",
+                (name, generation)
+            )
+            # A private copy loaded earlier no longer matches the stored rows
+            self._local.bases.pop(name, None)
+        metrics.record_write(name, sum(len(row[2]) for row in rows))
+
+    def _migrate_entity_documents(self) -> None:
+        """Split cards/reviews documents written by older versions into entity rows"""
+        conn = self._connection()
+        names = [
+            name for name in ENTITY_DOCUMENTS
+            if conn.execute("SELECT 1 FROM documents WHERE name = ? AND data != ''", (name,)).fetchone()
+        ]
+        if not names:
+            return
+        with self.transaction():
+            for name in names:
+                # Another process may have migrated while this one waited for the lock
+                row = conn.execute(
+                    "SELECT data, generation FROM documents WHERE name = ? AND data != ''", (name,)
+                ).fetchone()
+                if row is None:
+                    continue
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entities (document, id, data, generation) VALUES (?, ?, ?, ?)",
+                    ((name, entity_id, _encode(value), row[1]) for entity_id, value in json.loads(row[0]).items())
+                )
+                conn.execute("UPDATE documents SET data = '' WHERE name = ?", (name,))
+
+    # Cards and reviews, read and written by row
+    def get_card(self, card_id: str) -> Optional[Card]:
+        """Get a single card"""
+        return self.get_cards_by_ids([card_id]).get(card_id)
+
+    def get_cards_by_ids(self, card_ids) -> Dict[str, Card]:
+        """Get several cards (one indexed query inside a transaction)"""
+        data = self._get_entities(self._document_name(self.cards_file), card_ids)
+        return {card_id: Card.from_dict(card_data) for card_id, card_data in data.items()}
+
+    def save_cards(self, cards) -> None:
+        """Save or update several cards, writing only their rows"""
+        with self.transaction():
+            cards = list(cards)
+            self._write_entities(
+                self._document_name(self.cards_file), [(card.id, card.to_dict()) for card in cards], []
+            )
+            self._log_changes("card", (card.id for card in cards))
+
+    def delete_cards(self, card_ids) -> None:
+        """Delete cards, writing only their rows"""
+        name = self._document_name(self.cards_file)
+        with self.transaction():
+            deleted = list(self._get_entities(name, card_ids))
+            if not deleted:
+                return
+            self._write_entities(name, [], deleted)
+            self._log_changes("card", deleted, deleted=True)
+
+    def get_entity_data(self, kind: str, entity_ids=None) -> Dict[str, dict]:
+        """Stored data of one entity kind; cards and reviews are looked up by row"""
+        name = self._document_name(getattr(self, self.ENTITY_FILES[kind]))
+        if entity_ids is None or name not in ENTITY_DOCUMENTS:
+            return super().get_entity_data(kind, entity_ids)
+        return self._get_entities(name, entity_ids)
+
+    def get_reviews_by_ids(self, review_ids) -> Dict[str, Review]:
+        """Get several reviews (one indexed query inside a transaction)"""
+        data = self._get_entities(self._document_name(self.reviews_file), review_ids)
+        return {review_id: Review.from_dict(review_data) for review_id, review_data in data.items()}
+
+    def iter_card_reviews(self, card_ids):
+        """Yield the reviews of the given cards, oldest first, selected and ordered by SQLite"""
+        wanted = list(set(card_ids))
+        if not wanted:
+            return
+        rows = self._connection().execute(
+            "SELECT data FROM entities WHERE document = ? AND data IS NOT NULL "
+            "AND json_extract(data, '$.card_id') IN (SELECT value FROM json_each(?)) "
+            "ORDER BY json_extract(data, '$.timestamp')",
+            (self._document_name(self.reviews_file), json.dumps(wanted))
+        )
+        for (text,) in rows:
+            metrics.record_read(self._document_name(self.reviews_file), len(text))
+            yield Review.from_dict(json.loads(text))
+
+    def save_reviews(self, reviews) -> None:
+        """Save several reviews, writing only their rows"""
+        name = self._document_name(self.reviews_file)
+        with self.transaction():
+            reviews = list(reviews)
+            stored = self._get_entities(name, (review.id for review in reviews))
+            # Only count reviews not already stored (journal replays are idempotent)
+            added = [review for review in reviews if review.id not in stored]
+            self._write_entities(name, [(review.id, review.to_dict()) for review in added], [])
+            self._log_changes("review", (review.id for review in added))
+            self._update_review_counts(added)
+            self._update_review_rollups(added)
+
+    def delete_reviews(self, reviews) -> None:
+        """Retract reviews and their daily counter entries, writing only their rows"""
+        name = self._document_name(self.reviews_file)
+        with self.transaction():
+            reviews = list(reviews)
+            stored = self._get_entities(name, (review.id for review in reviews))
+            removed = [review for review in reviews if stored.pop(review.id, None) is not None]
+            if not removed:
+                return
+            self._write_entities(name, [], [review.id for review in removed])
+            self._log_changes("review", (review.id for review in removed), deleted=True)
+            self._update_review_counts(removed, delta=-1)
+            self._update_review_rollups(removed, delta=-1)
+
+    def _import_json_files(self) -> None:
+        """Copy an existing JSON store (documents and change log) into an empty database"""
+        conn = self._connection()
+        if conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone():
+            return
+        json_files = sorted(self.data_dir.glob("*.json"))
+        if not json_files and not self.changes_file.exists():
+            return
+
+        with self.transaction():
+            # Another process may have imported while this one waited for the lock
+            if conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone():
+                return
+            for path in json_files:
+                data = super()._load_json(path, None)
+                if data:
+                    self._save_json(path, data)
+            conn.executemany(
+                "INSERT OR IGNORE INTO changes (seq, kind, entity_id, op, origin) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (seq, kind, entity_id, "delete" if deleted else "put", origin)
+                    for seq, kind, entity_id, deleted, origin in super().iter_changes()
+                )
+            )
+
+    # Change log
+    def get_change_seq(self) -> int:
+        """Sequence number of the latest change, shared by every process"""
+        return self._connection().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def _log_changes(self, kind: str, entity_ids, deleted: bool = False) -> None:
+        """Append one change log row per entity (call inside transaction())"""
+        entity_ids = list(entity_ids)
+        op = "delete" if deleted else "put"
+        self._connection().executemany(
+            "INSERT INTO changes (kind, entity_id, op, origin) VALUES (?, ?, ?, ?)",
+            ((kind, entity_id, op, self._change_origin) for entity_id in entity_ids)
+        )
+        self._change_entries += len(entity_ids)
+        if self._change_entries >= self.CHANGE_LOG_COMPACT_MIN:
+            self.compact_changes()
+
+    def iter_changes(self, since: int = 0):
+        """Yield (seq, kind, id, deleted, origin) for every change after `since`, oldest first"""
+        rows = self._connection().execute(
+            "SELECT seq, kind, entity_id, op, origin FROM changes WHERE seq > ? ORDER BY seq", (since,)
+        )
+        for seq, kind, entity_id, op, origin in rows:
+            yield seq, kind, entity_id, op == "delete", origin
+
+    def compact_changes(self) -> int:
+        """Drop every change superseded by a later one for the same entity"""
+        with self.transaction():
+            removed = self._connection().execute(
+                "DELETE FROM changes WHERE seq < ("
+                "SELECT MAX(later.seq) FROM changes AS later "
+                "WHERE later.kind = changes.kind AND later.entity_id = changes.entity_id)"
+            ).rowcount
+        self._change_entries = 0
+        return removed
+
+    # Study session cursors
+    def load_session_cursor(self, session_id: str) -> Optional[Tuple[int, dict]]:
+        """Get (version, cursor) of a stored study session"""
+        row = self._connection().execute(
+            "SELECT version, cursor FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def save_session_cursor(self, session_id: str, cursor: dict) -> int:
+        """Store a study session's cursor, returning its new version"""
+        return self._connection().execute(
+            "INSERT INTO sessions (id, cursor, version, accessed) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET cursor = excluded.cursor, "
+            "version = sessions.version + 1, accessed = excluded.accessed RETURNING version",
+            (session_id, json.dumps(cursor, default=str), time.time())
+        ).fetchall()[0][0]
+
+    def touch_session_cursor(self, session_id: str) -> None:
+        self._connection().execute(
+            "UPDATE sessions SET accessed = ? WHERE id = ?", (time.time(), session_id)
+        )
+
+    def delete_session_cursor(self, session_id: str) -> None:
+        self._connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def expire_session_cursors(self, ttl_seconds: float) -> None:
+        """Delete sessions no process has used for ttl_seconds"""
+        self._connection().execute(
+            "DELETE FROM sessions WHERE accessed < ?", (time.time() - ttl_seconds,)
+        )
+
+    def invalidate_session_cursors(self, card_ids) -> None:
+        """Bump the version of every stored session holding one of these cards"""
+        self._connection().execute(
+            "UPDATE sessions SET version = version + 1 WHERE EXISTS ("
+            "SELECT 1 FROM json_each(sessions.cursor, '$.card_ids') AS held "
+            "WHERE held.value IN (SELECT value FROM json_each(?)))",
+            (json.dumps(list(card_ids)),)
+        )
+
+    # Answer journal
+    def append_journal_entries(self, entries: List[dict]) -> None:
+        conn = self._connection()
+        conn.executemany(
+            "INSERT INTO journal (entry) VALUES (?)",
+            ((json.dumps(entry, ensure_ascii=False, default=str),) for entry in entries)
+        )
+
+    def iter_journal_entries(self) -> Iterator[Tuple[int, dict]]:
+        rows = self._connection().execute("SELECT id, entry FROM journal ORDER BY id")
+        for entry_id, entry in rows:
+            yield entry_id, json.loads(entry)
+
+    def delete_journal_entries(self, up_to_id: int) -> None:
+        self._connection().execute("DELETE FROM journal WHERE id <= ?", (up_to_id,))
+
+    def count_journal_entries(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def last_journal_entry_id(self) -> int:
+        return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM journal").fetchone()[0]
+
+
+class SQLiteAnswerJournal(AnswerJournal):
+    """
+    AnswerJournal whose entries live in the SQLiteStore's journal table
+
+    Every worker appends to the same table and any worker's flush applies
+    all of it, so answers recorded by one process are never stranded when
+    another one serves the next request (or when a worker dies).
+    """
+
+    def _append(self, entry: dict) -> None:
+        # Committed (and fsynced) by SQLite before returning
+        self.store.append_journal_entries([entry])
+        with self._cond:
+            # Local count only wakes the background writer; the table is the journal
+            self._pending.append(entry)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def pending_count(self) -> int:
+        return self.store.count_journal_entries()
+
+    @property
+    def seq(self) -> int:
+        # IDs only restart after a flush, which moves the change sequence on
+        return self.store.last_journal_entry_id()
+
+    def flush(self) -> int:
+        """
+        Apply every journaled answer (from all processes) to the store
+
+        Returns:
+            Number of entries applied
+        """
+        with self._flush_lock:
+            with self._cond:
+                self._pending = []
+            with self.store.transaction():
+                rows = list(self.store.iter_journal_entries())
+                if not rows:
+                    return 0
+                self._apply([entry for _, entry in rows])
+                self.store.delete_journal_entries(rows[-1][0])
+            return len(rows)
+
+    def recover(self) -> int:
+        """Replay file journals left by the JSON store, then the journal table"""
+        return super().recover() + self.flush()
@@ -4,17 +4,40 @@ Persists decks, notes, cards, and reviews to JSON files
 """
 
 import json
+import os
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional
-from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import date, datetime, timedelta
 import uuid
 
+from . import metrics
+from .ids import new_id
 from .models import Deck, Note, Card, Review, NoteModel
 
 
 class AksonCardsStore:
     """JSON-based storage for Akson Cards"""
     
+    # One change log entry in this many is indexed by byte offset
+    CHANGE_INDEX_STRIDE = 256
+    # The change log is compacted when it has grown by at least this many
+    # entries, and by as many as it held after the last compaction
+    CHANGE_LOG_COMPACT_MIN = 10000
+    
+    # Days of per-deck review counters kept in the counter index
+    REVIEW_COUNT_RETENTION_DAYS = 7
+    # Entity kind (as named in the change log) -> file attribute holding it
+    ENTITY_FILES = {
+        "model": "models_file",
+        "deck": "decks_file",
+        "note": "notes_file",
+        "card": "cards_file",
+        "review": "reviews_file",
+    }
+    
     def __init__(self, data_dir: Path):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
@@ -25,21 +48,215 @@ class AksonCardsStore:
         self.cards_file = self.data_dir / "cards.json"
         self.reviews_file = self.data_dir / "reviews.json"
         self.models_file = self.data_dir / "models.json"
+        # Per-deck, per-day review counters: {deck_id: {"YYYY-MM-DD": {"new": n, "review": n, ...}}}
+        self.review_counts_file = self.data_dir / "review_counts.json"
+        # Full-history daily review rollups for analytics: {"YYYY-MM-DD": {deck_id: {...}}}
+        self.review_rollups_file = self.data_dir / "review_rollups.json"
+        # Images and other media referenced from note fields
+        self.media_dir = self.data_dir / "media"
+        # State of the leech/sibling maintenance job (see maintenance.CardMaintenance)
+        self.maintenance_file = self.data_dir / "maintenance.json"
+        # Progress of sync.SyncClient, per server: {url: {"pushed_seq": n, ...}}
+        self.sync_state_file = self.data_dir / "sync_state.json"
+        # Append-only change log: one "seq<TAB>kind<TAB>id<TAB>op<TAB>origin" line per change
+        self.changes_file = self.data_dir / "changes.log"
+        
+        # Last change sequence number, entry count and a sparse seq -> byte
+        # offset index of the log (loaded from the log on first use)
+        self._change_seq: Optional[int] = None
+        self._change_index_seqs: List[int] = []
+        self._change_index_offsets: List[int] = []
+        self._change_entries = 0
+        # Entries left by the last compaction (or found at load)
+        self._changes_compacted_at = 0
+        # Peer whose changes are being applied (see sync.apply_changes);
+        # recorded in the log so they are not sent back to that peer
+        self._change_origin = ""
+        
+        # Note ID -> sibling card IDs, rebuilt when the cards file changes
+        self._note_card_index: Optional[Dict[str, List[str]]] = None
+        self._note_card_index_signature: Optional[tuple] = None
+        
+        # Serializes read-modify-write cycles (request threads and the
+        # answer journal's background writer share one store)
+        self._lock = threading.RLock()
+    
+    @contextmanager
+    def transaction(self):
+        """Hold the store lock across several reads and writes"""
+        with self._lock:
+            yield self
+    
+    @contextmanager
+    def snapshot(self):
+        """Read several files consistently (no writes may happen inside)"""
+        with self._lock:
+            yield self
+    
+    @contextmanager
+    def change_origin(self, origin: str):
+        """Log the changes written inside the block as coming from peer `origin`"""
+        with self.transaction():
+            previous_origin = self._change_origin
+            self._change_origin = origin
+            try:
+                yield self
+            finally:
+                self._change_origin = previous_origin
+    
+    @staticmethod
+    def new_id(prefix: str = "") -> str:
+        """Allocate a unique, time-ordered entity ID (see ids.new_id)"""
+        return new_id(prefix)
+    
+    # Change log
+    def get_change_seq(self) -> int:
+        """Sequence number of the latest change (0 for a store without changes)"""
+        with self._lock:
+            self._load_change_index()
+            return self._change_seq
+    
+    def _load_change_index(self) -> None:
+        """Read the log once per process: latest seq plus a sparse seq -> byte offset index"""
+        if self._change_seq is not None:
+            return
+        self._change_seq = 0
+        self._change_index_seqs = []
+        self._change_index_offsets = []
+        self._change_entries = 0
+        if not self.changes_file.exists():
+            return
+        offset = 0
+        with open(self.changes_file, 'r+b') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A torn final line from a crash mid-append; cut it off
+                    # so the next append starts on a fresh line
+                    f.truncate(offset)
+                    break
+                self._index_change(int(line.split(b"\t", 1)[0]), offset)
+                offset += len(line)
+        self._changes_compacted_at = self._change_entries
+    
+    def _index_change(self, seq: int, offset: int) -> None:
+        """Account for one entry written at `offset` (every CHANGE_INDEX_STRIDE-th is indexed)"""
+        if self._change_entries % self.CHANGE_INDEX_STRIDE == 0:
+            self._change_index_seqs.append(seq)
+            self._change_index_offsets.append(offset)
+        self._change_entries += 1
+        self._change_seq = seq
+    
+    def _log_changes(self, kind: str, entity_ids: Iterable[str], deleted: bool = False) -> None:
+        """Append one change log entry per entity (call with the store lock held)"""
+        entity_ids = list(entity_ids)
+        if not entity_ids:
+            return
+        self._load_change_index()
+        seq = self._change_seq
+        op = "delete" if deleted else "put"
+        lines = []
+        for entity_id in entity_ids:
+            seq += 1
+            lines.append((seq, f"{seq}\t{kind}\t{entity_id}\t{op}\t{self._change_origin}\n".encode('utf-8')))
+        with open(self.changes_file, 'ab') as f:
+            offset = f.tell()
+            f.write(b"".join(line for _, line in lines))
+        for seq, line in lines:
+            self._index_change(seq, offset)
+            offset += len(line)
+        self._maybe_compact_changes()
+    
+    def iter_changes(self, since: int = 0):
+        """Yield (seq, kind, id, deleted, origin) for every change after `since`, oldest first"""
+        with self._lock:
+            self._load_change_index()
+            if not self.changes_file.exists():
+                return
+            # Start at the last indexed entry at or before `since`. The file is
+            # opened under the lock, so a compaction cannot move the offset.
+            block = bisect_right(self._change_index_seqs, since) - 1
+            f = open(self.changes_file, 'rb')
+            f.seek(self._change_index_offsets[block] if block >= 0 else 0)
+        with f:
+            for line in f:
+                parts = line.decode('utf-8').rstrip("\n").split("\t")
+                if len(parts) != 5:
+                    # A line still being appended
+                    continue
+                seq = int(parts[0])
+                if seq > since:
+                    yield seq, parts[1], parts[2], parts[3] == "delete", parts[4]
+    
+    def _maybe_compact_changes(self) -> None:
+        """Compact once the log has grown by as many entries as it held after the last compaction"""
+        grown = self._change_entries - self._changes_compacted_at
+        if grown >= max(self.CHANGE_LOG_COMPACT_MIN, self._changes_compacted_at):
+            self.compact_changes()
+    
+    def compact_changes(self) -> int:
+        """
+        Drop change log entries superseded by a later change to the same entity
+        
+        A peer syncing from any point still gets every entity's latest change
+        (deletions included), because that entry always has the highest seq.
+        
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            self._load_change_index()
+            if not self.changes_file.exists():
+                return 0
+            latest: Dict[Tuple[str, str], int] = {}
+            for seq, kind, entity_id, _, _ in self.iter_changes():
+                latest[(kind, entity_id)] = seq
+            
+            before = self._change_entries
+            last_seq = self._change_seq
+            self._change_index_seqs = []
+            self._change_index_offsets = []
+            self._change_entries = 0
+            tmp_path = self.changes_file.with_name(self.changes_file.name + ".tmp")
+            offset = 0
+            with open(tmp_path, 'wb') as out:
+                for seq, kind, entity_id, deleted, origin in self.iter_changes():
+                    if latest[(kind, entity_id)] != seq:
+                        continue
+                    op = "delete" if deleted else "put"
+                    line = f"{seq}\t{kind}\t{entity_id}\t{op}\t{origin}\n".encode('utf-8')
+                    self._index_change(seq, offset)
+                    offset += len(line)
+                    out.write(line)
+            os.replace(tmp_path, self.changes_file)
+            # The newest entry always survives, but keep the seq even for an empty log
+            self._change_seq = last_seq
+            self._changes_compacted_at = self._change_entries
+            return before - self._change_entries
     
     def _load_json(self, filepath: Path, default: dict = None) -> dict:
         """Load JSON file or return default"""
         if not filepath.exists():
             return default or {}
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(filepath, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw)
         except Exception:
             return default or {}
+        metrics.record_read(filepath.name, len(raw))
+        return data
     
     def _save_json(self, filepath: Path, data: dict) -> None:
-        """Save JSON file"""
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+        """Save JSON file (written to a temp file, then atomically replaced)"""
+        tmp_path = filepath.with_name(filepath.name + ".tmp")
+        # Compact output is encoded in one call by the C encoder; indent=2
+        # falls back to the pure-Python encoder, which dominates bulk writes
+        text = json.dumps(data, ensure_ascii=False, default=str, separators=(',', ':'))
+        raw = text.encode('utf-8')
+        with open(tmp_path, 'wb') as f:
+            f.write(raw)
+        os.replace(tmp_path, filepath)
+        metrics.record_write(filepath.name, len(raw))
     
     # Decks
     def get_decks(self) -> Dict[str, Deck]:
@@ -57,50 +274,55 @@ class AksonCardsStore:
     
     def save_deck(self, deck: Deck) -> None:
         """Save or update a deck"""
-        decks = self.get_decks()
-        decks[deck.id] = deck
-        self._save_json(self.decks_file, {
-            deck_id: deck.to_dict()
-            for deck_id, deck in decks.items()
-        })
+        self.save_decks([deck])
+    
+    def save_decks(self, decks: Iterable[Deck]) -> None:
+        """Save or update several decks with a single rewrite of the decks file"""
+        with self.transaction():
+            data = self._load_json(self.decks_file, {})
+            decks = list(decks)
+            for deck in decks:
+                data[deck.id] = deck.to_dict()
+            self._save_json(self.decks_file, data)
+            self._log_changes("deck", (deck.id for deck in decks))
+    
+    def get_deck_subtree(self, root_deck_id: str, decks: Optional[Dict[str, Deck]] = None) -> List[str]:
+        """Get a deck's ID followed by the IDs of all its descendants (breadth-first)"""
+        if decks is None:
+            decks = self.get_decks()
+        if root_deck_id not in decks:
+            return []
+        
+        children: Dict[str, List[str]] = {}
+        for deck in sorted(decks.values(), key=lambda d: (d.sort_order, d.name)):
+            if deck.parent_deck_id:
+                children.setdefault(deck.parent_deck_id, []).append(deck.id)
+        
+        subtree = [root_deck_id]
+        seen = {root_deck_id}
+        for deck_id in subtree:
+            for child_id in children.get(deck_id, []):
+                if child_id not in seen:
+                    seen.add(child_id)
+                    subtree.append(child_id)
+        return subtree
     
     def delete_deck(self, deck_id: str) -> None:
         """Delete a deck and all its notes/cards"""
-        decks = self.get_decks()
-        if deck_id in decks:
+        with self.transaction():
+            decks = self._load_json(self.decks_file, {})
+            if deck_id not in decks:
+                return
             del decks[deck_id]
-            self._save_json(self.decks_file, {
-                deck_id: deck.to_dict()
-                for deck_id, deck in decks.items()
-            })
+            self._save_json(self.decks_file, decks)
+            self._log_changes("deck", [deck_id], deleted=True)
             
             # Also delete associated notes and cards
-            notes = self.get_notes()
-            cards = self.get_cards()
-            
-            note_ids_to_delete = [
-                note_id for note_id, note in notes.items()
-                if note.deck_id == deck_id
-            ]
-            
-            for note_id in note_ids_to_delete:
-                del notes[note_id]
-                # Delete cards for this note
-                card_ids_to_delete = [
-                    card_id for card_id, card in cards.items()
-                    if card.note_id == note_id
-                ]
-                for card_id in card_ids_to_delete:
-                    del cards[card_id]
-            
-            self._save_json(self.notes_file, {
-                note_id: note.to_dict()
-                for note_id, note in notes.items()
-            })
-            self._save_json(self.cards_file, {
-                card_id: card.to_dict()
-                for card_id, card in cards.items()
-            })
+            notes = self._load_json(self.notes_file, {})
+            self.delete_notes([
+                note_id for note_id, note_data in notes.items()
+                if note_data.get("deck_id") == deck_id
+            ])
     
     # Notes
     def get_notes(self, deck_id: Optional[str] = None) -> Dict[str, Note]:
@@ -125,14 +347,69 @@ class AksonCardsStore:
         notes = self.get_notes()
         return notes.get(note_id)
     
+    def get_notes_by_ids(self, note_ids) -> Dict[str, Note]:
+        """Get several notes with a single read of the notes file"""
+        wanted = set(note_ids)
+        if not wanted:
+            return {}
+        data = self._load_json(self.notes_file, {})
+        return {
+            note_id: Note.from_dict(data[note_id])
+            for note_id in wanted
+            if note_id in data
+        }
+    
     def save_note(self, note: Note) -> None:
         """Save or update a note"""
-        notes = self.get_notes()
-        notes[note.id] = note
-        self._save_json(self.notes_file, {
-            note_id: note.to_dict()
-            for note_id, note in notes.items()
-        })
+        self.save_notes([note])
+    
+    def save_notes(self, notes: Iterable[Note]) -> None:
+        """Save or update several notes with a single rewrite of the notes file"""
+        with self.transaction():
+            data = self._load_json(self.notes_file, {})
+            notes = list(notes)
+            for note in notes:
+                data[note.id] = note.to_dict()
+            self._save_json(self.notes_file, data)
+            self._log_changes("note", (note.id for note in notes))
+    
+    def delete_notes(self, note_ids: Iterable[str]) -> None:
+        """Delete notes and their cards with one rewrite of each file"""
+        with self.transaction():
+            wanted = set(note_ids)
+            if not wanted:
+                return
+            notes = self._load_json(self.notes_file, {})
+            deleted_notes = [note_id for note_id in wanted if notes.pop(note_id, None) is not None]
+            self._save_json(self.notes_file, notes)
+            self._log_changes("note", deleted_notes, deleted=True)
+            
+            cards = self._load_json(self.cards_file, {})
+            self.delete_cards([
+                card_id for card_id, card_data in cards.items()
+                if card_data.get("note_id") in wanted
+            ])
+    
+    def add_notes(self, notes: Iterable[Note], cards: Iterable[Card]) -> None:
+        """
+        Save many notes and their cards in one transaction, with a single
+        rewrite of the notes file and of the cards file
+        """
+        with self.transaction():
+            notes = list(notes)
+            cards = list(cards)
+            notes_data = self._load_json(self.notes_file, {})
+            for note in notes:
+                notes_data[note.id] = note.to_dict()
+            
+            cards_data = self._load_json(self.cards_file, {})
+            for card in cards:
+                cards_data[card.id] = card.to_dict()
+            
+            self._save_json(self.notes_file, notes_data)
+            self._save_json(self.cards_file, cards_data)
+            self._log_changes("note", (note.id for note in notes))
+            self._log_changes("card", (card.id for card in cards))
     
     # Cards
     def get_cards(self, note_id: Optional[str] = None, deck_id: Optional[str] = None) -> Dict[str, Card]:
@@ -161,19 +438,156 @@ class AksonCardsStore:
         
         return cards
     
+    def get_note_card_index(self) -> Dict[str, List[str]]:
+        """
+        Map each note ID to the IDs of its cards (siblings)
+        
+        The index is built in one pass over the cards file and kept until the
+        file changes; callers must treat it as read-only.
+        """
+        signature = self._file_signature(self.cards_file)
+        with self._lock:
+            if self._note_card_index is None or signature != self._note_card_index_signature:
+                index: Dict[str, List[str]] = {}
+                for card_id, card_data in self._load_json(self.cards_file, {}).items():
+                    index.setdefault(card_data["note_id"], []).append(card_id)
+                self._note_card_index = index
+                self._note_card_index_signature = signature
+            return self._note_card_index
+    
+    @staticmethod
+    def _file_signature(filepath: Path) -> Optional[tuple]:
+        try:
+            stat = filepath.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def get_cards_by_deck(self, deck_ids) -> Dict[str, List[Card]]:
+        """Get the cards of several decks, grouped by deck, with one read of each file"""
+        wanted = set(deck_ids)
+        grouped: Dict[str, List[Card]] = {deck_id: [] for deck_id in wanted}
+        if not wanted:
+            return grouped
+        
+        notes = self._load_json(self.notes_file, {})
+        note_decks = {
+            note_id: note_data["deck_id"]
+            for note_id, note_data in notes.items()
+            if note_data.get("deck_id") in wanted
+        }
+        for card_data in self._load_json(self.cards_file, {}).values():
+            deck_id = note_decks.get(card_data.get("note_id"))
+            if deck_id is not None:
+                grouped[deck_id].append(Card.from_dict(card_data))
+        return grouped
+    
+    def iter_deck_cards(self, deck_ids) -> Iterator[Tuple[Note, Card]]:
+        """
+        Yield (note, card) pairs for the given decks, one note at a time
+        
+        Objects are built lazily as the caller consumes them, so streaming
+        responses never hold a whole deck of Note/Card objects.
+        """
+        wanted = set(deck_ids)
+        with self.snapshot():
+            notes = self._load_json(self.notes_file, {})
+            cards = self._load_json(self.cards_file, {})
+            index = self.get_note_card_index()
+        
+        for note_id, note_data in notes.items():
+            if note_data.get("deck_id") not in wanted:
+                continue
+            note = Note.from_dict(note_data)
+            for card_id in index.get(note_id, ()):
+                card_data = cards.get(card_id)
+                if card_data is not None:
+                    yield note, Card.from_dict(card_data)
+    
+    def iter_deck_entities(self, deck_ids) -> Iterator[Tuple[str, dict]]:
+        """
+        Yield ("deck" | "model" | "note" | "card" | "review", data) for
+        everything stored for the given decks, as raw to_dict() data
+        
+        Decks and the models they use come first, then each note followed by
+        its cards, then the cards' review history.
+        """
+        wanted = set(deck_ids)
+        with self.snapshot():
+            decks = self._load_json(self.decks_file, {})
+            notes = self._load_json(self.notes_file, {})
+            cards = self._load_json(self.cards_file, {})
+            index = self.get_note_card_index()
+        
+        for deck_id in deck_ids:
+            if deck_id in decks:
+                yield "deck", decks[deck_id]
+        
+        model_ids = {
+            note_data.get("model_id") for note_data in notes.values()
+            if note_data.get("deck_id") in wanted
+        }
+        for model in self.get_models().values():
+            if model.id in model_ids:
+                yield "model", model.to_dict()
+        
+        card_ids = set()
+        for note_id, note_data in notes.items():
+            if note_data.get("deck_id") not in wanted:
+                continue
+            yield "note", note_data
+            for card_id in index.get(note_id, ()):
+                card_data = cards.get(card_id)
+                if card_data is not None:
+                    card_ids.add(card_id)
+                    yield "card", card_data
+        # Drop the collection files before reading the review history
+        del notes, cards
+        
+        for review_data in self._load_json(self.reviews_file, {}).values():
+            if review_data.get("card_id") in card_ids:
+                yield "review", review_data
+    
     def get_card(self, card_id: str) -> Optional[Card]:
         """Get a single card"""
         cards = self.get_cards()
         return cards.get(card_id)
     
+    def get_cards_by_ids(self, card_ids) -> Dict[str, Card]:
+        """Get several cards with a single read of the cards file"""
+        wanted = set(card_ids)
+        if not wanted:
+            return {}
+        data = self._load_json(self.cards_file, {})
+        return {
+            card_id: Card.from_dict(data[card_id])
+            for card_id in wanted
+            if card_id in data
+        }
+    
     def save_card(self, card: Card) -> None:
         """Save or update a card"""
-        cards = self.get_cards()
-        cards[card.id] = card
-        self._save_json(self.cards_file, {
-            card_id: card.to_dict()
-            for card_id, card in cards.items()
-        })
+        self.save_cards([card])
+    
+    def save_cards(self, cards: Iterable[Card]) -> None:
+        """Save or update several cards with a single rewrite of the cards file"""
+        with self.transaction():
+            data = self._load_json(self.cards_file, {})
+            cards = list(cards)
+            for card in cards:
+                data[card.id] = card.to_dict()
+            self._save_json(self.cards_file, data)
+            self._log_changes("card", (card.id for card in cards))
+    
+    def delete_cards(self, card_ids: Iterable[str]) -> None:
+        """Delete cards with a single rewrite of the cards file"""
+        with self.transaction():
+            data = self._load_json(self.cards_file, {})
+            deleted = [card_id for card_id in set(card_ids) if data.pop(card_id, None) is not None]
+            if not deleted:
+                return
+            self._save_json(self.cards_file, data)
+            self._log_changes("card", deleted, deleted=True)
     
     def get_due_cards(self, deck_id: Optional[str] = None, limit: Optional[int] = None) -> List[Card]:
         """Get cards due for review"""
@@ -193,6 +607,43 @@ class AksonCardsStore:
         
         return due_cards
     
+    def get_deck_overview(self, now: Optional[datetime] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Card counts for every deck from one pass over the notes and cards files
+        
+        Works on the raw JSON (no Card objects are built), so the cost does not
+        depend on the number of decks.
+        
+        Returns:
+            Dict of deck_id -> {"total", "due", "new", "learning", "review",
+            "relearning"} (decks without cards included, with zero counts)
+        """
+        now = now or datetime.now()
+        with self.snapshot():
+            decks = self._load_json(self.decks_file, {})
+            notes = self._load_json(self.notes_file, {})
+            cards = self._load_json(self.cards_file, {})
+    
+        overview = {
+            deck_id: {"total": 0, "due": 0, "new": 0, "learning": 0, "review": 0, "relearning": 0}
+            for deck_id in decks
+        }
+        note_decks = {note_id: note_data.get("deck_id") for note_id, note_data in notes.items()}
+    
+        for card_data in cards.values():
+            counts = overview.get(note_decks.get(card_data.get("note_id")))
+            if counts is None:
+                continue
+            counts["total"] += 1
+            state = card_data.get("state", "new")
+            if state in counts:
+                counts[state] += 1
+            due = card_data.get("due")
+            if due and datetime.fromisoformat(due) <= now:
+                counts["due"] += 1
+    
+        return overview
+    
     # Reviews
     def get_reviews(self, card_id: Optional[str] = None) -> List[Review]:
         """Get all reviews, optionally filtered for a card"""
@@ -209,32 +660,245 @@ class AksonCardsStore:
         reviews.sort(key=lambda r: r.timestamp, reverse=True)
         return reviews
     
+    def get_reviews_by_ids(self, review_ids) -> Dict[str, Review]:
+        """Get several reviews with a single read of the reviews file"""
+        wanted = set(review_ids)
+        if not wanted:
+            return {}
+        data = self._load_json(self.reviews_file, {})
+        return {
+            review_id: Review.from_dict(data[review_id])
+            for review_id in wanted
+            if review_id in data
+        }
+    
+    def iter_card_reviews(self, card_ids) -> Iterator[Review]:
+        """
+        Yield the reviews of the given cards, oldest first
+        
+        Reviews of other cards are skipped as raw data, so only the selected
+        history is ever turned into Review objects.
+        """
+        wanted = set(card_ids)
+        if not wanted:
+            return
+        selected = [
+            review_data for review_data in self._load_json(self.reviews_file, {}).values()
+            if review_data.get("card_id") in wanted
+        ]
+        # isoformat() timestamps of naive datetimes sort chronologically
+        selected.sort(key=lambda review_data: review_data.get("timestamp") or "")
+        for review_data in selected:
+            yield Review.from_dict(review_data)
+    
     def save_review(self, review: Review) -> None:
         """Save a review"""
-        reviews = self.get_reviews()
-        reviews.append(review)
+        self.save_reviews([review])
+    
+    def save_reviews(self, reviews: Iterable[Review]) -> None:
+        """Save several reviews with a single rewrite of the reviews file"""
+        with self.transaction():
+            data = self._load_json(self.reviews_file, {})
+            # Only count reviews not already stored (journal replays are idempotent)
+            added = [review for review in reviews if review.id not in data]
+            for review in added:
+                data[review.id] = review.to_dict()
+            self._save_json(self.reviews_file, data)
+            self._log_changes("review", (review.id for review in added))
+            self._update_review_counts(added)
+            self._update_review_rollups(added)
+    
+    def delete_reviews(self, reviews: Iterable[Review]) -> None:
+        """Retract reviews (e.g. undone answers) and their daily counter entries"""
+        with self.transaction():
+            data = self._load_json(self.reviews_file, {})
+            removed = [review for review in reviews if data.pop(review.id, None) is not None]
+            if not removed:
+                return
+            self._save_json(self.reviews_file, data)
+            self._log_changes("review", (review.id for review in removed), deleted=True)
+            self._update_review_counts(removed, delta=-1)
+            self._update_review_rollups(removed, delta=-1)
+    
+    @staticmethod
+    def _review_count_bucket(card_state: Optional[str]) -> str:
+        """Map a card's pre-review state onto a daily counter"""
+        if card_state == "new":
+            return "new"
+        if card_state == "review":
+            return "review"
+        return "learning"
+    
+    def _update_review_counts(self, reviews: List[Review], delta: int = 1) -> None:
+        """Maintain the per-deck, per-day counter index for added (or removed) reviews"""
+        reviews = [r for r in reviews if r.deck_id]
+        if not reviews:
+            return
+        
+        counts = self._load_json(self.review_counts_file, {})
+        for review in reviews:
+            day = review.timestamp.date().isoformat()
+            day_counts = counts.setdefault(review.deck_id, {}).setdefault(day, {})
+            bucket = self._review_count_bucket(review.card_state)
+            day_counts[bucket] = max(0, day_counts.get(bucket, 0) + delta)
+        
+        # Drop days that can no longer affect a daily limit
+        cutoff = (date.today() - timedelta(days=self.REVIEW_COUNT_RETENTION_DAYS)).isoformat()
+        for deck_counts in counts.values():
+            for day in [d for d in deck_counts if d < cutoff]:
+                del deck_counts[day]
+        
+        self._save_json(self.review_counts_file, counts)
+    
+    def _update_review_rollups(self, reviews: List[Review], delta: int = 1) -> None:
+        """Maintain per-day, per-deck rollups (ratings, time spent, card states)"""
+        rollups = self._load_json(self.review_rollups_file, {})
+        if rollups.get(self.ROLLUPS_VERSION_KEY) != self.ROLLUPS_VERSION:
+            # Missing, or started before the history was backfilled: rebuild
+            # from the whole log (which already includes `reviews`)
+            rollups = {self.ROLLUPS_VERSION_KEY: self.ROLLUPS_VERSION}
+            reviews = self.get_reviews()
+            delta = 1
+        elif not reviews:
+            return
+        
+        for review in reviews:
+            day = review.timestamp.date().isoformat()
+            bucket = rollups.setdefault(day, {}).setdefault(review.deck_id or "", {})
+            bucket_state = self._review_count_bucket(review.card_state)
+            
+            updates = {
+                "count": delta,
+                str(review.rating): delta,
+                bucket_state: delta,
+                "time_ms": delta * (review.response_time_ms or 0)
+            }
+            # Lapses among mature reviews drive true retention, overall
+            # and by interval since the previous review
+            if bucket_state == "review":
+                if review.rating == 1:
+                    updates["review_again"] = delta
+                if review.elapsed_days is not None:
+                    interval_key = f"ivl_{self._interval_bucket(review.elapsed_days)}"
+                    updates[interval_key] = delta
+                    if review.rating == 1:
+                        updates[interval_key + "_again"] = delta
+            
+            for key, value in updates.items():
+                bucket[key] = max(0, bucket.get(key, 0) + value)
         
-        # Convert to dict with IDs as keys
-        reviews_dict = {r.id: r.to_dict() for r in reviews}
-        self._save_json(self.reviews_file, reviews_dict)
+        self._save_json(self.review_rollups_file, rollups)
+    
+    # Upper bounds (days since previous review) of the rollup interval buckets
+    INTERVAL_BUCKET_BOUNDS = (1, 2, 6, 13, 29, 89)
+    
+    @classmethod
+    def _interval_bucket(cls, elapsed_days: int) -> int:
+        """Index of the interval bucket a review falls into"""
+        for index, bound in enumerate(cls.INTERVAL_BUCKET_BOUNDS):
+            if elapsed_days <= bound:
+                return index
+        return len(cls.INTERVAL_BUCKET_BOUNDS)
+    
+    # Marks a rollups document built from the full review history; documents
+    # without it (or with an older version) are rebuilt on next use
+    ROLLUPS_VERSION_KEY = "version"
+    ROLLUPS_VERSION = 1
+    
+    def rebuild_review_rollups(self) -> None:
+        """Recompute the rollups from the full review log"""
+        with self.transaction():
+            self._save_json(self.review_rollups_file, {})
+            self._update_review_rollups([])
+    
+    def get_review_rollups(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """Get the daily review rollups: {"YYYY-MM-DD": {deck_id: {counter: value}}}"""
+        rollups = self._load_json(self.review_rollups_file, {})
+        if rollups.get(self.ROLLUPS_VERSION_KEY) != self.ROLLUPS_VERSION:
+            self.rebuild_review_rollups()
+            rollups = self._load_json(self.review_rollups_file, {})
+        return {day: decks for day, decks in rollups.items() if day != self.ROLLUPS_VERSION_KEY}
+    
+    def get_review_counts(self, deck_id: str, day: Optional[date] = None) -> Dict[str, int]:
+        """Get how many new/review/learning cards a deck has had reviewed on a day"""
+        return self.get_review_counts_many([deck_id], day)[deck_id]
+    
+    def get_review_counts_many(self, deck_ids, day: Optional[date] = None) -> Dict[str, Dict[str, int]]:
+        """Get a day's review counters for several decks with one read of the index"""
+        day = (day or date.today()).isoformat()
+        counts = self._load_json(self.review_counts_file, {})
+        result = {}
+        for deck_id in deck_ids:
+            day_counts = counts.get(deck_id, {}).get(day, {})
+            result[deck_id] = {
+                "new": day_counts.get("new", 0),
+                "review": day_counts.get("review", 0),
+                "learning": day_counts.get("learning", 0)
+            }
+        return result
+    
+    # Raw entity data (sync)
+    def get_entity_data(self, kind: str, entity_ids=None) -> Dict[str, dict]:
+        """
+        Stored data of one entity kind as {id: dict}, all of it or only the given IDs
+        
+        The full map may be shared with the store's read cache; callers must
+        treat it as read-only.
+        """
+        data = self._load_json(getattr(self, self.ENTITY_FILES[kind]), {})
+        if entity_ids is None:
+            return data
+        return {entity_id: data[entity_id] for entity_id in set(entity_ids) if entity_id in data}
+    
+    # Sync client state
+    def get_sync_state(self) -> dict:
+        """Get the saved sync progress of every server (a copy; {} before the first sync)"""
+        return dict(self._load_json(self.sync_state_file, {}))
+    
+    def save_sync_state(self, state: dict) -> None:
+        """Replace the saved sync progress"""
+        with self.transaction():
+            self._save_json(self.sync_state_file, state)
+    
+    # Maintenance job state
+    def get_maintenance_state(self) -> dict:
+        """Get the saved state of the leech/sibling job (a copy; {} before its first run)"""
+        return dict(self._load_json(self.maintenance_file, {}))
+    
+    def save_maintenance_state(self, state: dict) -> None:
+        """Replace the saved state of the leech/sibling job"""
+        with self.transaction():
+            self._save_json(self.maintenance_file, state)
     
     # Note Models
     def get_models(self) -> Dict[str, NoteModel]:
-        """Get all note models"""
+        """Get all note models (adding any missing default models)"""
         data = self._load_json(self.models_file, {})
         
-        # Initialize default models if empty
-        if not data:
-            default_models = self._get_default_models()
-            for model in default_models:
-                data[model.id] = model.to_dict()
-            self._save_json(self.models_file, data)
+        # Add default models that are missing (e.g. cloze in older stores)
+        if any(model.id not in data for model in self._get_default_models()):
+            with self.transaction():
+                data = self._load_json(self.models_file, {})
+                missing = [model for model in self._get_default_models() if model.id not in data]
+                for model in missing:
+                    data[model.id] = model.to_dict()
+                self._save_json(self.models_file, data)
         
         return {
             model_id: NoteModel.from_dict(model_data)
             for model_id, model_data in data.items()
         }
     
+    def save_models(self, models: Iterable[NoteModel]) -> None:
+        """Save or update several note models"""
+        with self.transaction():
+            data = self._load_json(self.models_file, {})
+            models = list(models)
+            for model in models:
+                data[model.id] = model.to_dict()
+            self._save_json(self.models_file, data)
+            self._log_changes("model", (model.id for model in models))
+    
     def _get_default_models(self) -> List[NoteModel]:
         """Create default note models"""
         basic_model = NoteModel(
@@ -255,5 +919,27 @@ class AksonCardsStore:
     background-color: white;
 }"""
         )
-        return [basic_model]
+        cloze_model = NoteModel(
+            id="cloze",
+            name="Cloze",
+            fields=["Text", "Back Extra"],
+            templates=[{
+                "id": "cloze-1",
+                "name": "Cloze",
+                "front": "{{cloze:Text}}",
+                "back": "{{cloze:Text}}\n\n<hr id=answer>\n\n{{Back Extra}}"
+            }],
+            css="""card {
+    font-family: arial;
+    font-size: 20px;
+    text-align: center;
+    color: black;
+    background-color: white;
+}
+.cloze {
+    font-weight: bold;
+    color: blue;
+}"""
+        )
+        return [basic_model, cloze_model]
 
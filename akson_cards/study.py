@@ -2,46 +2,185 @@
 Study session management for Akson Cards
 """
 
+from collections import deque
 from datetime import datetime
-from typing import List, Optional, Tuple
-import uuid
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+import heapq
 
-from .models import Card, Note, Deck, Review
-from .fsrs import FSRS, FSRSConfig, CardParams
+from .models import Card, Note, Deck, Review, NoteModel
+from .fsrs import FSRS, FSRSConfig, CardParams, format_interval
+from .ids import new_id
 from .store import AksonCardsStore
+from .journal import AnswerJournal
+from .maintenance import CardMaintenance
+from .templates import TemplateRenderer, split_answer
+
+
+# Card fields an answer changes, captured before each answer so it can be undone
+SCHEDULING_FIELDS = (
+    "stability", "difficulty", "reps", "lapses", "elapsed_days",
+    "due", "last_review", "state", "updated_at"
+)
+
+# Longest response time accepted from a client (one day)
+MAX_RESPONSE_TIME_MS = 24 * 60 * 60 * 1000
+
+
+def schedule_answer(
+    fsrs: FSRS,
+    card: Card,
+    note: Note,
+    rating: int,
+    response_time_ms: int,
+    answered_at: datetime,
+    review_id: Optional[str] = None
+) -> Review:
+    """
+    Apply one rating to a card in place and build its review record
+    
+    Args:
+        fsrs: Scheduler configured for the note's deck
+        card: Card being answered (updated in place)
+        note: The card's note
+        rating: 1=Again, 2=Hard, 3=Good, 4=Easy
+        response_time_ms: Time taken to answer
+        answered_at: When the card was answered (FSRS schedules from this time)
+        review_id: ID for the review record (a new one is allocated if omitted)
+    
+    Returns:
+        The review record (not yet saved)
+    """
+    previous_state = card.state
+    elapsed_days = max(0, (answered_at - card.last_review).days) if card.last_review else None
+    updated_params, next_due = fsrs.next_review(card.to_fsrs_params(), rating, answered_at)
+    
+    card.update_from_fsrs(updated_params)
+    card.due = next_due
+    
+    return Review(
+        id=review_id or new_id(),
+        card_id=card.id,
+        timestamp=answered_at,
+        rating=rating,
+        response_time_ms=response_time_ms,
+        deck_id=note.deck_id,
+        card_state=previous_state,
+        elapsed_days=elapsed_days
+    )
 
 
 class StudySession:
     """Manages an active study session"""
     
-    def __init__(self, store: AksonCardsStore, deck_id: Optional[str] = None):
+    # Number of upcoming cards whose payloads are rendered ahead of time
+    PREFETCH_AHEAD = 3
+    # Number of answers that can be undone
+    UNDO_DEPTH = 50
+    # Shared by all sessions so rendered cards are reused between them
+    renderer = TemplateRenderer()
+    
+    def __init__(
+        self,
+        store: AksonCardsStore,
+        deck_id: Optional[str] = None,
+        journal: Optional[AnswerJournal] = None,
+        deck_ids: Optional[Iterable[str]] = None,
+        include_subdecks: bool = False,
+        maintenance: Optional[CardMaintenance] = None,
+        skip_leeches: bool = False
+    ):
+        """
+        Args:
+            store: Card store to study from
+            deck_id: Deck to study (all decks if neither deck_id nor deck_ids is given)
+            journal: Optional write-behind journal for answers
+            deck_ids: Several decks to study as one merged queue
+            include_subdecks: Also study every descendant of the chosen deck(s)
+            maintenance: Leech/sibling job whose results filter the queue
+            skip_leeches: Leave flagged leeches out of the queue (they are
+                only flagged by default, see GET /api/leeches)
+        """
         self.store = store
         self.deck_id = deck_id
+        self.deck_ids: Optional[List[str]] = list(deck_ids) if deck_ids is not None else None
+        self.include_subdecks = include_subdecks
+        self.maintenance = maintenance
+        self.skip_leeches = skip_leeches
+        # When set, answers are written behind through the journal
+        self.journal = journal
         self.fsrs = FSRS()
         self.current_card_index = 0
         self.session_cards: List[Card] = []
         self.reviews_today: List[Review] = []
+        # Ratings given this session (survives cursor round-trips, unlike reviews_today)
+        self.ratings: List[int] = []
+        
+        # Notes for every session card, loaded once in start()
+        self._notes: Dict[str, Note] = {}
+        # Note models, loaded on first render
+        self._models: Optional[Dict[str, NoteModel]] = None
+        # Rendered card payloads keyed by card ID
+        self._payloads: Dict[str, dict] = {}
+        # Schedulers configured per deck, built on first use
+        self._schedulers: Dict[str, FSRS] = {}
+        # (pre-answer scheduling fields, review) per answer, newest last
+        self._undo_stack: Deque[Tuple[tuple, Review]] = deque(maxlen=self.UNDO_DEPTH)
         
     def start(self, limit: Optional[int] = None, new_limit: Optional[int] = None) -> bool:
         """
         Start a study session
         
+        Each deck's daily_new and daily_review_cap limits are enforced using
+        the store's per-day review counters, so cards already studied today
+        (in earlier sessions, on desktop or web) count against them. When
+        several decks are studied, their queues are merged by due date.
+        
         Args:
             limit: Maximum total cards to study
-            new_limit: Maximum new cards to introduce
+            new_limit: Maximum new cards to introduce (capped by each deck's daily limit)
         
         Returns:
             True if session started successfully
         """
-        # Get due cards
-        due_cards = self.store.get_due_cards(deck_id=self.deck_id, limit=limit)
+        # Make sure answers still in the journal are visible to the queue
+        if self.journal:
+            self.journal.flush()
+        
+        now = datetime.now()
+        
+        # Resolve the decks once, then read cards and counters once for all of them
+        decks = self.store.get_decks()
+        deck_ids = self._resolve_deck_ids(decks)
+        cards_by_deck = self.store.get_cards_by_deck(deck_ids)
+        counts = self.store.get_review_counts_many(deck_ids)
+        
+        # Leeches and siblings buried today stay out of the queue
+        excluded = set()
+        if self.maintenance:
+            self.maintenance.run()
+            excluded = self.maintenance.get_excluded(include_leeches=self.skip_leeches)
+        
+        new_queues = []
+        review_queues = []
+        for deck_id in deck_ids:
+            deck = decks[deck_id]
+            self._schedulers[deck_id] = FSRS(FSRSConfig(request_retention=deck.request_retention))
+            deck_cards = [c for c in cards_by_deck.get(deck_id, []) if c.id not in excluded]
+            deck_new, deck_reviews = self._deck_queues(deck, deck_cards, counts[deck_id], now)
+            new_queues.append(deck_new)
+            review_queues.append(deck_reviews)
+        
+        # k-way merge of the per-deck queues (each is already sorted)
+        new_cards = list(heapq.merge(*new_queues, key=lambda c: c.created_at))
+        review_cards = list(heapq.merge(*review_queues, key=lambda c: c.due))
         
-        # Separate new vs review cards
-        new_cards = [c for c in due_cards if c.state == "new"]
-        review_cards = [c for c in due_cards if c.state != "new"]
+        # Bury siblings within the session: at most one card per note,
+        # due reviews taking precedence over new cards
+        seen_notes = set()
+        review_cards = self._first_card_per_note(review_cards, seen_notes)
+        new_cards = self._first_card_per_note(new_cards, seen_notes)
         
-        # Limit new cards if specified
-        if new_limit and len(new_cards) > new_limit:
+        if new_limit is not None:
             new_cards = new_cards[:new_limit]
         
         # Interleave: one new, then reviews
@@ -64,22 +203,177 @@ class StudySession:
             if new_idx >= len(new_cards) and review_idx >= len(review_cards):
                 break
         
+        if limit:
+            self.session_cards = self.session_cards[:limit]
+        
         self.current_card_index = 0
+        
+        # Fetch every note the session needs in one batched lookup
+        self._notes = self.store.get_notes_by_ids(
+            card.note_id for card in self.session_cards
+        )
+        self._payloads = {}
+        self._prefetch()
+        
         return len(self.session_cards) > 0
     
+    def card_payload(self, card: Card, note: Note) -> dict:
+        """Build the front/back payload served to study UIs"""
+        if self._models is None:
+            self._models = self.store.get_models()
+        
+        model = self._models.get(note.model_id)
+        rendered = self.renderer.render_card(card, note, model) if model else None
+        if rendered is None:
+            # Notes whose model is gone still show their raw fields
+            return {
+                "id": card.id,
+                "front": note.fields.get("Front", ""),
+                "back": note.fields.get("Back", ""),
+                "state": card.state
+            }
+        
+        question, answer = rendered
+        # The answer template repeats the front ({{FrontSide}}, or the cloze
+        # text with its deletion revealed) above <hr id=answer>. UIs show the
+        # front above the back, so serve the two parts separately.
+        revealed_front, back = split_answer(answer)
+        return {
+            "id": card.id,
+            "front": question,
+            "front_revealed": revealed_front or question,
+            "back": back,
+            "answer": answer,
+            "state": card.state
+        }
+    
+    def _prefetch(self) -> None:
+        """Render payloads (with rating previews) for the current card and the next few cards"""
+        end = min(self.current_card_index + 1 + self.PREFETCH_AHEAD, len(self.session_cards))
+        
+        # Group the cards still missing a payload by deck so each deck's
+        # scheduler previews its cards in one batch
+        pending: Dict[str, List[Card]] = {}
+        for card in self.session_cards[self.current_card_index:end]:
+            if card.id in self._payloads:
+                continue
+            note = self._notes.get(card.note_id)
+            if note:
+                pending.setdefault(note.deck_id, []).append(card)
+        
+        now = datetime.now()
+        for deck_id, cards in pending.items():
+            outcomes = self._scheduler_for(deck_id).preview_ratings(
+                [card.to_fsrs_params() for card in cards], now
+            )
+            for card, card_outcomes in zip(cards, outcomes):
+                payload = self.card_payload(card, self._notes[card.note_id])
+                payload["previews"] = {
+                    str(rating): {
+                        "interval": format_interval(next_due - now),
+                        "due": next_due.isoformat()
+                    }
+                    for rating, (_, next_due) in card_outcomes.items()
+                }
+                self._payloads[card.id] = payload
+    
+    def _resolve_deck_ids(self, decks: Dict[str, Deck]) -> List[str]:
+        """Work out which existing decks the session covers"""
+        if self.deck_ids is not None:
+            roots = self.deck_ids
+        elif self.deck_id:
+            roots = [self.deck_id]
+        else:
+            return list(decks)
+        
+        if not self.include_subdecks:
+            return [deck_id for deck_id in dict.fromkeys(roots) if deck_id in decks]
+        
+        resolved: List[str] = []
+        for root_id in roots:
+            resolved.extend(self.store.get_deck_subtree(root_id, decks))
+        return list(dict.fromkeys(resolved))
+    
+    @staticmethod
+    def _first_card_per_note(cards: List[Card], seen_notes: set) -> List[Card]:
+        """Keep the first card of each note not already in seen_notes"""
+        kept = []
+        for card in cards:
+            if card.note_id in seen_notes:
+                continue
+            seen_notes.add(card.note_id)
+            kept.append(card)
+        return kept
+    
+    @staticmethod
+    def _deck_queues(
+        deck: Deck,
+        cards: List[Card],
+        done_today: Dict[str, int],
+        now: datetime
+    ) -> Tuple[List[Card], List[Card]]:
+        """
+        Build one deck's queues within what is left of its daily limits
+        
+        Returns:
+            (new cards oldest first, due cards earliest first); learning
+            steps are never capped
+        """
+        new_allowance = max(0, deck.daily_new - done_today["new"])
+        review_allowance = max(0, deck.daily_review_cap - done_today["review"])
+        
+        new_cards = sorted(
+            (c for c in cards if c.state == "new"),
+            key=lambda c: c.created_at
+        )[:new_allowance]
+        
+        due_cards = []
+        for card in sorted(
+            (c for c in cards if c.state != "new" and c.due and c.due <= now),
+            key=lambda c: c.due
+        ):
+            if card.state == "review":
+                if review_allowance <= 0:
+                    continue
+                review_allowance -= 1
+            due_cards.append(card)
+        
+        return new_cards, due_cards
+    
+    def _scheduler_for(self, deck_id: str) -> FSRS:
+        """Get the FSRS scheduler for a deck's configuration"""
+        fsrs = self._schedulers.get(deck_id)
+        if fsrs is None:
+            deck = self.store.get_deck(deck_id)
+            config = FSRSConfig(request_retention=deck.request_retention if deck else 0.9)
+            fsrs = FSRS(config)
+            self._schedulers[deck_id] = fsrs
+        return fsrs
+    
     def get_current_card(self) -> Optional[Tuple[Card, Note]]:
         """Get current card and its note"""
         if self.current_card_index >= len(self.session_cards):
             return None
         
         card = self.session_cards[self.current_card_index]
-        note = self.store.get_note(card.note_id)
+        note = self._notes.get(card.note_id)
         
         if not note:
             return None
         
         return (card, note)
     
+    def get_current_payload(self) -> Optional[dict]:
+        """Get the prefetched payload for the current card"""
+        if self.current_card_index >= len(self.session_cards):
+            return None
+        
+        card = self.session_cards[self.current_card_index]
+        if card.id not in self._payloads:
+            self._prefetch()
+        
+        return self._payloads.get(card.id)
+    
     def answer_card(self, rating: int, response_time_ms: int = 0) -> Optional[Tuple[Card, Note]]:
         """
         Submit an answer and move to next card
@@ -95,44 +389,101 @@ class StudySession:
             return None
         
         card = self.session_cards[self.current_card_index]
-        note = self.store.get_note(card.note_id)
+        note = self._notes.get(card.note_id)
         
         if not note:
             return None
         
-        # Get deck config
-        deck = self.store.get_deck(note.deck_id)
-        config = FSRSConfig(request_retention=deck.request_retention if deck else 0.9)
-        fsrs = FSRS(config)
+        # Get deck scheduler (deck config is read once per session)
+        fsrs = self._scheduler_for(note.deck_id)
         
-        # Convert to FSRS params
-        fsrs_params = card.to_fsrs_params()
+        snapshot = tuple(getattr(card, name) for name in SCHEDULING_FIELDS)
         
         # Process review
-        updated_params, next_due = fsrs.next_review(fsrs_params, rating, datetime.now())
-        
-        # Update card
-        card.update_from_fsrs(updated_params)
-        card.due = next_due
-        self.store.save_card(card)
-        
-        # Save review record
-        review = Review(
-            id=str(uuid.uuid4()),
-            card_id=card.id,
-            timestamp=datetime.now(),
-            rating=rating,
-            response_time_ms=response_time_ms
-        )
-        self.store.save_review(review)
+        review = schedule_answer(fsrs, card, note, rating, response_time_ms, datetime.now())
+        if self.journal:
+            self.journal.record_answer(card, review)
+        else:
+            self.store.save_card(card)
+            self.store.save_review(review)
         self.reviews_today.append(review)
+        self.ratings.append(rating)
+        self._undo_stack.append((snapshot, review))
         
         # Move to next card
+        self._payloads.pop(card.id, None)
         self.current_card_index += 1
+        self._prefetch()
         
         # Return next card
         return self.get_current_card()
     
+    def can_undo(self) -> bool:
+        """Check if there is an answer that can be undone"""
+        return bool(self._undo_stack) and self.current_card_index > 0
+    
+    def undo(self) -> Optional[Tuple[Card, Note]]:
+        """
+        Undo the most recent answer
+        
+        Restores the card's scheduling state, retracts its review record and
+        steps back so the card is shown again.
+        
+        Returns:
+            The restored card and note, or None if there is nothing to undo
+        """
+        if not self.can_undo():
+            return None
+        
+        snapshot, review = self._undo_stack.pop()
+        self.current_card_index -= 1
+        card = self.session_cards[self.current_card_index]
+        for name, value in zip(SCHEDULING_FIELDS, snapshot):
+            setattr(card, name, value)
+        
+        if self.journal:
+            self.journal.record_undo(card, review)
+        else:
+            self.store.save_card(card)
+            self.store.delete_reviews([review])
+        
+        if self.reviews_today and self.reviews_today[-1].id == review.id:
+            self.reviews_today.pop()
+        if self.ratings:
+            self.ratings.pop()
+        
+        # Previews for the restored card must reflect its old state
+        self._payloads.pop(card.id, None)
+        self._prefetch()
+        
+        return self.get_current_card()
+    
+    def refresh_cards(self, cards: Dict[str, Card]) -> bool:
+        """
+        Take the scheduling state of cards changed outside this session
+        
+        Answers applied by apply_answer_batch() would otherwise be overwritten
+        when this session answers (or undoes) the same cards from stale copies.
+        The undo history is dropped, since it could restore pre-batch state.
+        
+        Returns:
+            Whether any session card was refreshed
+        """
+        refreshed = False
+        for card in self.session_cards:
+            fresh = cards.get(card.id)
+            if fresh is None:
+                continue
+            for name in SCHEDULING_FIELDS:
+                setattr(card, name, getattr(fresh, name))
+            self._payloads.pop(card.id, None)
+            refreshed = True
+        
+        if refreshed:
+            self._undo_stack.clear()
+            self._prefetch()
+        return refreshed
+    
     def has_more(self) -> bool:
         """Check if more cards in session"""
         return self.current_card_index < len(self.session_cards)
@@ -143,21 +494,197 @@ class StudySession:
     
     def get_stats(self) -> dict:
         """Get session statistics"""
-        if not self.reviews_today:
-            return {
-                "total": 0,
-                "again": 0,
-                "hard": 0,
-                "good": 0,
-                "easy": 0
-            }
-        
-        ratings = [r.rating for r in self.reviews_today]
+        ratings = self.ratings
         return {
-            "total": len(self.reviews_today),
+            "total": len(ratings),
             "again": ratings.count(1),
             "hard": ratings.count(2),
             "good": ratings.count(3),
             "easy": ratings.count(4)
         }
+    
+    def to_cursor(self) -> dict:
+        """Compact, JSON-serializable representation of the session"""
+        return {
+            "deck_id": self.deck_id,
+            "deck_ids": self.deck_ids,
+            "include_subdecks": self.include_subdecks,
+            "skip_leeches": self.skip_leeches,
+            "card_ids": [card.id for card in self.session_cards],
+            "position": self.current_card_index,
+            "ratings": list(self.ratings)
+        }
+    
+    @classmethod
+    def from_cursor(
+        cls,
+        store: AksonCardsStore,
+        cursor: dict,
+        journal: Optional[AnswerJournal] = None,
+        maintenance: Optional[CardMaintenance] = None
+    ) -> "StudySession":
+        """Rebuild a session from to_cursor() output with one batched card and note lookup"""
+        session = cls(
+            store,
+            deck_id=cursor.get("deck_id"),
+            journal=journal,
+            deck_ids=cursor.get("deck_ids"),
+            include_subdecks=cursor.get("include_subdecks", False),
+            maintenance=maintenance,
+            skip_leeches=cursor.get("skip_leeches", False)
+        )
+        card_ids = cursor.get("card_ids", [])
+        position = cursor.get("position", 0)
+        
+        cards = store.get_cards_by_ids(card_ids)
+        # Cards deleted since the cursor was taken drop out of the queue
+        session.session_cards = [cards[card_id] for card_id in card_ids if card_id in cards]
+        session.current_card_index = sum(1 for card_id in card_ids[:position] if card_id in cards)
+        session.ratings = list(cursor.get("ratings", []))
+        
+        session._notes = store.get_notes_by_ids(card.note_id for card in session.session_cards)
+        session._prefetch()
+        return session
+
+
+def _parse_response_time(value) -> int:
+    """Validate a client-reported response time in milliseconds"""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("response_time_ms must be a number")
+    if not 0 <= value < MAX_RESPONSE_TIME_MS:
+        raise ValueError("response_time_ms is out of range")
+    return int(value)
+
+
+def _parse_answered_at(value, now: datetime) -> datetime:
+    """Parse an ISO 8601 string or Unix epoch milliseconds as local naive time"""
+    if value is None or value == "":
+        return now
+    if isinstance(value, bool):
+        raise ValueError("answered_at must be an ISO 8601 string or epoch milliseconds")
+    if isinstance(value, (int, float)):
+        try:
+            answered_at = datetime.fromtimestamp(value / 1000)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError("answered_at is out of range")
+    else:
+        answered_at = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if answered_at.tzinfo is not None:
+            answered_at = answered_at.astimezone().replace(tzinfo=None)
+    # Clients with a fast clock must not push cards further out than "now" would
+    return min(answered_at, now)
+
 
+def apply_answer_batch(
+    store: AksonCardsStore,
+    answers: List[dict],
+    journal: Optional[AnswerJournal] = None
+) -> dict:
+    """
+    Apply answers recorded by a client (offline or in a burst) in one transaction
+    
+    Answers are applied in list order, each scheduled by FSRS from its own
+    answered_at time, so a card answered twice in one batch is scheduled as
+    it would have been live. An answer carrying an "id" already stored as a
+    review is skipped, which makes resubmitting a batch after a dropped
+    response safe.
+    
+    Args:
+        store: Store holding the cards
+        answers: Dicts with card_id, rating (1-4) and optional
+            response_time_ms, answered_at (ISO 8601 or epoch ms) and id
+        journal: Answer journal to flush first, so queued answers land
+            before (not on top of) the batch
+    
+    Returns:
+        Dict with a per-answer "results" list (status "applied", "duplicate"
+        or "error") and the resulting state of every answered card in "cards"
+    """
+    if journal:
+        journal.flush()
+    
+    now = datetime.now()
+    results = []
+    reviews: List[Review] = []
+    answered: Dict[str, Card] = {}
+    
+    with store.transaction():
+        cards = store.get_cards_by_ids(
+            {answer.get("card_id") for answer in answers if isinstance(answer.get("card_id"), str)}
+        )
+        notes = store.get_notes_by_ids({card.note_id for card in cards.values()})
+        decks = store.get_decks()
+        stored_reviews = store.get_reviews_by_ids(
+            {answer.get("id") for answer in answers if isinstance(answer.get("id"), str)}
+        )
+        schedulers: Dict[str, FSRS] = {}
+        batch_review_ids = set()
+        
+        for index, answer in enumerate(answers):
+            card_id = answer.get("card_id")
+            result = {"index": index, "card_id": card_id}
+            results.append(result)
+            try:
+                if not isinstance(card_id, str):
+                    raise ValueError("card_id must be a string")
+                rating = answer.get("rating")
+                if isinstance(rating, bool) or rating not in (1, 2, 3, 4):
+                    raise ValueError("Rating must be 1, 2, 3, or 4")
+                card = cards.get(card_id)
+                note = notes.get(card.note_id) if card else None
+                if not note:
+                    raise ValueError("Card not found")
+                
+                review_id = answer.get("id")
+                if review_id is not None and not isinstance(review_id, str):
+                    raise ValueError("id must be a string")
+                if review_id and (review_id in stored_reviews or review_id in batch_review_ids):
+                    result["status"] = "duplicate"
+                    continue
+                
+                answered_at = _parse_answered_at(answer.get("answered_at"), now)
+                if card.last_review and answered_at < card.last_review:
+                    raise ValueError("Answered before the card's last review")
+                
+                fsrs = schedulers.get(note.deck_id)
+                if fsrs is None:
+                    deck = decks.get(note.deck_id)
+                    fsrs = FSRS(FSRSConfig(request_retention=deck.request_retention if deck else 0.9))
+                    schedulers[note.deck_id] = fsrs
+                
+                review = schedule_answer(
+                    fsrs, card, note, rating, _parse_response_time(answer.get("response_time_ms")),
+                    answered_at, review_id=review_id
+                )
+            except (TypeError, ValueError, OverflowError) as e:
+                result["status"] = "error"
+                result["error"] = str(e)
+                continue
+            
+            reviews.append(review)
+            batch_review_ids.add(review.id)
+            answered[card.id] = card
+            result["status"] = "applied"
+            result["review_id"] = review.id
+        
+        if reviews:
+            store.save_cards(answered.values())
+            store.save_reviews(reviews)
+    
+    return {
+        "results": results,
+        "cards": {
+            card.id: {
+                "state": card.state,
+                "due": card.due.isoformat() if card.due else None,
+                "last_review": card.last_review.isoformat() if card.last_review else None,
+                "stability": card.stability,
+                "difficulty": card.difficulty,
+                "reps": card.reps,
+                "lapses": card.lapses
+            }
+            for card in answered.values()
+        }
+    }
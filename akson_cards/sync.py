@@ -0,0 +1,263 @@
+"""
+Delta sync between Akson Cards stores
+
+Every store write appends to the store's change log (see
+AksonCardsStore._log_changes), so a peer only needs the entities changed
+since the last sequence number it saw. Changes applied from a peer are
+logged with that peer as their origin and are never sent back to it.
+
+Conflicts:
+    cards    the version with the latest review wins (then the latest update)
+    notes    last writer wins by updated_at, as do decks
+    reviews  immutable; both sides keep the union
+    deletes  always applied
+"""
+
+import json
+import urllib.request
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from .models import Card, Deck, Note, NoteModel, Review
+from .store import AksonCardsStore
+
+
+# Entity kind -> model class
+ENTITY_TYPES = {
+    "model": NoteModel,
+    "deck": Deck,
+    "note": Note,
+    "card": Card,
+    "review": Review,
+}
+# Puts are applied in this order so references resolve; deletes in reverse
+APPLY_ORDER = ("model", "deck", "note", "card", "review")
+
+
+def get_peer_id(store: AksonCardsStore) -> str:
+    """Stable identifier of this store in sync exchanges"""
+    path = store.data_dir / "peer_id"
+    with store.transaction():
+        if path.exists():
+            return path.read_text(encoding="utf-8").strip()
+        peer_id = uuid.uuid4().hex
+        path.write_text(peer_id, encoding="utf-8")
+        return peer_id
+
+
+def get_changes_since(
+    store: AksonCardsStore,
+    since: int = 0,
+    exclude_origin: Optional[str] = None,
+    limit: Optional[int] = None
+) -> dict:
+    """
+    Collect the entities changed after sequence number `since`
+
+    Each entity appears once, in its latest state. since=0 returns a full
+    snapshot (including data written before the change log existed).
+
+    Args:
+        store: Store to read from
+        since: Last sequence number the peer has seen
+        exclude_origin: Skip entities whose latest change came from this peer
+        limit: Maximum number of changes to return (the rest come on the next
+            call); snapshots are returned whole
+
+    Returns:
+        Dict with "seq" (pass it as `since` next time), "changes" and "more"
+    """
+    with store.snapshot():
+        current_seq = store.get_change_seq()
+
+        # (kind, id) -> (seq, deleted, origin) of the entity's latest change
+        latest: Dict[tuple, tuple] = {}
+        for seq, kind, entity_id, deleted, origin in store.iter_changes(since):
+            latest[(kind, entity_id)] = (seq, deleted, origin)
+
+        entries = sorted(
+            (seq, kind, entity_id, deleted)
+            for (kind, entity_id), (seq, deleted, origin) in latest.items()
+            if not (exclude_origin and origin == exclude_origin)
+        )
+        if since == 0:
+            # Snapshot: everything stored, whether or not it was ever logged
+            for kind in APPLY_ORDER:
+                entries.extend(
+                    (0, kind, entity_id, False) for entity_id in store.get_entity_data(kind)
+                    if (kind, entity_id) not in latest
+                )
+            entries.sort(key=lambda entry: (entry[0], APPLY_ORDER.index(entry[1])))
+
+        # A snapshot has no sequence numbers to resume from, so it is never split
+        more = bool(limit) and since > 0 and len(entries) > limit
+        if more:
+            entries = entries[:limit]
+            current_seq = max(entries[-1][0], since)
+
+        # One lookup per entity kind that has changes
+        wanted: Dict[str, List[str]] = {}
+        for _, kind, entity_id, deleted in entries:
+            if not deleted:
+                wanted.setdefault(kind, []).append(entity_id)
+        data = {kind: store.get_entity_data(kind, entity_ids) for kind, entity_ids in wanted.items()}
+
+    changes = []
+    for _, kind, entity_id, deleted in entries:
+        if deleted:
+            changes.append({"kind": kind, "id": entity_id, "deleted": True})
+            continue
+        entity = data[kind].get(entity_id)
+        if entity is None:
+            # Deleted without a log entry; the peer is told to drop it
+            changes.append({"kind": kind, "id": entity_id, "deleted": True})
+            continue
+        changes.append({"kind": kind, "id": entity_id, "deleted": False, "data": entity})
+    return {"seq": current_seq, "changes": changes, "more": more}
+
+
+def _is_newer(kind: str, incoming, local) -> bool:
+    """Whether an incoming entity should replace the local one"""
+    if local is None or kind == "model":
+        return True
+    if kind == "card":
+        incoming_review = incoming.last_review or datetime.min
+        local_review = local.last_review or datetime.min
+        if incoming_review != local_review:
+            return incoming_review > local_review
+    return incoming.updated_at > local.updated_at
+
+
+def apply_changes(store: AksonCardsStore, changes: Iterable[dict], origin: str) -> dict:
+    """
+    Apply a peer's changes in one store transaction
+
+    Returns:
+        Dict with the number of changes applied and skipped (older than local)
+    """
+    puts: Dict[str, list] = {kind: [] for kind in APPLY_ORDER}
+    deletes: Dict[str, List[str]] = {kind: [] for kind in APPLY_ORDER}
+    for change in changes:
+        kind = change.get("kind")
+        if kind not in ENTITY_TYPES:
+            continue
+        if change.get("deleted"):
+            deletes[kind].append(change["id"])
+        else:
+            puts[kind].append(ENTITY_TYPES[kind].from_dict(change["data"]))
+
+    applied = 0
+    skipped = 0
+    with store.change_origin(origin):
+        for kind in APPLY_ORDER:
+            if not puts[kind]:
+                continue
+            if kind == "review":
+                # Reviews never change; save_reviews skips known IDs
+                store.save_reviews(puts[kind])
+                applied += len(puts[kind])
+                continue
+
+            model_class = ENTITY_TYPES[kind]
+            local = store.get_entity_data(kind, (entity.id for entity in puts[kind]))
+            newer = []
+            for entity in puts[kind]:
+                local_data = local.get(entity.id)
+                local_entity = model_class.from_dict(local_data) if local_data else None
+                if _is_newer(kind, entity, local_entity):
+                    newer.append(entity)
+            skipped += len(puts[kind]) - len(newer)
+            applied += len(newer)
+            if not newer:
+                continue
+            if kind == "model":
+                store.save_models(newer)
+            elif kind == "deck":
+                store.save_decks(newer)
+            elif kind == "note":
+                store.save_notes(newer)
+            elif kind == "card":
+                store.save_cards(newer)
+
+        for kind in reversed(APPLY_ORDER):
+            ids = deletes[kind]
+            if not ids:
+                continue
+            applied += len(ids)
+            if kind == "review":
+                store.delete_reviews(
+                    Review.from_dict(review_data) for review_data in store.get_entity_data(kind, ids).values()
+                )
+            elif kind == "card":
+                store.delete_cards(ids)
+            elif kind == "note":
+                store.delete_notes(ids)
+            elif kind == "deck":
+                for deck_id in ids:
+                    store.delete_deck(deck_id)
+
+    return {"applied": applied, "skipped": skipped}
+
+
+class SyncClient:
+    """Syncs a local store with a remote web app's POST /api/sync endpoint"""
+
+    def __init__(self, store: AksonCardsStore, server_url: str, timeout: float = 30.0):
+        self.store = store
+        self.url = server_url.rstrip("/") + "/api/sync"
+        self.timeout = timeout
+
+    def _load_state(self) -> dict:
+        states = self.store.get_sync_state()
+        # Progress is tracked per server
+        return dict(states.get(self.url, {"pushed_seq": 0, "pulled_seq": 0, "server_id": None}))
+
+    def _save_state(self, state: dict) -> None:
+        with self.store.transaction():
+            states = self.store.get_sync_state()
+            states[self.url] = state
+            self.store.save_sync_state(states)
+
+    def _post(self, payload: dict) -> dict:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read().decode("utf-8"))
+        if not result.get("success"):
+            raise RuntimeError(result.get("error", "Sync failed"))
+        return result
+
+    def sync(self) -> dict:
+        """
+        Push local changes, then pull the server's, until both are up to date
+
+        Returns:
+            Dict with the number of changes pushed and pulled
+        """
+        state = self._load_state()
+        peer_id = get_peer_id(self.store)
+        pushed = 0
+        pulled = 0
+
+        outgoing = get_changes_since(self.store, state["pushed_seq"], exclude_origin=state["server_id"])
+        changes = outgoing["changes"]
+        while True:
+            result = self._post({"peer_id": peer_id, "since": state["pulled_seq"], "changes": changes})
+            pushed += len(changes)
+            changes = []
+
+            state["server_id"] = result["server_id"]
+            apply_changes(self.store, result["changes"], origin=result["server_id"])
+            pulled += len(result["changes"])
+            state["pulled_seq"] = result["seq"]
+            state["pushed_seq"] = outgoing["seq"]
+            self._save_state(state)
+            if not result.get("more"):
+                break
+
+        return {"pushed": pushed, "pulled": pulled}
@@ -0,0 +1,245 @@
+"""
+Card template rendering for Akson Cards
+
+Note models store Anki-style templates such as "{{Front}}" and
+"{{FrontSide}}<hr id=answer>{{Back}}". Each template string is compiled once
+into a tree of render nodes; rendering a card then only walks that tree.
+Rendered HTML is cached per note and template, keyed by the note's
+updated_at, so editing a note invalidates its cached cards.
+
+Supported syntax:
+    {{Field}}                  field substitution
+    {{FrontSide}}              the rendered question (answer side only)
+    {{Tags}}, {{Type}}, {{Card}}  note tags, model name, template name
+    {{#Field}}...{{/Field}}    section shown when the field is non-empty
+    {{^Field}}...{{/Field}}    section shown when the field is empty
+    {{text:Field}}             field with HTML tags stripped
+    {{cloze:Field}}            cloze deletions ({{c1::answer::hint}})
+
+Other filters (hint:, tts) are ignored and the plain field is shown.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .models import Card, Note, NoteModel
+
+
+TAG_RE = re.compile(r"{{(.*?)}}", re.DOTALL)
+CLOZE_RE = re.compile(r"{{c(\d+)::(.*?)(?:::(.*?))?}}", re.DOTALL)
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+# Separator Anki answer templates put between the question and the answer
+ANSWER_SEPARATOR_RE = re.compile(r"<hr id=[\"']?answer[\"']?>", re.IGNORECASE)
+
+
+class TemplateError(ValueError):
+    """Raised when a template has unbalanced or mismatched sections"""
+
+
+class RenderContext:
+    """Values a compiled template reads while rendering one card side"""
+
+    __slots__ = ("fields", "ordinal", "question_side", "front_side")
+
+    def __init__(
+        self,
+        fields: Dict[str, str],
+        ordinal: int = 1,
+        question_side: bool = True,
+        front_side: str = ""
+    ):
+        self.fields = fields
+        self.ordinal = ordinal
+        self.question_side = question_side
+        self.front_side = front_side
+
+
+# Compiled nodes are closures taking a RenderContext and returning HTML
+Node = Callable[[RenderContext], str]
+
+
+def strip_html(html: str) -> str:
+    """Remove HTML tags from a field value"""
+    return HTML_TAG_RE.sub("", html)
+
+
+def cloze_ordinals(text: str) -> List[int]:
+    """Distinct cloze numbers used in a field, in ascending order"""
+    return sorted({int(number) for number, _, _ in CLOZE_RE.findall(text)})
+
+
+def render_cloze(text: str, ordinal: int, question_side: bool) -> str:
+    """Render the cloze deletions of a field for card number `ordinal`"""
+    def replace(match) -> str:
+        number, answer, hint = match.group(1), match.group(2), match.group(3)
+        if int(number) != ordinal:
+            return answer
+        if question_side:
+            return f"<span class=cloze>[{hint or '...'}]</span>"
+        return f"<span class=cloze>{answer}</span>"
+    return CLOZE_RE.sub(replace, text)
+
+
+def split_answer(answer_html: str) -> Tuple[str, str]:
+    """
+    Split a rendered answer at its <hr id=answer> separator
+
+    Returns:
+        Tuple of (part before the separator, part after it); the first part
+        is empty when the template has no separator
+    """
+    parts = ANSWER_SEPARATOR_RE.split(answer_html, maxsplit=1)
+    if len(parts) == 1:
+        return "", answer_html.strip()
+    return parts[0].strip(), parts[1].strip()
+
+
+def _text_node(text: str) -> Node:
+    return lambda context: text
+
+
+def _field_node(name: str, filters: List[str]) -> Node:
+    if name == "FrontSide":
+        return lambda context: context.front_side
+
+    def render(context: RenderContext) -> str:
+        value = context.fields.get(name, "")
+        # Filters apply right to left, as in Anki ({{text:cloze:Text}})
+        for name_filter in reversed(filters):
+            if name_filter == "cloze":
+                value = render_cloze(value, context.ordinal, context.question_side)
+            elif name_filter == "text":
+                value = strip_html(value)
+            elif name_filter == "type":
+                # Typed-answer boxes are not supported; never leak the answer
+                value = ""
+        return value
+    return render
+
+
+def _section_node(name: str, inverted: bool, children: List[Node]) -> Node:
+    def render(context: RenderContext) -> str:
+        present = bool(strip_html(context.fields.get(name, "")).strip())
+        if present == inverted:
+            return ""
+        return "".join(child(context) for child in children)
+    return render
+
+
+@lru_cache(maxsize=256)
+def compile_template(source: str) -> Node:
+    """
+    Compile a template string into a render function
+
+    Compiled templates are cached by source, so every card sharing a
+    template reuses the same render tree.
+
+    Raises:
+        TemplateError: If sections are unbalanced
+    """
+    # Stack of (section name, inverted flag, node list being built)
+    stack: List[Tuple[Optional[str], bool, List[Node]]] = [(None, False, [])]
+    position = 0
+
+    for match in TAG_RE.finditer(source):
+        if match.start() > position:
+            stack[-1][2].append(_text_node(source[position:match.start()]))
+        position = match.end()
+
+        tag = match.group(1).strip()
+        if tag[:1] in ("#", "^"):
+            stack.append((tag[1:].strip(), tag[0] == "^", []))
+        elif tag[:1] == "/":
+            name = tag[1:].strip()
+            open_name, inverted, children = stack.pop() if len(stack) > 1 else (None, False, [])
+            if open_name != name:
+                raise TemplateError(f"Unexpected {{{{/{name}}}}} in template")
+            stack[-1][2].append(_section_node(name, inverted, children))
+        else:
+            *filters, name = [part.strip() for part in tag.split(":")]
+            stack[-1][2].append(_field_node(name, filters))
+
+    if position < len(source):
+        stack[-1][2].append(_text_node(source[position:]))
+    if len(stack) > 1:
+        raise TemplateError(f"Missing {{{{/{stack[-1][0]}}}}} in template")
+
+    nodes = stack[0][2]
+    if len(nodes) == 1:
+        return nodes[0]
+    return lambda context: "".join(node(context) for node in nodes)
+
+
+class TemplateRenderer:
+    """Renders cards through compiled templates, caching the rendered HTML"""
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        # (note id, note updated_at, template key, ordinal) -> (question, answer)
+        self._rendered: "OrderedDict[tuple, Tuple[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def find_template(model: NoteModel, template_id: str) -> Optional[dict]:
+        """Look up a model's template by ID (falling back to its first template)"""
+        for template in model.templates:
+            if template.get("id") == template_id:
+                return template
+        return model.templates[0] if model.templates else None
+
+    def render(
+        self,
+        note: Note,
+        model: NoteModel,
+        template: dict,
+        ordinal: int = 1
+    ) -> Tuple[str, str]:
+        """
+        Render the question and answer HTML of one card
+
+        Args:
+            note: Note supplying the field values
+            model: Note model the template belongs to
+            template: Template dict with "front" and "back" strings
+            ordinal: Cloze number the card tests (ignored by non-cloze templates)
+
+        Returns:
+            Tuple of (question_html, answer_html)
+        """
+        front_source = template.get("front", "")
+        back_source = template.get("back", "")
+        key = (note.id, note.updated_at, model.id, template.get("id"), front_source, back_source, ordinal)
+
+        with self._lock:
+            hit = self._rendered.get(key)
+            if hit is not None:
+                self._rendered.move_to_end(key)
+                return hit
+
+        fields = dict(note.fields)
+        fields.setdefault("Tags", " ".join(note.tags))
+        fields.setdefault("Type", model.name)
+        fields.setdefault("Card", template.get("name", ""))
+
+        question = compile_template(front_source)(
+            RenderContext(fields, ordinal, question_side=True)
+        )
+        answer = compile_template(back_source)(
+            RenderContext(fields, ordinal, question_side=False, front_side=question)
+        )
+
+        with self._lock:
+            self._rendered[key] = (question, answer)
+            while len(self._rendered) > self.max_entries:
+                self._rendered.popitem(last=False)
+        return question, answer
+
+    def render_card(self, card: Card, note: Note, model: NoteModel) -> Optional[Tuple[str, str]]:
+        """Render a card with its note's model, or None if the model has no templates"""
+        template = self.find_template(model, card.template_id)
+        if template is None:
+            return None
+        return self.render(note, model, template, card.ordinal)
@@ -1,37 +1,201 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.routing import Match
 from pathlib import Path
-from typing import Dict, Any
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 import json
+import mimetypes
+import os
+import threading
+
+from akson_cards.compression import (
+    ENCODING_SUFFIXES, CompressionMiddleware, accepted_encodings, is_precompressible, precompress_tree
+)
+from akson_cards.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS, record_read
 
 app = FastAPI(title="Akson Metadata API")
+app.add_middleware(CompressionMiddleware)
 BASE_DIR = Path(__file__).resolve().parent.parent
 METADATA_FILE = BASE_DIR / "metadata" / "library-metadata.json"
 FRONTEND_DIR = BASE_DIR / "frontend"
 PDFJS_DIR = BASE_DIR / "pdfjs"
 
 
-def _load_metadata() -> Dict[str, Any]:
-    if not METADATA_FILE.exists():
-        raise HTTPException(status_code=404, detail="Metadata file not found")
-    with open(METADATA_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+class LibraryMetadata(NamedTuple):
+    # (inode, mtime, size) of the file this was parsed from
+    signature: Tuple[int, int, int]
+    data: Dict[str, Any]
+    # noteId -> record in data["files"]
+    notes: Dict[str, Dict[str, Any]]
+    # Sorted noteIds (the /library page order), overall and per deckId
+    note_ids: List[str]
+    deck_note_ids: Dict[str, List[str]]
+
+
+def _index_metadata(signature: Tuple[int, int, int], data: Dict[str, Any]) -> LibraryMetadata:
+    notes = {note["noteId"]: note for note in data.get("files", []) if note.get("noteId")}
+    note_ids = sorted(notes)
+    deck_note_ids: Dict[str, List[str]] = {}
+    for note_id in note_ids:
+        deck_note_ids.setdefault(notes[note_id].get("deckId"), []).append(note_id)
+    return LibraryMetadata(signature, data, notes, note_ids, deck_note_ids)
+
+
+class MetadataCache:
+    """
+    Parsed library metadata, reloaded when the file is replaced or changes
+    mtime or size
+
+    Requests run on a thread pool: a reload happens under a lock (one parse
+    however many requests notice the change) and is published as a single
+    LibraryMetadata, so readers see either the old or the new document.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._current: Optional[LibraryMetadata] = None
+
+    @staticmethod
+    def _signature(stat: os.stat_result) -> Tuple[int, int, int]:
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def get(self) -> LibraryMetadata:
+        try:
+            signature = self._signature(self.path.stat())
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Metadata file not found")
+
+        current = self._current
+        if current is not None and current.signature == signature:
+            record_read(self.path.name)
+            return current
+
+        with self._lock:
+            current = self._current
+            if current is not None and current.signature == signature:
+                record_read(self.path.name)
+                return current
+            try:
+                with open(self.path, "rb") as f:
+                    # Signature of what is actually read, in case the file changed since stat()
+                    signature = self._signature(os.fstat(f.fileno()))
+                    raw = f.read()
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Metadata file not found")
+            record_read(self.path.name, len(raw))
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                if current is None:
+                    raise
+                # Caught mid-rewrite by the exporter: keep serving the last good
+                # copy, and parse again on the next request
+                return current
+            self._current = _index_metadata(signature, data)
+            return self._current
+
+
+METADATA = MetadataCache(METADATA_FILE)
+
+# /library page size (default and maximum)
+LIBRARY_PAGE_SIZE = 100
+LIBRARY_MAX_PAGE_SIZE = 1000
+
+
+def _route_label(scope) -> str:
+    """Path pattern of the route (or mount) serving a request, for metrics labels"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    token = METRICS.begin_request()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        METRICS.end_request(token, request.method, _route_label(request.scope), status)
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
 
 
 @app.get("/library")
-def list_library():
-    data = _load_metadata()
-    return {"items": data.get("files", []), "summary": data.get("summary", {})}
+def list_library(
+    limit: int = Query(LIBRARY_PAGE_SIZE, ge=1, le=LIBRARY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    deck_id: Optional[str] = Query(None, alias="deckId"),
+    tags: Optional[List[str]] = Query(None, alias="tag"),
+    updated_after: Optional[str] = Query(None, alias="updatedAfter"),
+    fields: Optional[str] = None,
+):
+    """
+    One page of library notes, ordered by noteId
+
+    Filters: deckId, tag (repeatable; a note needs every tag) and
+    updatedAfter (ISO timestamp). Records omit their cards unless `fields`
+    (comma-separated keys; noteId is always included) asks for them. Pass
+    the returned nextCursor as `cursor` for the following page.
+    """
+    metadata = METADATA.get()
+    if updated_after is not None:
+        try:
+            after = datetime.fromisoformat(updated_after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="updatedAfter must be an ISO timestamp")
+        if after.tzinfo is not None:
+            # Records are stamped in the exporting machine's local time
+            after = after.astimezone().replace(tzinfo=None)
+        updated_after = after.isoformat()
+    wanted_tags = set(tags or [])
+    keys = [key.strip() for key in (fields or "").split(",") if key.strip()]
+    keys = ["noteId"] + [key for key in keys if key != "noteId"] if keys else None
+
+    note_ids = metadata.note_ids if deck_id is None else metadata.deck_note_ids.get(deck_id, [])
+    start = bisect_right(note_ids, cursor) if cursor else 0
+    items = []
+    next_cursor = None
+    # Indexed rather than sliced: a slice would copy the rest of the list per page
+    for index in range(start, len(note_ids)):
+        note_id = note_ids[index]
+        note = metadata.notes[note_id]
+        # isoformat() strings of naive datetimes sort chronologically
+        if updated_after is not None and (note.get("updatedAt") or "") <= updated_after:
+            continue
+        if wanted_tags and not wanted_tags.issubset(note.get("tags") or ()):
+            continue
+        if len(items) == limit:
+            next_cursor = items[-1]["noteId"]
+            break
+        if keys is None:
+            items.append({key: value for key, value in note.items() if key != "cards"})
+        else:
+            items.append({key: note[key] for key in keys if key in note})
+
+    return {"items": items, "nextCursor": next_cursor, "summary": metadata.data.get("summary", {})}
 
 
 @app.get("/library/{note_id}")
 def get_note(note_id: str):
-    data = _load_metadata()
-    for note in data.get("files", []):
-        if note.get("noteId") == note_id:
-            return note
-    raise HTTPException(status_code=404, detail="Note not found")
+    """A note's full record, including its cards"""
+    note = METADATA.get().notes.get(note_id)
+    if note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return note
 
 
 @app.get("/health")
@@ -47,9 +211,37 @@ def root():
     raise HTTPException(status_code=404, detail="Frontend not built")
 
 
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that sends a .br/.gz sibling of an asset when the client accepts it"""
+
+    async def get_response(self, path: str, scope) -> Response:
+        if is_precompressible(path):
+            media_type = mimetypes.guess_type(path)[0] or "text/plain"
+            for encoding in accepted_encodings(Headers(scope=scope).get("accept-encoding")):
+                try:
+                    response = await super().get_response(path + ENCODING_SUFFIXES[encoding], scope)
+                except StarletteHTTPException:
+                    continue
+                if response.status_code == 404:
+                    continue
+                if response.status_code == 200:
+                    response.headers["content-type"] = media_type
+                    response.headers["content-encoding"] = encoding
+                response.headers["vary"] = "Accept-Encoding"
+                return response
+        response = await super().get_response(path, scope)
+        if is_precompressible(path):
+            response.headers["vary"] = "Accept-Encoding"
+        return response
+
+
+# Siblings are (re)written for new or changed assets only; run
+# `python -m akson_cards.compression pdfjs` at build time to skip this.
 if FRONTEND_DIR.exists():
-    app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
+    precompress_tree(FRONTEND_DIR)
+    app.mount("/static", PrecompressedStaticFiles(directory=FRONTEND_DIR), name="static")
 
 # Expose bundled PDF.js viewer so the web UI can load PDFs directly in-browser.
 if PDFJS_DIR.exists():
-    app.mount("/pdfjs", StaticFiles(directory=PDFJS_DIR), name="pdfjs")
+    precompress_tree(PDFJS_DIR)
+    app.mount("/pdfjs", PrecompressedStaticFiles(directory=PDFJS_DIR), name="pdfjs")
@@ -39,13 +39,19 @@ from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 
 import requests
 import webview
-import uuid
 from datetime import datetime
 
 # Akson Cards imports
 from akson_cards.store import AksonCardsStore
 from akson_cards.models import Deck, Note, Card, Review, NoteModel
 from akson_cards.study import StudySession
+from akson_cards.journal import AnswerJournal
+from akson_cards.sessions import SessionRegistry
+from akson_cards.maintenance import CardMaintenance
+from akson_cards.basic import parse_qa_text
+from akson_cards.cloze import add_cloze_notes, parse_cloze_text
+from akson_cards.anki import export_apkg, import_apkg
+from akson_cards.sync import SyncClient
 from akson_cards.fsrs import FSRSConfig
 from dotenv import load_dotenv
 load_dotenv()
@@ -16836,6 +16842,13 @@ def ensure_wrapper_created() -> None:
   let currentStudySession = null;
   let currentDeckName = null;
   
+  // Escape card text, keeping only the cloze highlight markup
+  function studyCardHtml(text) {
+    return escapeHtml(text || '')
+      .replace(/&lt;span class=cloze&gt;(.*?)&lt;\/span&gt;/g, '<span style="font-weight:bold; color:#6ea8fe;">$1</span>')
+      .replace(/\n/g, '<br>');
+  }
+  
   async function startStudySession(deckName){
     try {
       const result = await window.pywebview.api.start_study_session(deckName, 50, 20);
@@ -16864,6 +16877,17 @@ def ensure_wrapper_created() -> None:
       renderDecks(r.decks||{}); 
     };
     
+    const undoBtn = document.createElement('button');
+    undoBtn.textContent = '↶ Undo';
+    undoBtn.style.cssText = 'margin-bottom: 16px; margin-left: 8px; padding:8px 12px; border:1px solid #404040 ; background:#2a2a2c; color:#e8e8ea; border-radius:6px; cursor:pointer;';
+    undoBtn.onclick = async ()=>{
+      const result = await window.pywebview.api.undo_study_card(currentDeckName);
+      if (result && result.ok) {
+        currentStudySession = result;
+        showStudyUI(result);
+      }
+    };
+    
     const progress = session.progress || {current: 0, total: 0};
     const progressBar = document.createElement('div');
     progressBar.style.cssText = 'width:100%; height:8px; background:#2a2a2c; border-radius:4px; margin-bottom:20px; overflow:hidden;';
@@ -16884,26 +16908,30 @@ def ensure_wrapper_created() -> None:
     const card = session.card;
     const frontText = document.createElement('div');
     frontText.style.cssText = 'font-size:20px; color:#f0f0f2; text-align:center; line-height:1.6;';
-    frontText.innerHTML = escapeHtml(card.front || '').replace(/\n/g, '<br>');
+    frontText.innerHTML = studyCardHtml(card.front);
     cardDiv.appendChild(frontText);
     
     cardDiv.onclick = () => {
       if (!showingBack) {
         showingBack = true;
+        // Cloze cards reveal their deletions in the front on the answer side
+        frontText.innerHTML = studyCardHtml(card.front_revealed || card.front);
         const backText = document.createElement('div');
         backText.style.cssText = 'margin-top:30px; padding-top:30px; border-top:1px solid rgba(255,255,255,0.2); font-size:18px; color:#d8d8da; text-align:center; line-height:1.6;';
-        backText.innerHTML = escapeHtml(card.back || '').replace(/\n/g, '<br>');
+        backText.innerHTML = studyCardHtml(card.back);
         cardDiv.appendChild(backText);
       }
     };
     
     const ratingButtons = document.createElement('div');
     ratingButtons.style.cssText = 'display:grid; grid-template-columns:repeat(4,1fr); gap:12px;';
+    const previews = card.previews || {};
+    const ivl = (r) => (previews[r] && previews[r].interval) || r;
     ratingButtons.innerHTML = `
-      <button class="ratingBtn" data-rating="1" style="padding:16px; background:#d44; border:none; border-radius:8px; color:#fff; font-size:14px; cursor:pointer; font-weight:600;">Again (1)</button>
-      <button class="ratingBtn" data-rating="2" style="padding:16px; background:#ff9800; border:none; border-radius:8px; color:#fff; font-size:14px; cursor:pointer; font-weight:600;">Hard (2)</button>
-      <button class="ratingBtn" data-rating="3" style="padding:16px; background:#5a9fd4; border:none; border-radius:8px; color:#fff; font-size:14px; cursor:pointer; font-weight:600;">Good (3)</button>
-      <button class="ratingBtn" data-rating="4" style="padding:16px; background:#0f0; border:none; border-radius:8px; color:#fff; font-size:14px; cursor:pointer; font-weight:600;">Easy (4)</button>
+      <button class="ratingBtn" data-rating="1" style="padding:16px; background:#d44; border:none; border-radius:8px; color:#fff; font-size:14px; cursor:pointer; font-weight:600;">Again (${ivl(1)})</button>
+      <button class="ratingBtn" data-rating="2" style="padding:16px; background:#ff9800; border:none; border-radius:8px; color:#fff; font-size:14px; cursor:pointer; font-weight:600;">Hard (${ivl(2)})</button>
+      <button class="ratingBtn" data-rating="3" style="padding:16px; background:#5a9fd4; border:none; border-radius:8px; color:#fff; font-size:14px; cursor:pointer; font-weight:600;">Good (${ivl(3)})</button>
+      <button class="ratingBtn" data-rating="4" style="padding:16px; background:#0f0; border:none; border-radius:8px; color:#fff; font-size:14px; cursor:pointer; font-weight:600;">Easy (${ivl(4)})</button>
     `;
     
     ratingButtons.querySelectorAll('.ratingBtn').forEach(btn => {
@@ -16926,6 +16954,7 @@ def ensure_wrapper_created() -> None:
     });
     
     content.appendChild(backBtn);
+    content.appendChild(undoBtn);
     content.appendChild(progressBar);
     content.appendChild(progressText);
     content.appendChild(cardDiv);
@@ -23741,7 +23770,11 @@ class AppAPI:
         # Initialize Akson Cards store (private to avoid pywebview serialization issues)
         akson_data_dir = CACHE_ROOT / "akson_cards"
         self._akson_store = AksonCardsStore(akson_data_dir)
-        self._study_sessions: dict[str, StudySession] = {}  # deck_id -> session
+        self._answer_journal = AnswerJournal(self._akson_store)  # write-behind for study answers
+        self._card_maintenance = CardMaintenance(self._akson_store)  # leech flags and buried siblings
+        self._study_sessions = SessionRegistry(
+            self._akson_store, journal=self._answer_journal, maintenance=self._card_maintenance
+        )  # deck_id -> session
 
         # Cleanup duplicate/orphan PDFs on startup (non-fatal)
         try:
@@ -24947,13 +24980,8 @@ Only clean, concise, flashcard-ready Q&A pairs. Nothing else.
                 print(f"⚠️ NO_CARDS detected or empty response")
                 return {"ok": True, "cards": [], "page": page}
 
-            # Parse using regex like base.py
-            import re
-            matches = re.findall(
-                r'Question[:\s]+(.+?)\s+Answer[:\s]+(.+?)(?=\nQuestion[:\s]+|\Z)', 
-                raw, 
-                re.IGNORECASE | re.DOTALL
-            )
+            # Parse "Question: ... Answer: ..." pairs
+            matches = parse_qa_text(raw)
             print(f"📝 Regex found {len(matches)} Q&A pairs")
             
             cards: list[dict] = []
@@ -25969,15 +25997,20 @@ Format clearly:
         """Load all decks with card counts"""
         try:
             decks = self._akson_store.get_decks()
+            # Counts for all decks from a single pass over the store
+            overview = self._akson_store.get_deck_overview()
             result = {}
             for deck_id, deck in decks.items():
-                cards = self._akson_store.get_cards(deck_id=deck_id)
+                counts = overview.get(deck_id, {})
                 result[deck.name] = {
                     "id": deck.id,
                     "name": deck.name,
                     "description": deck.description,
-                    "total_cards": len(cards),
-                    "due_cards": len(self._akson_store.get_due_cards(deck_id=deck_id))
+                    "total_cards": counts.get("total", 0),
+                    "due_cards": counts.get("due", 0),
+                    "new_cards": counts.get("new", 0),
+                    "learning_cards": counts.get("learning", 0) + counts.get("relearning", 0),
+                    "review_cards": counts.get("review", 0)
                 }
             return {"ok": True, "decks": result}
         except Exception as e:
@@ -25986,7 +26019,7 @@ Format clearly:
     def create_flashcards_deck(self, deck_name: str, description: str = ""):
         """Create a new deck"""
         try:
-            deck_id = str(uuid.uuid4())
+            deck_id = self._akson_store.new_id()
             deck = Deck(
                 id=deck_id,
                 name=deck_name.strip(),
@@ -25997,6 +26030,51 @@ Format clearly:
         except Exception as e:
             return {"ok": False, "error": str(e)}
     
+    def import_cloze_deck(self, deck_name: str, text: str):
+        """Import cloze notes (one {{c1::...}} sentence per line) into a deck, creating it if needed"""
+        try:
+            items = parse_cloze_text(text or "")
+            if not items:
+                return {"ok": False, "error": "No cloze deletions found"}
+            
+            deck = None
+            for d in self._akson_store.get_decks().values():
+                if d.name == deck_name.strip():
+                    deck = d
+                    break
+            
+            if not deck:
+                deck = Deck(id=self._akson_store.new_id(), name=deck_name.strip())
+                self._akson_store.save_deck(deck)
+            
+            result = add_cloze_notes(self._akson_store, deck.id, items)
+            return {"ok": True, "imported": result["notes"], "cards": result["cards"], "errors": result["errors"]}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+    
+    def import_anki_package(self):
+        """Pick an Anki .apkg file and import its decks, cards, review history and media"""
+        try:
+            result = self.window.create_file_dialog(
+                webview.OPEN_DIALOG, allow_multiple=False,
+                file_types=("Anki Packages (*.apkg)", "All Files (*.*)")
+            )
+            if not result:
+                return {"ok": False, "error": "Import cancelled by user"}
+            
+            def report(stage, done, total):
+                print(f"📦 Anki import: {stage} {done}/{total}")
+            
+            # Answers still in the journal must not overwrite imported cards later
+            self._answer_journal.flush()
+            counts = import_apkg(self._akson_store, result[0], progress=report)
+            return {"ok": True, **counts}
+        except Exception as e:
+            print(f"Error importing Anki package: {e}")
+            import traceback
+            traceback.print_exc()
+            return {"ok": False, "error": str(e)}
+    
     def import_flashcards_deck(self, deck_name: str, cards: list[dict]):
         """Import cards into a deck (creates deck if doesn't exist)"""
         try:
@@ -26009,7 +26087,7 @@ Format clearly:
                     break
             
             if not deck:
-                deck_id = str(uuid.uuid4())
+                deck_id = self._akson_store.new_id()
                 deck = Deck(id=deck_id, name=deck_name.strip())
                 self._akson_store.save_deck(deck)
             
@@ -26022,12 +26100,14 @@ Format clearly:
             if not model:
                 return {"ok": False, "error": "No note model available"}
             
-            # Import cards
-            imported = 0
+            # Import cards (written in one transaction below)
+            template_id = model.templates[0]["id"] if model.templates else "basic-1"
+            new_notes = []
+            new_cards = []
             for card_data in cards:
                 # Create note
-                note_id = str(uuid.uuid4())
-                note = Note(
+                note_id = self._akson_store.new_id()
+                new_notes.append(Note(
                     id=note_id,
                     deck_id=deck.id,
                     model_id=model.id,
@@ -26035,20 +26115,17 @@ Format clearly:
                         "Front": card_data.get("q", ""),
                         "Back": card_data.get("a", "")
                     }
-                )
-                self._akson_store.save_note(note)
+                ))
                 
                 # Create card
-                card_id = str(uuid.uuid4())
-                template_id = model.templates[0]["id"] if model.templates else "basic-1"
-                card = Card(
-                    id=card_id,
+                new_cards.append(Card(
+                    id=self._akson_store.new_id(),
                     note_id=note_id,
                     template_id=template_id,
                     state="new"
-                )
-                self._akson_store.save_card(card)
-                imported += 1
+                ))
+            self._akson_store.add_notes(new_notes, new_cards)
+            imported = len(new_notes)
             
             return {"ok": True, "imported": imported}
         except Exception as e:
@@ -26089,6 +26166,7 @@ Format clearly:
             if not deck:
                 return {"ok": False, "error": "Deck not found"}
             
+            self._answer_journal.flush()
             self._akson_store.delete_deck(deck.id)
             return {"ok": True}
         except Exception as e:
@@ -26107,29 +26185,24 @@ Format clearly:
             if not deck:
                 return {"ok": False, "error": "Deck not found"}
             
-            notes = self._akson_store.get_notes(deck_id=deck.id)
-            cards = self._akson_store.get_cards(deck_id=deck.id)
-            
             result = []
-            for note in notes.values():
-                note_cards = [c for c in cards.values() if c.note_id == note.id]
-                for card in note_cards:
-                    result.append({
-                        "id": card.id,
-                        "front": note.fields.get("Front", ""),
-                        "back": note.fields.get("Back", ""),
-                        "state": card.state,
-                        "due": card.due.isoformat() if card.due else None,
-                        "reps": card.reps,
-                        "lapses": card.lapses
-                    })
+            for note, card in self._akson_store.iter_deck_cards([deck.id]):
+                result.append({
+                    "id": card.id,
+                    "front": note.fields.get("Front", ""),
+                    "back": note.fields.get("Back", ""),
+                    "state": card.state,
+                    "due": card.due.isoformat() if card.due else None,
+                    "reps": card.reps,
+                    "lapses": card.lapses
+                })
             
             return {"ok": True, "cards": result}
         except Exception as e:
             return {"ok": False, "error": str(e)}
     
-    def start_study_session(self, deck_name: str, limit: int = None, new_limit: int = None):
-        """Start a study session for a deck"""
+    def start_study_session(self, deck_name: str, limit: int = None, new_limit: int = None, include_subdecks: bool = False):
+        """Start a study session for a deck (optionally merged with all its subdecks)"""
         try:
             decks = self._akson_store.get_decks()
             deck = None
@@ -26141,30 +26214,30 @@ Format clearly:
             if not deck:
                 return {"ok": False, "error": "Deck not found"}
             
-            session = StudySession(self._akson_store, deck_id=deck.id)
+            session = StudySession(
+                self._akson_store,
+                deck_id=deck.id,
+                journal=self._answer_journal,
+                include_subdecks=bool(include_subdecks),
+                maintenance=self._card_maintenance
+            )
             started = session.start(limit=limit, new_limit=new_limit)
             
             if not started:
                 return {"ok": False, "error": "No cards to study"}
             
-            self._study_sessions[deck.id] = session
+            self._study_sessions.put(deck.id, session)
             
             # Get first card
-            current = session.get_current_card()
-            if not current:
+            payload = session.get_current_payload()
+            if not payload:
                 return {"ok": False, "error": "No cards available"}
             
-            card, note = current
             progress = session.get_progress()
             
             return {
                 "ok": True,
-                "card": {
-                    "id": card.id,
-                    "front": note.fields.get("Front", ""),
-                    "back": note.fields.get("Back", ""),
-                    "state": card.state
-                },
+                "card": payload,
                 "progress": {
                     "current": progress[0],
                     "total": progress[1]
@@ -26197,8 +26270,8 @@ Format clearly:
             
             if not result:
                 # Session complete
+                # Kept registered so the last answer can still be undone
                 stats = session.get_stats()
-                del self._study_sessions[deck.id]
                 return {
                     "ok": True,
                     "complete": True,
@@ -26206,18 +26279,49 @@ Format clearly:
                 }
             
             # Get next card
-            card, note = result
             progress = session.get_progress()
             
             return {
                 "ok": True,
                 "complete": False,
-                "card": {
-                    "id": card.id,
-                    "front": note.fields.get("Front", ""),
-                    "back": note.fields.get("Back", ""),
-                    "state": card.state
+                "card": session.get_current_payload(),
+                "progress": {
+                    "current": progress[0],
+                    "total": progress[1]
                 },
+                "stats": session.get_stats()
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return {"ok": False, "error": str(e)}
+
+    def undo_study_card(self, deck_name: str):
+        """Undo the last answer in a deck's study session"""
+        try:
+            decks = self._akson_store.get_decks()
+            deck = None
+            for d in decks.values():
+                if d.name == deck_name:
+                    deck = d
+                    break
+            
+            if not deck:
+                return {"ok": False, "error": "Deck not found"}
+            
+            session = self._study_sessions.get(deck.id)
+            if not session:
+                return {"ok": False, "error": "No active session"}
+            
+            if not session.undo():
+                return {"ok": False, "error": "Nothing to undo"}
+            
+            progress = session.get_progress()
+            
+            return {
+                "ok": True,
+                "complete": False,
+                "card": session.get_current_payload(),
                 "progress": {
                     "current": progress[0],
                     "total": progress[1]
@@ -26264,6 +26368,57 @@ Format clearly:
             print(f"Error downloading summary: {e}")
             return {"ok": False, "error": str(e)}
 
+    def sync_flashcards(self, server_url: str):
+        """Sync the flashcard store with an Akson web app (only changes since the last sync)"""
+        try:
+            if not server_url or not server_url.strip():
+                return {"ok": False, "error": "Server URL is required"}
+            
+            # Answers still in the journal are not in the change log yet
+            self._answer_journal.flush()
+            result = SyncClient(self._akson_store, server_url.strip()).sync()
+            print(f"🔄 Flashcards synced: {result['pushed']} pushed, {result['pulled']} pulled")
+            return {"ok": True, **result}
+        except Exception as e:
+            print(f"Error syncing flashcards: {e}")
+            return {"ok": False, "error": str(e)}
+    
+    def export_flashcards_deck_apkg(self, deck_name: str):
+        """Export a deck (and its subdecks) as an Anki .apkg with scheduling state, history and images"""
+        try:
+            deck = None
+            for d in self._akson_store.get_decks().values():
+                if d.name == deck_name:
+                    deck = d
+                    break
+            
+            if not deck:
+                return {"ok": False, "error": "Deck not found"}
+            
+            save_path = self.window.create_file_dialog(
+                webview.SAVE_DIALOG,
+                directory=str(Path.home() / "Downloads"),
+                allow_multiple=False,
+                save_filename=f"{self._sanitize_library_name(deck.name)}.apkg",
+                file_types=("Anki Packages (*.apkg)", "All Files (*.*)")
+            )
+            if not save_path:
+                return {"ok": False, "error": "Save cancelled by user"}
+            if isinstance(save_path, (list, tuple)):
+                save_path = save_path[0]
+            
+            self._answer_journal.flush()
+            counts = export_apkg(
+                self._akson_store, deck.id, save_path,
+                # Mindmap page renders are referenced by their local server URL
+                media_roots={"/mindmap_images/": CACHE_ROOT / "library"}
+            )
+            print(f"🗂️ Deck exported to: {save_path}")
+            return {"ok": True, "path": str(save_path), **counts}
+        except Exception as e:
+            print(f"Error exporting deck: {e}")
+            return {"ok": False, "error": str(e)}
+    
     def download_flashcards_anki(self, filename: str, data: dict):
         """Download flashcards as Anki-compatible TSV (tab-separated)."""
         try:
@@ -0,0 +1,82 @@
+"""Anki .apkg import: due dates of buried, suspended and filtered-deck cards"""
+
+import sqlite3
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from akson_cards.anki import ApkgImporter, QUEUE_USER_BURIED, export_apkg, import_apkg
+from akson_cards.basic import add_basic_notes
+from akson_cards.maintenance import CardMaintenance
+from akson_cards.models import Deck
+from akson_cards.store import AksonCardsStore
+
+
+LEARNING_DUE = 1_700_000_000
+FILTERED_DECK_ID = 999
+
+
+class BuriedLearningCardImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        source = AksonCardsStore(self.tmp / "source")
+        source.save_deck(Deck(id="deck", name="Deck"))
+        add_basic_notes(source, "deck", [("q1", "a1"), ("q2", "a2"), ("q3", "a3")])
+        self.package = self.tmp / "deck.apkg"
+        export_apkg(source, "deck", self.package)
+
+    def _patch_collection(self, patch):
+        """Rewrite the package's collection with patch(conn)"""
+        extracted = self.tmp / "extracted"
+        with zipfile.ZipFile(self.package) as package:
+            names = package.namelist()
+            package.extractall(extracted)
+        conn = sqlite3.connect(extracted / "collection.anki2")
+        patch(conn)
+        conn.commit()
+        conn.close()
+        with zipfile.ZipFile(self.package, "w") as package:
+            for name in names:
+                package.write(extracted / name, name)
+
+    def test_buried_learning_and_filtered_cards(self):
+        ids = {}
+
+        def patch(conn):
+            (crt,) = conn.execute("SELECT crt FROM col").fetchone()
+            ids["created"] = datetime.fromtimestamp(crt)
+            learning, filtered, _ = [row for row in conn.execute("SELECT id, did FROM cards ORDER BY id")]
+            ids["learning"], ids["filtered"], ids["home"] = learning[0], filtered[0], filtered[1]
+            # Intraday learning card buried by the user: the due stays in epoch seconds
+            conn.execute(
+                "UPDATE cards SET type = 1, queue = ?, due = ?, ivl = 0 WHERE id = ?",
+                (QUEUE_USER_BURIED, LEARNING_DUE, learning[0])
+            )
+            # Review card moved into a filtered deck: its own due is in odue
+            conn.execute(
+                "UPDATE cards SET type = 2, queue = 2, did = ?, odid = ?, due = -5, odue = 100, ivl = 10 "
+                "WHERE id = ?",
+                (FILTERED_DECK_ID, filtered[1], filtered[0])
+            )
+
+        self._patch_collection(patch)
+        store = AksonCardsStore(self.tmp / "target")
+        result = import_apkg(store, self.package)
+        self.assertEqual(result["cards"], 3)
+
+        learning = store.get_card(ApkgImporter.card_id(ids["learning"]))
+        self.assertEqual(learning.state, "learning")
+        self.assertEqual(learning.due, datetime.fromtimestamp(LEARNING_DUE))
+        self.assertIn(learning.id, CardMaintenance(store).get_buried())
+
+        filtered = store.get_card(ApkgImporter.card_id(ids["filtered"]))
+        expected = datetime.combine(ids["created"].date(), datetime.min.time()) + timedelta(days=100)
+        self.assertEqual(filtered.due, expected)
+        note = store.get_note(filtered.note_id)
+        self.assertEqual(note.deck_id, ApkgImporter.deck_id(ids["home"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
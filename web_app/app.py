@@ -5,28 +5,295 @@ Flask-based web interface for the desktop application
 import os
 import sys
 import json
+import mimetypes
+import shutil
+import tempfile
+import time
 from datetime import datetime
+from functools import wraps
 
 # Add parent directory to Python path to import akson_cards
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, g, render_template, request, jsonify, make_response, send_file, send_from_directory
 from flask_cors import CORS
+from werkzeug.exceptions import NotFound
 
 # Import Akson Cards modules
 from akson_cards.store import AksonCardsStore
+from akson_cards.sqlite_store import SQLiteAnswerJournal, SQLiteStore
 from akson_cards.models import Deck, Note, Card, Review, NoteModel
-from akson_cards.study import StudySession
+from akson_cards.study import StudySession, apply_answer_batch
+from akson_cards.journal import AnswerJournal
+from akson_cards.sessions import SessionRegistry
+from akson_cards.analytics import ReviewAnalytics
+from akson_cards.maintenance import CardMaintenance
+from akson_cards.cloze import add_cloze_notes, parse_cloze_text
+from akson_cards.basic import add_basic_notes, parse_qa_text
+from akson_cards.anki import export_apkg, import_apkg
+from akson_cards.sync import apply_changes, get_changes_since, get_peer_id
+from akson_cards.templates import TemplateRenderer, split_answer
 from akson_cards.fsrs import FSRS, FSRSConfig
+from akson_cards.compression import (
+    MIN_COMPRESS_SIZE, ENCODING_SUFFIXES, accepted_encodings, coded_etag, compress, compress_stream,
+    is_json_mimetype, is_precompressible, negotiate_encoding, precompress_tree
+)
+from akson_cards.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS
 
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 CORS(app)  # Enable CORS for API endpoints
 
-# Initialize store
-DATA_DIR = os.path.join(os.getcwd(), 'web_data')
-store = AksonCardsStore(DATA_DIR)
+# Initialize store (AKSON_DATA_DIR overrides the cwd-relative default)
+DATA_DIR = os.path.abspath(os.environ.get('AKSON_DATA_DIR', os.path.join(os.getcwd(), 'web_data')))
+# "json" (single process) or "sqlite" (shared by several worker processes, see wsgi.py)
+STORE_BACKEND = os.environ.get('AKSON_STORE', 'json')
+
+if STORE_BACKEND == 'sqlite':
+    store = SQLiteStore(DATA_DIR)
+    # Study answers are journaled in the database and written to the store in the background
+    journal = SQLiteAnswerJournal(store)
+else:
+    store = AksonCardsStore(DATA_DIR)
+    # Study answers are journaled and written to the store in the background
+    journal = AnswerJournal(store)
+
+# Leech flags and buried siblings, updated incrementally from the review log
+maintenance = CardMaintenance(store)
+
+# Live study sessions, kept server-side and evicted by LRU/TTL
+study_sessions = SessionRegistry(
+    store, journal=journal, maintenance=maintenance, shared=STORE_BACKEND == 'sqlite'
+)
+
+# Maximum number of changes returned per sync response
+SYNC_BATCH_SIZE = 5000
+
+# Review statistics (rollups plus cached NumPy aggregates)
+analytics = ReviewAnalytics(store)
+
+# Card listings render each card's question through its note model, as study does
+renderer = TemplateRenderer()
+
+# Responses that depend on the clock (due counts) get a new ETag this often
+ETAG_TIME_BUCKET_SECONDS = 60
+
+# Streamed responses are written in pieces of about this many characters
+STREAM_CHUNK_SIZE = 64 * 1024
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def wants_ndjson():
+    """Whether the client asked for newline-delimited JSON (?format=ndjson or Accept)"""
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == NDJSON_MIMETYPE)
+
+def chunked(pieces):
+    """Group many small strings into STREAM_CHUNK_SIZE writes"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def stream_ndjson(rows):
+    """
+    Stream dicts as one JSON document per line
+    
+    The status is already sent when the rows are produced, so an error
+    mid-stream ends the body with a {"success": false, "error": ...} line.
+    """
+    def lines():
+        try:
+            for row in rows:
+                yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+        except Exception as e:
+            app.logger.exception('NDJSON stream failed')
+            yield json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False) + '\n'
+    return Response(chunked(lines()), mimetype=NDJSON_MIMETYPE)
+
+def stream_json_list(key, rows):
+    """
+    Stream {<key>: [rows...], "success": true} without building the list
+    
+    An error mid-stream closes the list and ends the document with
+    "success": false and the error instead, so the body stays valid JSON.
+    """
+    def pieces():
+        yield f'{{"{key}":['
+        try:
+            for index, row in enumerate(rows):
+                yield (',' if index else '') + json.dumps(row, ensure_ascii=False, default=str)
+        except Exception as e:
+            app.logger.exception('JSON stream failed')
+            yield '],"success":false,"error":' + json.dumps(str(e), ensure_ascii=False) + '}'
+            return
+        yield '],"success":true}'
+    return Response(chunked(pieces()), mimetype='application/json')
+
+def request_tags(data):
+    """Optional "tags" of a request body, which must be a list of strings"""
+    tags = data.get('tags')
+    if tags is None:
+        return None
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError('tags must be a list of strings')
+    return tags
+
+def card_sides(card, note, models):
+    """Question and answer HTML of a card (cloze notes have no Front/Back fields)"""
+    model = models.get(note.model_id)
+    rendered = renderer.render_card(card, note, model) if model else None
+    if rendered is None:
+        # Without a model or templates, show the first two fields
+        names = model.fields if model and model.fields else list(note.fields)
+        values = [note.fields.get(name, '') for name in names[:2]]
+        values += [''] * (2 - len(values))
+        return values[0], values[1]
+    question, answer = rendered
+    return question, split_answer(answer)[1]
+
+def conditional_get(time_dependent=False, flush_journal=False):
+    """
+    Serve a GET handler with an ETag taken from the store's change sequence
+    and the answer journal's sequence
+    
+    Every store write bumps the change sequence and every journaled answer
+    bumps the journal's, so an unchanged ETag means the response would be
+    identical; a matching If-None-Match gets 304 Not Modified before the
+    handler (and the store) is touched, and without flushing the journal.
+    
+    Args:
+        time_dependent: Also roll the ETag every ETAG_TIME_BUCKET_SECONDS
+        flush_journal: Apply journaled answers before running the handler;
+            needed by every view whose response depends on cards or reviews
+    """
+    def current_etag():
+        etag = f"{store.get_change_seq()}.{journal.seq}"
+        if time_dependent:
+            etag += f"-{int(time.time() // ETAG_TIME_BUCKET_SECONDS)}"
+        return etag
+    
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = current_etag()
+            
+            # compress_json_response() tags compressed bodies "<etag>-<coding>",
+            # so a cached compressed body only matches while that coding is accepted
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+            matched = next((
+                tag for tag in ((coded_etag(etag, encoding), etag) if encoding else (etag,))
+                if request.if_none_match.contains(tag)
+            ), None)
+            if matched:
+                response = app.response_class(status=304)
+                response.set_etag(matched)
+            else:
+                if flush_journal and journal.flush():
+                    # The flush moved the change sequence on
+                    etag = current_etag()
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+            # Let browsers keep the body but revalidate on every request
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def request_route():
+    """Route pattern of the current request, used as the metrics label"""
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_token = METRICS.begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        METRICS.end_request(token, request.method, request_route(), response.status_code)
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(exc):
+    # after_request is skipped when a handler raises instead of returning a 500
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        METRICS.end_request(token, request.method, request_route(), 500)
+
+@app.after_request
+def compress_json_response(response):
+    """gzip/brotli-encode JSON bodies of at least MIN_COMPRESS_SIZE bytes (and all streamed JSON)"""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not is_json_mimetype(response.mimetype)):
+        return response
+    if response.is_streamed:
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.response = compress_stream(response.response, encoding)
+            response.headers['Content-Encoding'] = encoding
+            set_coded_etag(response, encoding)
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        set_coded_etag(response, encoding)
+    return response
+
+def set_coded_etag(response, encoding):
+    """Give a compressed body its own entity tag (it differs byte for byte from the identity body)"""
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(coded_etag(etag, encoding), weak=weak)
+
+def send_static(filename):
+    """Static files, from a precompressed .br/.gz sibling when the client accepts one"""
+    if not is_precompressible(filename):
+        return app.send_static_file(filename)
+    for encoding in accepted_encodings(request.headers.get('Accept-Encoding')):
+        try:
+            response = send_from_directory(
+                app.static_folder, filename + ENCODING_SUFFIXES[encoding],
+                mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                max_age=app.get_send_file_max_age(filename)
+            )
+        except NotFound:
+            continue
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+    response = app.send_static_file(filename)
+    response.vary.add('Accept-Encoding')
+    return response
+
+# Precompressed siblings are (re)written for new or changed assets only
+precompress_tree(app.static_folder)
+app.view_functions['static'] = send_static
+
+@app.route('/metrics')
+def metrics():
+    """Request latency and store I/O counters in Prometheus text format"""
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/')
 def index():
@@ -44,20 +311,26 @@ def study(deck_id):
     return render_template('study.html', deck_id=deck_id)
 
 @app.route('/api/decks', methods=['GET'])
+@conditional_get(time_dependent=True, flush_journal=True)
 def get_decks():
     """Get all decks"""
     try:
         decks = store.get_decks()
+        # Counts for all decks from a single pass over the store
+        overview = store.get_deck_overview()
         result = []
         for deck_id, deck in decks.items():
-            cards = store.get_cards(deck_id=deck_id)
-            due_cards = store.get_due_cards(deck_id=deck_id)
+            counts = overview.get(deck_id, {})
             result.append({
                 'id': deck.id,
                 'name': deck.name,
                 'description': deck.description,
-                'total_cards': len(cards),
-                'due_cards': len(due_cards),
+                'parent_deck_id': deck.parent_deck_id,
+                'total_cards': counts.get('total', 0),
+                'due_cards': counts.get('due', 0),
+                'new_cards': counts.get('new', 0),
+                'learning_cards': counts.get('learning', 0) + counts.get('relearning', 0),
+                'review_cards': counts.get('review', 0),
                 'created_at': deck.created_at.isoformat(),
                 'updated_at': deck.updated_at.isoformat()
             })
@@ -73,22 +346,28 @@ def create_deck():
         data = request.json
         deck_name = data.get('name', '').strip()
         description = data.get('description', '').strip()
+        parent_deck_id = data.get('parent_deck_id') or None
         
         if not deck_name:
             return jsonify({'success': False, 'error': 'Deck name is required'}), 400
         
-        deck_id = str(len(store.get_decks()) + 1)  # Simple ID generation
+        if parent_deck_id and not store.get_deck(parent_deck_id):
+            return jsonify({'success': False, 'error': 'Parent deck not found'}), 404
+        
+        deck_id = store.new_id()
         deck = Deck(
             id=deck_id,
             name=deck_name,
-            description=description
+            description=description,
+            parent_deck_id=parent_deck_id
         )
         store.save_deck(deck)
         
         return jsonify({'success': True, 'deck': {
             'id': deck.id,
             'name': deck.name,
-            'description': deck.description
+            'description': deck.description,
+            'parent_deck_id': deck.parent_deck_id
         }})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -97,86 +376,307 @@ def create_deck():
 def delete_deck(deck_id):
     """Delete a deck"""
     try:
+        # Apply pending answers first so they cannot resurrect deleted cards
+        journal.flush()
         store.delete_deck(deck_id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/decks/<deck_id>/cards', methods=['GET'])
+@conditional_get(flush_journal=True)
 def get_deck_cards(deck_id):
-    """Get all cards in a deck"""
+    """
+    Get all cards in a deck
+    
+    Streamed as {"success": true, "cards": [...]}, or one card per line with
+    ?format=ndjson, so the first cards arrive before the deck is serialized.
+    """
     try:
-        notes = store.get_notes(deck_id=deck_id)
-        cards = store.get_cards(deck_id=deck_id)
+        models = store.get_models()
         
-        result = []
-        for note in notes.values():
-            note_cards = [c for c in cards.values() if c.note_id == note.id]
-            for card in note_cards:
-                result.append({
+        def card_rows():
+            for note, card in store.iter_deck_cards([deck_id]):
+                front, back = card_sides(card, note, models)
+                yield {
                     'id': card.id,
                     'note_id': card.note_id,
-                    'front': note.fields.get('Front', ''),
-                    'back': note.fields.get('Back', ''),
+                    'front': front,
+                    'back': back,
                     'state': card.state,
                     'due': card.due.isoformat() if card.due else None,
                     'reps': card.reps,
                     'lapses': card.lapses
-                })
+                }
         
-        return jsonify({'success': True, 'cards': result})
+        if wants_ndjson():
+            return stream_ndjson(card_rows())
+        return stream_json_list('cards', card_rows())
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/decks/<deck_id>/study/start', methods=['POST'])
-def start_study_session(deck_id):
-    """Start a study session for a deck"""
+@app.route('/api/decks/<deck_id>/export.ndjson', methods=['GET'])
+def export_deck_ndjson(deck_id):
+    """
+    Stream a full deck export (decks, models, notes, cards, reviews) as NDJSON
+    
+    Each line is {"kind", "id", "data"} with the entity's stored data, the
+    same shape /api/sync exchanges, so an export can be replayed into a store.
+    """
     try:
-        # Check if deck exists
         deck = store.get_deck(deck_id)
         if not deck:
             return jsonify({'success': False, 'error': 'Deck not found'}), 404
         
-        # Create a new study session
-        session_id = f"{deck_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        study_session = StudySession(store, deck_id=deck_id)
+        include_subdecks = request.args.get('subdecks', '1') != '0'
+        deck_ids = store.get_deck_subtree(deck_id) if include_subdecks else [deck_id]
+        journal.flush()
+        
+        rows = (
+            {'kind': kind, 'id': data.get('id'), 'data': data}
+            for kind, data in store.iter_deck_entities(deck_ids)
+        )
+        response = stream_ndjson(rows)
+        response.headers.set('Content-Disposition', 'attachment', filename=f"{deck.name}.ndjson")
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/decks/<deck_id>/cloze', methods=['POST'])
+def add_cloze_notes_to_deck(deck_id):
+    """
+    Add cloze notes to a deck, one card per {{cN::...}} deletion
+    
+    Body: {"text": "one cloze sentence per line"} or
+          {"notes": [{"text": "...", "back_extra": "..."}, ...]}, plus optional "tags"
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        deck = store.get_deck(deck_id)
+        if not deck:
+            return jsonify({'success': False, 'error': 'Deck not found'}), 404
+        
+        try:
+            tags = request_tags(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        if isinstance(data.get('notes'), list):
+            items = [
+                (str(item.get('text', '')), str(item.get('back_extra', '')))
+                if isinstance(item, dict) else str(item)
+                for item in data['notes']
+            ]
+        else:
+            items = parse_cloze_text(str(data.get('text', '')))
+        
+        if not items:
+            return jsonify({'success': False, 'error': 'No cloze notes found'}), 400
+        
+        result = add_cloze_notes(store, deck_id, items, tags=tags)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/decks/<deck_id>/cards/bulk', methods=['POST'])
+def add_cards_bulk(deck_id):
+    """
+    Add many question/answer cards to a deck in one transaction
+    
+    Body: {"cards": [{"front": "...", "back": "..."}, ...]} (or [question, answer]
+          pairs), or {"text": "Question: ...\nAnswer: ..."} as produced by the
+          flashcard generator, plus optional "tags"
+    Questions already in the deck are reported as duplicates and skipped.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
         
-        # Start the session (limit to 50 cards max, 20 new cards max)
-        started = study_session.start(limit=50, new_limit=20)
+        deck = store.get_deck(deck_id)
+        if not deck:
+            return jsonify({'success': False, 'error': 'Deck not found'}), 404
         
-        if not started:
-            return jsonify({'success': False, 'error': 'No cards to study'}), 400
+        try:
+            tags = request_tags(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Store session in memory (in a real app, you'd use Redis or DB)
-        if 'study_sessions' not in session:
-            session['study_sessions'] = {}
-        session['study_sessions'][session_id] = study_session
+        if isinstance(data.get('cards'), list):
+            items = data['cards']
+        else:
+            items = parse_qa_text(str(data.get('text', '')))
         
-        # Get first card
-        current = study_session.get_current_card()
-        if not current:
-            return jsonify({'success': False, 'error': 'No cards available'}), 400
+        if not items:
+            return jsonify({'success': False, 'error': 'No cards found'}), 400
         
-        card, note = current
-        progress = study_session.get_progress()
+        result = add_basic_notes(store, deck_id, items, tags=tags)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/import/apkg', methods=['POST'])
+def import_anki_package():
+    """Import an uploaded Anki .apkg file (multipart field "file")"""
+    try:
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+        
+        parent_deck_id = request.form.get('parent_deck_id') or None
+        if parent_deck_id and not store.get_deck(parent_deck_id):
+            return jsonify({'success': False, 'error': 'Deck not found'}), 404
+        
+        # Spool the upload to disk; the importer streams from the zip file
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'upload.apkg')
+            upload.save(path)
+            journal.flush()
+            counts = import_apkg(store, path, parent_deck_id=parent_deck_id)
+        
+        return jsonify({'success': True, 'imported': counts})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/decks/<deck_id>/export.apkg', methods=['GET'])
+def export_anki_package(deck_id):
+    """Download a deck (with subdecks, scheduling state, history and media) as an .apkg"""
+    try:
+        deck = store.get_deck(deck_id)
+        if not deck:
+            return jsonify({'success': False, 'error': 'Deck not found'}), 404
+        
+        include_subdecks = request.args.get('subdecks', '1') != '0'
+        journal.flush()
+        
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'deck.apkg')
+            export_apkg(store, deck_id, path, include_subdecks=include_subdecks)
+            response = send_file(path, as_attachment=True, download_name=f"{deck.name}.apkg")
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        
+        # The file is removed once the download has been sent
+        response.call_on_close(lambda: shutil.rmtree(tmp_dir, ignore_errors=True))
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sync', methods=['POST'])
+def sync_changes():
+    """
+    Exchange changes with another Akson store
+    
+    Body: {"peer_id": "...", "since": <last server seq the peer saw>, "changes": [...]}
+    Returns the server's changes since `since` (minus the peer's own) and the new seq.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        peer_id = str(data.get('peer_id') or '')
+        if not peer_id:
+            return jsonify({'success': False, 'error': 'peer_id is required'}), 400
+        
+        changes = data.get('changes') or []
+        if not isinstance(changes, list):
+            return jsonify({'success': False, 'error': 'changes must be a list'}), 400
+        
+        # Pending answers must be in the store (and its change log) first
+        journal.flush()
+        applied = apply_changes(store, changes, origin=peer_id)
+        outgoing = get_changes_since(
+            store, int(data.get('since') or 0), exclude_origin=peer_id, limit=SYNC_BATCH_SIZE
+        )
         
         return jsonify({
             'success': True,
-            'session_id': session_id,
-            'card': {
-                'id': card.id,
-                'front': note.fields.get('Front', ''),
-                'back': note.fields.get('Back', ''),
-                'state': card.state
-            },
-            'progress': {
-                'current': progress[0],
-                'total': progress[1]
-            }
+            'server_id': get_peer_id(store),
+            'applied': applied,
+            **outgoing
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/media/<path:filename>')
+def media_file(filename):
+    """Serve images and other media referenced by note fields"""
+    return send_from_directory(store.media_dir, filename)
+
+def _begin_study_session(study_session):
+    """Start a study session, register it and build the first-card response"""
+    # Start the session (sized by each deck's daily new/review limits)
+    started = study_session.start()
+    
+    if not started:
+        return jsonify({'success': False, 'error': 'No cards to study'}), 400
+    
+    session_id = study_sessions.new_session_id()
+    study_sessions.put(session_id, study_session)
+    
+    # Get first card
+    payload = study_session.get_current_payload()
+    if not payload:
+        return jsonify({'success': False, 'error': 'No cards available'}), 400
+    
+    progress = study_session.get_progress()
+    
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'card': payload,
+        'progress': {
+            'current': progress[0],
+            'total': progress[1]
+        }
+    })
+
+@app.route('/api/decks/<deck_id>/study/start', methods=['POST'])
+def start_study_session(deck_id):
+    """Start a study session for a deck (optionally including its subdecks)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        # Check if deck exists
+        deck = store.get_deck(deck_id)
+        if not deck:
+            return jsonify({'success': False, 'error': 'Deck not found'}), 404
+        
+        study_session = StudySession(
+            store,
+            deck_id=deck_id,
+            journal=journal,
+            include_subdecks=bool(data.get('include_subdecks', False)),
+            maintenance=maintenance,
+            skip_leeches=bool(data.get('skip_leeches', False))
+        )
+        return _begin_study_session(study_session)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/study/start', methods=['POST'])
+def start_multi_deck_study_session():
+    """Start one study session over several decks (merged by due date)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        deck_ids = data.get('deck_ids') or []
+        
+        if not isinstance(deck_ids, list) or not deck_ids:
+            return jsonify({'success': False, 'error': 'deck_ids must be a non-empty list'}), 400
+        
+        study_session = StudySession(
+            store,
+            journal=journal,
+            deck_ids=[str(deck_id) for deck_id in deck_ids],
+            include_subdecks=bool(data.get('include_subdecks', False)),
+            maintenance=maintenance,
+            skip_leeches=bool(data.get('skip_leeches', False))
+        )
+        return _begin_study_session(study_session)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/study/<session_id>/answer', methods=['POST'])
 def answer_card(session_id):
     """Answer a card in study session"""
@@ -188,19 +688,17 @@ def answer_card(session_id):
             return jsonify({'success': False, 'error': 'Rating must be 1, 2, 3, or 4'}), 400
         
         # Get the study session
-        if 'study_sessions' not in session or session_id not in session['study_sessions']:
+        study_session = study_sessions.get(session_id)
+        if not study_session:
             return jsonify({'success': False, 'error': 'Session not found'}), 404
         
-        study_session = session['study_sessions'][session_id]
-        
         # Answer the current card
         result = study_session.answer_card(rating)
+        study_sessions.update(session_id)
         
         if not result:
-            # Session complete
-            if session_id in session['study_sessions']:
-                del session['study_sessions'][session_id]
-            
+            # Session complete (kept registered until evicted so the
+            # last answer can still be undone)
             stats = study_session.get_stats()
             return jsonify({
                 'success': True,
@@ -209,18 +707,69 @@ def answer_card(session_id):
             })
         
         # Get next card
-        card, note = result
         progress = study_session.get_progress()
         
         return jsonify({
             'success': True,
             'complete': False,
-            'card': {
-                'id': card.id,
-                'front': note.fields.get('Front', ''),
-                'back': note.fields.get('Back', ''),
-                'state': card.state
+            'session_id': session_id,
+            'card': study_session.get_current_payload(),
+            'progress': {
+                'current': progress[0],
+                'total': progress[1]
             },
+            'stats': study_session.get_stats()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/study/batch', methods=['POST'])
+def answer_batch():
+    """
+    Apply answers recorded offline or in a burst, in one store transaction
+    
+    Body: {"answers": [{"card_id": "...", "rating": 3, "response_time_ms": 4200,
+           "answered_at": "2024-05-01T09:30:00Z", "id": "client-answer-id"}, ...]}
+    Answers are applied in order, scheduled from their answered_at times.
+    Resending an answer with the same "id" is reported as a duplicate.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        answers = data.get('answers')
+        if not isinstance(answers, list) or not all(isinstance(a, dict) for a in answers):
+            return jsonify({'success': False, 'error': 'answers must be a list of objects'}), 400
+        
+        result = apply_answer_batch(store, answers, journal=journal)
+        # Open sessions must not answer these cards from their stale copies
+        study_sessions.refresh_cards(result['cards'].keys())
+        return jsonify({
+            'success': True,
+            'applied': sum(1 for r in result['results'] if r['status'] == 'applied'),
+            'results': result['results'],
+            'cards': result['cards']
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/study/<session_id>/undo', methods=['POST'])
+def undo_answer(session_id):
+    """Undo the last answer in a study session"""
+    try:
+        study_session = study_sessions.get(session_id)
+        if not study_session:
+            return jsonify({'success': False, 'error': 'Session not found'}), 404
+        
+        if not study_session.undo():
+            return jsonify({'success': False, 'error': 'Nothing to undo'}), 400
+        study_sessions.update(session_id)
+        
+        progress = study_session.get_progress()
+        
+        return jsonify({
+            'success': True,
+            'complete': False,
+            'session_id': session_id,
+            'card': study_session.get_current_payload(),
             'progress': {
                 'current': progress[0],
                 'total': progress[1]
@@ -230,6 +779,52 @@ def answer_card(session_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/stats', methods=['GET'])
+@conditional_get(time_dependent=True, flush_journal=True)
+def get_stats():
+    """Review statistics: daily totals, heatmap, retention and forecast"""
+    try:
+        days = max(1, min(request.args.get('days', 30, type=int), 365))
+        deck_id = request.args.get('deck_id')
+        
+        deck_ids = None
+        if deck_id:
+            if not store.get_deck(deck_id):
+                return jsonify({'success': False, 'error': 'Deck not found'}), 404
+            deck_ids = store.get_deck_subtree(deck_id)
+        
+        return jsonify({'success': True, 'stats': analytics.summary(days, deck_ids)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/leeches', methods=['GET'])
+@conditional_get(flush_journal=True)
+def get_leeches():
+    """Cards flagged as leeches (lapsed at least the threshold number of times)"""
+    try:
+        maintenance.run()
+        leeches = maintenance.get_leeches()
+        cards = store.get_cards_by_ids(leeches.keys())
+        notes = store.get_notes_by_ids({card.note_id for card in cards.values()})
+        models = store.get_models()
+        
+        result = []
+        for card_id, lapses in leeches.items():
+            card = cards.get(card_id)
+            note = notes.get(card.note_id) if card else None
+            if not note:
+                continue
+            result.append({
+                'card_id': card_id,
+                'note_id': note.id,
+                'deck_id': note.deck_id,
+                'front': card_sides(card, note, models)[0],
+                'lapses': lapses
+            })
+        return jsonify({'success': True, 'leeches': result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/cards', methods=['POST'])
 def add_card():
     """Add a new card to a deck"""
@@ -257,7 +852,7 @@ def add_card():
             return jsonify({'success': False, 'error': 'No note model available'}), 500
         
         # Create note
-        note_id = f"note_{len(store.get_notes()) + 1}"
+        note_id = store.new_id("note_")
         note = Note(
             id=note_id,
             deck_id=deck_id,
@@ -270,7 +865,7 @@ def add_card():
         store.save_note(note)
         
         # Create card
-        card_id = f"card_{len(store.get_cards()) + 1}"
+        card_id = store.new_id("card_")
         template_id = model.templates[0]["id"] if model.templates else "basic-1"
         card = Card(
             id=card_id,
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Benchmark GET /api/decks as the number of decks grows.
+
+Builds throwaway stores holding the same number of cards, spread over more
+and more decks. For each store it times the old per-deck loop (get_cards and
+get_due_cards per deck) and the single-pass overview behind /api/decks.
+
+    python web_app/benchmark_decks.py --cards 20000 --decks 10 40 160
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from akson_cards.models import Card, Deck, Note
+from akson_cards.store import AksonCardsStore
+
+
+def build_store(data_dir: Path, deck_count: int, card_count: int) -> AksonCardsStore:
+    store = AksonCardsStore(data_dir)
+    rng = random.Random(deck_count)
+    now = datetime.now()
+
+    decks = [Deck(id=store.new_id(), name=f"Deck {i}") for i in range(deck_count)]
+    store.save_decks(decks)
+
+    notes = []
+    cards = []
+    for i in range(card_count):
+        note = Note(
+            id=store.new_id(),
+            deck_id=decks[i % deck_count].id,
+            model_id="basic",
+            fields={"Front": f"Question {i}", "Back": f"Answer {i}"}
+        )
+        state = rng.choice(["new", "learning", "review", "review", "relearning"])
+        due = None if state == "new" else now + timedelta(days=rng.randint(-10, 30))
+        notes.append(note)
+        cards.append(Card(id=store.new_id(), note_id=note.id, template_id="basic-1", state=state, due=due))
+    store.add_notes(notes, cards)
+    return store
+
+
+def per_deck_loop(store: AksonCardsStore) -> dict:
+    """The endpoint before the overview: two collection scans per deck"""
+    return {
+        deck_id: (len(store.get_cards(deck_id=deck_id)), len(store.get_due_cards(deck_id=deck_id)))
+        for deck_id in store.get_decks()
+    }
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=10000, help="cards per store")
+    parser.add_argument("--decks", type=int, nargs="+", default=[5, 20, 80, 320], help="deck counts to try")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is reported)")
+    parser.add_argument("--skip-loop", action="store_true", help="only time the overview")
+    args = parser.parse_args()
+
+    print(f"{'decks':>6} {'cards':>8} {'overview ms':>12} {'per-deck ms':>12}")
+    for deck_count in args.decks:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = build_store(Path(tmp), deck_count, args.cards)
+            overview_ms = best_of(store.get_deck_overview, args.repeat)
+            loop_ms = "-" if args.skip_loop else f"{best_of(lambda: per_deck_loop(store), 1):.1f}"
+            print(f"{deck_count:>6} {args.cards:>8} {overview_ms:>12.1f} {loop_ms:>12}")
+
+
+if __name__ == "__main__":
+    main()
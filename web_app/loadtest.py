@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Load test the production (gunicorn + SQLite store) deployment.
+
+For each worker count, seeds a throwaway data directory and starts
+`gunicorn wsgi:application` on it. It then drives the server from client
+threads for a fixed time and prints requests/sec. The request mix is deck
+overviews, card listings and study answers, so reads and writes from
+different workers hit the shared store.
+
+    python web_app/loadtest.py --workers 1 2 4 --clients 16 --duration 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+WEB_APP_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(WEB_APP_DIR.parent))
+sys.path.insert(0, str(WEB_APP_DIR))
+
+from akson_cards.sqlite_store import SQLiteStore
+from benchmark_decks import build_store
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(base: str, path: str, payload: dict | None = None) -> dict:
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(
+        base + path, data=data, headers={"Content-Type": "application/json"},
+        method="POST" if payload is not None else "GET"
+    )
+    with urllib.request.urlopen(req, timeout=30) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def wait_until_up(base: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            request(base, "/api/decks")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def client(base: str, deck_ids: list, stop: threading.Event, counts: list, answer_ratio: float) -> None:
+    rng = random.Random()
+    session_id = None
+    while not stop.is_set():
+        try:
+            roll = rng.random()
+            if roll < answer_ratio:
+                if session_id is None:
+                    session_id = request(base, f"/api/decks/{rng.choice(deck_ids)}/study/start", {})["session_id"]
+                result = request(base, f"/api/study/{session_id}/answer", {"rating": rng.choice([2, 3, 3, 4])})
+                if result.get("complete") or not result.get("success"):
+                    session_id = None
+            elif roll < answer_ratio + 0.2:
+                request(base, f"/api/decks/{rng.choice(deck_ids)}/cards")
+            else:
+                request(base, "/api/decks")
+            counts[0] += 1
+        except OSError:
+            counts[1] += 1
+
+
+def run(workers: int, args) -> float:
+    with tempfile.TemporaryDirectory() as data_dir:
+        build_store(Path(data_dir), args.decks, args.cards)
+        SQLiteStore(Path(data_dir))  # import the JSON documents once, before the workers race
+        deck_ids = list(SQLiteStore(Path(data_dir)).get_decks())
+
+        port = free_port()
+        env = dict(os.environ, AKSON_DATA_DIR=data_dir, AKSON_STORE="sqlite")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(args.threads),
+             "-b", f"127.0.0.1:{port}", "--log-level", "warning", "wsgi:application"],
+            cwd=WEB_APP_DIR, env=env
+        )
+        base = f"http://127.0.0.1:{port}"
+        try:
+            wait_until_up(base)
+            stop = threading.Event()
+            per_client = [[0, 0] for _ in range(args.clients)]
+            threads = [
+                threading.Thread(target=client, args=(base, deck_ids, stop, counts, args.answer_ratio))
+                for counts in per_client
+            ]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(args.duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+
+    done = sum(counts[0] for counts in per_client)
+    errors = sum(counts[1] for counts in per_client)
+    rate = done / elapsed
+    print(f"{workers:>7} {done:>9} {errors:>7} {rate:>9.1f}")
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="gunicorn worker counts to try")
+    parser.add_argument("--threads", type=int, default=2, help="threads per worker")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent client threads")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--decks", type=int, default=20, help="decks in the seeded store")
+    parser.add_argument("--cards", type=int, default=5000, help="cards in the seeded store")
+    parser.add_argument("--answer-ratio", type=float, default=0.2, help="share of requests that answer a card")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'requests':>9} {'errors':>7} {'req/s':>9}  (cpus: {os.cpu_count()})")
+    for workers in args.workers:
+        run(workers, args)
+
+
+if __name__ == "__main__":
+    main()
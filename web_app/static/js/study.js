@@ -9,6 +9,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // Event listeners for buttons
     document.getElementById('flip-card-btn').addEventListener('click', flipCard);
     document.getElementById('end-session-btn').addEventListener('click', endSession);
+    document.getElementById('undo-btn').addEventListener('click', undoAnswer);
     
     // Rating buttons
     document.querySelectorAll('.btn-rating').forEach(button => {
@@ -54,6 +55,18 @@ function displayCard(card) {
     // Initially show only the front of the card
     cardContent.innerHTML = `<div class="card-front">${card.front}</div>`;
     
+    // Label rating buttons with the interval each rating would schedule
+    const previews = card.previews || {};
+    document.querySelectorAll('.btn-rating').forEach(button => {
+        if (!button.dataset.label) {
+            button.dataset.label = button.textContent.replace(/\s*\(.*\)$/, '');
+        }
+        const preview = previews[button.getAttribute('data-rating')];
+        button.textContent = preview
+            ? `${button.dataset.label} (${preview.interval})`
+            : `${button.dataset.label} (${button.getAttribute('data-rating')})`;
+    });
+    
     // Reset card state
     isCardFlipped = false;
     document.getElementById('flip-card-btn').textContent = 'Show Answer';
@@ -68,8 +81,9 @@ function flipCard() {
     
     if (!isCardFlipped) {
         // Show the back of the card
+        // Cloze cards reveal their deletions in the front on the answer side
         cardContent.innerHTML = `
-            <div class="card-front">${card.front}</div>
+            <div class="card-front">${card.front_revealed || card.front}</div>
             <div class="card-divider"></div>
             <div class="card-back">${card.back}</div>
         `;
@@ -105,7 +119,9 @@ function answerCard(rating) {
     .then(data => {
         if (data.success) {
             if (data.complete) {
-                // Session is complete
+                // Session is complete (keep the session ID for undo)
+                data.session_id = currentSession.session_id;
+                currentSession = data;
                 showSessionComplete(data.stats);
             } else {
                 // Move to next card
@@ -136,6 +152,35 @@ function answerCard(rating) {
     });
 }
 
+function undoAnswer() {
+    if (!currentSession) return;
+    
+    fetch(`/api/study/${currentSession.session_id}/undo`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            currentSession = data;
+            document.getElementById('flip-card-btn').style.display = '';
+            displayCard(data.card);
+            updateProgress(data.progress);
+            document.querySelectorAll('.btn-rating').forEach(btn => {
+                btn.disabled = false;
+            });
+        } else {
+            alert('Cannot undo: ' + (data.error || 'Unknown error'));
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('Error undoing answer: ' + error.message);
+    });
+}
+
 function updateProgress(progress) {
     const percent = progress.total > 0 ? (progress.current / progress.total) * 100 : 0;
     document.getElementById('progress-fill').style.width = `${percent}%`;
@@ -0,0 +1,19 @@
+"""
+Production WSGI entry point for the Akson web app
+
+Runs the Flask app on the SQLite store, which several worker processes can
+share safely (the default JSON store is single-process only):
+
+    cd web_app
+    AKSON_DATA_DIR=/var/lib/akson gunicorn -w 4 --threads 4 -b 0.0.0.0:8000 wsgi:application
+
+Each worker opens the database itself; do not use gunicorn's --preload, which
+would start the answer journal thread in the master before forking.
+"""
+import os
+
+os.environ.setdefault('AKSON_STORE', 'sqlite')
+
+from app import app as application  # noqa: E402
+
+app = application